@@ -1,15 +1,48 @@
+import time
+SCRIPT_STARTED = time.perf_counter()
+
 import streamlit as st
-import pandas as pd
+import numpy as np
 import datetime
-from datetime import timedelta
 import calendar
-import json
-import plotly.express as px
-import plotly.graph_objects as go
-import os
+import hashlib
+import io
 import sys
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
 
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+from sonatrach_auth import UserStore
+from sonatrach_backup import backup_file_name, read_backup, write_backup
+from sonatrach_calendar import count_work_on
+from sonatrach_core import (
+    build_day_state, calculate_interval_statistics, count_day_range, day_state_statistics, DayRollup, DayState,
+    normalize_history, paint_day_range, parse_rotation, project_rotations, resolve_days, slice_days,
+)
+from sonatrach_crew import build_crew_frame, coverage_gaps, crew_balances, crew_occupancy, crew_source_version, load_crew
+from sonatrach_history import ChangeHistory, apply_records, audit_path, statistics_at
+from sonatrach_import import import_schedule
+from sonatrach_periods import PeriodIndex
+from sonatrach_profiling import IMPORT_TIMES, NULL_PROFILER, REGISTRY, RerunProfiler, lazy_import, record_import_time
+from sonatrach_reports import REPORT_FORMATS, ReportWorker, report_file_name, report_key, statement_period
+from sonatrach_rules import DEFAULT_RULES, RulesError, load_rules, rules_file_version
+from sonatrach_storage import (
+    BackgroundWriter, CorruptDataError, open_storage, parse_sick_period, parse_work_period, period_record, settings_record,
+)
+from sonatrach_views import (
+    create_analytics_charts, create_crew_charts, create_monthly_charts, create_projection_chart, projected_index,
+    render_month_table, render_year_table,
+)
+
+# pandas and plotly are imported lazily by the sections that use them; this is
+# what the imports above cost, paid only by the first run in a process
+record_import_time('sonatrach_app', time.perf_counter() - SCRIPT_STARTED)
+
 # Page configuration
 st.set_page_config(
     page_title="نظام متابعة أيام العمل - سوناطراك",
@@ -64,6 +97,17 @@ st.markdown("""
     .day-w { background-color: #2E86AB; color: white; border-radius: 3px; }
     .day-v { background-color: #A8D5BA; color: black; border-radius: 3px; }
     .day-s { background-color: #F9DC5C; color: black; border-radius: 3px; }
+    .day-projected { opacity: 0.55; outline: 2px dashed #2E86AB; outline-offset: -3px; }
+    .day-weekend { color: #8a4b08; font-style: italic; }
+    .day-holiday { box-shadow: inset 0 0 0 2px #E74C3C; }
+    .day-holiday-worked { background-image: linear-gradient(135deg, #E74C3C 0 12px, transparent 12px); }
+    .holiday-worked {
+        background: #fdecea;
+        border-right: 4px solid #E74C3C;
+        border-radius: 8px;
+        padding: 0.6rem 1rem;
+        margin-top: 0.8rem;
+    }
     .sidebar .sidebar-content {
         background: linear-gradient(180deg, #f8f9fa 0%, #e9ecef 100%);
     }
@@ -104,95 +148,328 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Functions to save/load data
-def get_data_path():
-    """Get the path for data file that works in EXE and normal mode"""
+def get_app_dir():
+    """Get the folder holding data and config files that works in EXE and normal mode"""
     if getattr(sys, 'frozen', False):
         # Running as EXE
-        return Path(sys.executable).parent / 'sonatrach_data.json'
+        return Path(sys.executable).parent
     else:
         # Running as script
-        return Path(__file__).parent / 'sonatrach_data.json'
-
-def save_data():
-    """Save data to session state and JSON file"""
-    data = {
-        'contract_start': st.session_state.contract_start.isoformat() if st.session_state.contract_start else None,
-        'initial_balance': st.session_state.initial_balance,
-        'work_periods': [(start.isoformat(), end.isoformat(), location) for start, end, location in st.session_state.work_periods],
-        'sick_periods': [(start.isoformat(), end.isoformat()) for start, end in st.session_state.sick_periods]
-    }
+        return Path(__file__).parent
+
+def get_data_path():
+    """Get the path for data file that works in EXE and normal mode
+
+    In multi-user mode each user has their own file under users/; SQLite
+    keeps users apart in its one shared database instead.
+    """
+    if MULTI_USER and STORAGE_CONFIG.get('mode') != 'sqlite':
+        users_dir = get_app_dir() / 'users'
+        users_dir.mkdir(exist_ok=True)
+        return users_dir / f'{get_employee()}.json'
+    return get_app_dir() / 'sonatrach_data.json'
+
+def load_config():
+    """Load app settings from config.toml, empty if missing or invalid"""
+    try:
+        with open(get_app_dir() / 'config.toml', 'rb') as f:
+            return tomllib.load(f)
+    except (FileNotFoundError, tomllib.TOMLDecodeError):
+        return {}
+
+APP_CONFIG = load_config()
+# [storage] mode: 'file' rewrites the data file on every change, 'journal'
+# appends one line per change, 'sqlite' keeps a whole crew in one database;
+# autosave: save in the background, at most once per autosave_interval seconds
+STORAGE_CONFIG = APP_CONFIG.get('storage', {})
+# [auth] mode: 'none' for one user per server, 'login' for multi-user mode
+# where everyone signs in and only sees their own data
+AUTH_CONFIG = APP_CONFIG.get('auth', {})
+MULTI_USER = AUTH_CONFIG.get('mode', 'none') == 'login'
+
+def get_employee():
+    """Employee whose data this session shows: the signed-in user, else the ?employee= query param or config"""
+    if MULTI_USER:
+        return st.session_state.user
+    return st.query_params.get('employee', STORAGE_CONFIG.get('employee', 'default'))
+
+def get_user_store():
+    """User accounts for multi-user mode"""
+    return UserStore(get_app_dir() / AUTH_CONFIG.get('users_file', 'sonatrach_users.json'))
+
+def get_storage():
+    """Get this session's storage backend"""
+    if 'storage' not in st.session_state:
+        st.session_state.storage = open_storage(STORAGE_CONFIG, get_data_path(), get_employee())
+    return st.session_state.storage
+
+def storage_key():
+    """Key of this session's data for the background writer"""
+    return f'{get_data_path()}#{get_employee()}'
+
+@st.cache_resource
+def get_autosave():
+    """Background writer shared by every session of the server process"""
+    return BackgroundWriter(STORAGE_CONFIG.get('autosave_interval', 2.0))
+
+@st.cache_resource
+def get_report_worker():
+    """Report worker shared by every session of the server process"""
+    return ReportWorker(REPORTS_CONFIG.get('workers', 2))
+
+# [profiling] enabled: time each stage of the script and show the timings in
+# the sidebar (or per session with ?profile=1); export: optional .jsonl or
+# Prometheus text file the timings are written to
+PROFILING_CONFIG = APP_CONFIG.get('profiling', {})
+# [analytics] show: whether the charts are shown when the page opens
+ANALYTICS_CONFIG = APP_CONFIG.get('analytics', {})
+# [backup] compression: 'gzip', 'zstd' or 'none' for exported backups
+BACKUP_CONFIG = APP_CONFIG.get('backup', {})
+# [crew] supervisors: users who may open the crew dashboard in multi-user mode
+CREW_CONFIG = APP_CONFIG.get('crew', {})
+# [rules] file: leave rules (day weights, holidays, location rules) next to config.toml
+RULES_CONFIG = APP_CONFIG.get('rules', {})
+# [calendar] index: weekend/holiday flags per day for first_year to last_year,
+# memory-mapped at startup and rebuilt when the holidays change
+CALENDAR_CONFIG = APP_CONFIG.get('calendar', {})
+# [reports] workers: background threads generating statements for download
+REPORTS_CONFIG = APP_CONFIG.get('reports', {})
+
+def get_profiler():
+    """Get this session's stage profiler, a no-op one while profiling is off"""
+    if not (PROFILING_CONFIG.get('enabled', False) or st.query_params.get('profile') in ('1', 'true')):
+        return NULL_PROFILER
+    if 'profiler' not in st.session_state:
+        export_path = PROFILING_CONFIG.get('export') or None
+        if export_path:
+            export_path = get_app_dir() / export_path
+        st.session_state.profiler = RerunProfiler(uuid.uuid4().hex[:8], export_path=export_path)
+    return st.session_state.profiler
+
+def profile_stage(name):
+    """Time the enclosed block as a stage of this rerun when profiling is on"""
+    return get_profiler().stage(name)
+
+def save_data(record=None):
+    """Save data to session state and storage
+
+    record describes the change that was just made (see settings_record and
+    period_record) so the backend can store just that change; without it the
+    whole state is written. With autosave the write happens in the
+    background. Cached statistics are updated for the changed period's range
+    or invalidated.
+    """
+    if STORAGE_CONFIG.get('autosave', True):
+        get_autosave().submit(storage_key(), get_storage(), current_state(), record)
+    else:
+        get_storage().save(current_state(), record)
     
-    data_path = get_data_path()
-    with open(data_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False)
+    if record is not None and 'period' in record:
+        start_str, end_str = record['period'][:2]
+        update_statistics_cache(datetime.date.fromisoformat(start_str), datetime.date.fromisoformat(end_str))
+        update_period_indexes(record)
+    else:
+        invalidate_statistics_cache()
+        st.session_state.pop('period_indexes', None)
 
-def load_data():
-    """Load data from JSON file"""
-    data_path = get_data_path()
+def get_period_index(kind):
+    """Session index of 'work' or 'sick' periods for O(log n) overlap checks"""
+    indexes = st.session_state.setdefault('period_indexes', {})
+    if kind not in indexes:
+        periods = st.session_state.work_periods if kind == 'work' else st.session_state.sick_periods
+        # Older histories may already contain overlaps
+        indexes[kind] = PeriodIndex(periods, allow_overlap=True)
+    return indexes[kind]
+
+def update_period_indexes(record):
+    """Apply an add/delete period record to the session's period indexes"""
+    op, kind = record['op'].split('_')
+    index = st.session_state.get('period_indexes', {}).get(kind)
+    if index is None:
+        return
+    period = parse_work_period(record['period']) if kind == 'work' else parse_sick_period(record['period'])
+    if op == 'add':
+        index.add(period, merge_adjacent=False, allow_overlap=True)
+    else:
+        index.remove(period)
+
+def add_period(kind, period, merge_overlaps):
+    """Add a work or sick period unless it overlaps existing ones
+
+    With merge_overlaps, overlapping periods (at the same location for work)
+    are replaced by a single period covering them all. Returns whether the
+    period was saved and the overlapping periods found.
+    """
+    periods = st.session_state.work_periods if kind == 'work' else st.session_state.sick_periods
+    overlapping = get_period_index(kind).overlapping(period[0], period[1])
+    if overlapping and not (merge_overlaps and all(existing[2:] == period[2:] for existing in overlapping)):
+        return False, overlapping
     
+    for existing in overlapping:
+        index = periods.index(existing)
+        del periods[index]
+        save_data(period_record(f'delete_{kind}', existing, index=index))
+    if overlapping:
+        period = (min(period[0], *(existing[0] for existing in overlapping)),
+                  max(period[1], *(existing[1] for existing in overlapping)), *period[2:])
+    periods.append(period)
+    save_data(period_record(f'add_{kind}', period))
+    return True, overlapping
+
+@st.cache_resource
+def cached_change_history(path):
+    """Change log of a data file, shared by every session working on it"""
+    return ChangeHistory(path)
+
+def get_change_history():
+    """Undo/redo history and audit log of this session's data"""
+    if STORAGE_CONFIG.get('mode') == 'sqlite':
+        path = audit_path(get_app_dir() / STORAGE_CONFIG.get('database', 'sonatrach_data.db'), get_employee())
+    else:
+        path = audit_path(get_data_path())
+    return cached_change_history(str(path))
+
+@contextmanager
+def logged_change(label, before=None):
+    """Log the data changes made in the block as one undoable step of the audit log"""
+    before = before or current_state()
     try:
-        with open(data_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Load contract start date
-        contract_start = None
-        if data.get('contract_start'):
-            contract_start = datetime.date.fromisoformat(data['contract_start'])
-        
-        # Load initial balance
-        initial_balance = data.get('initial_balance', 0)
-        
-        # Load work periods
-        work_periods = []
-        for period in data.get('work_periods', []):
-            if len(period) == 3:  # With location
-                start_str, end_str, location = period
-                work_periods.append((datetime.date.fromisoformat(start_str), datetime.date.fromisoformat(end_str), location))
-            else:  # Old format
-                start_str, end_str = period
-                work_periods.append((datetime.date.fromisoformat(start_str), datetime.date.fromisoformat(end_str), ""))
-        
-        # Load sick periods
-        sick_periods = []
-        for start_str, end_str in data.get('sick_periods', []):
-            sick_periods.append((datetime.date.fromisoformat(start_str), datetime.date.fromisoformat(end_str)))
-        
-        return contract_start, initial_balance, work_periods, sick_periods
-    except FileNotFoundError:
+        yield
+    finally:
+        get_change_history().record(before, current_state(), label, get_employee())
+
+def apply_logged_change(change):
+    """Apply the records of a logged undo or redo to the session's data and save it"""
+    (st.session_state.contract_start, st.session_state.initial_balance,
+     st.session_state.work_periods, st.session_state.sick_periods) = apply_records(current_state(), change.records)
+    # Storage backends append periods, so only a lone append, deletion or
+    # settings change is saved as a record; putting periods back mid-list rewrites
+    record = change.records[0]
+    if len(change.records) == 1 and not (record['op'].startswith('add_') and 'index' in record):
+        save_data(record)
+    else:
+        save_data()
+
+def load_data():
+    """Load data from storage"""
+    try:
+        with profile_stage('load_data'):
+            # Another session may have changes for the same data still queued
+            if STORAGE_CONFIG.get('autosave', True):
+                get_autosave().flush(storage_key(), timeout=30)
+            return get_storage().load()
+    except CorruptDataError as e:
+        st.error(f"❌ ملف البيانات تالف وتم حفظه باسم {e.backup_path.name}: {str(e)}")
         return None, 0, [], []
 
+def current_state():
+    """The session's data as a (contract_start, initial_balance, work_periods, sick_periods) copy"""
+    return (
+        st.session_state.contract_start,
+        st.session_state.initial_balance,
+        list(st.session_state.work_periods),
+        list(st.session_state.sick_periods),
+    )
+
+def export_data(incremental):
+    """Stream a backup of the session's data, incremental since the last export when asked
+
+    Returns the backup bytes and header.
+    """
+    state = current_state()
+    buffer = io.BytesIO()
+    base_state = st.session_state.export_base if incremental else None
+    header = write_backup(buffer, state, base_state, BACKUP_CONFIG.get('compression', 'gzip'))
+    st.session_state.export_base = state
+    return buffer.getvalue(), header
+
 def import_data(uploaded_file):
-    """Import data from uploaded JSON file"""
+    """Import data from an uploaded backup; incremental backups apply to the current data
+
+    The backup is validated before anything is returned.
+    """
     try:
-        data = json.load(uploaded_file)
-        
-        # Load contract start date
-        contract_start = None
-        if data.get('contract_start'):
-            contract_start = datetime.date.fromisoformat(data['contract_start'])
-        
-        # Load initial balance
-        initial_balance = data.get('initial_balance', 0)
-        
-        # Load work periods
-        work_periods = []
-        for period in data.get('work_periods', []):
-            if len(period) == 3:  # With location
-                start_str, end_str, location = period
-                work_periods.append((datetime.date.fromisoformat(start_str), datetime.date.fromisoformat(end_str), location))
-            else:  # Old format
-                start_str, end_str = period
-                work_periods.append((datetime.date.fromisoformat(start_str), datetime.date.fromisoformat(end_str), ""))
-        
-        # Load sick periods
-        sick_periods = []
-        for start_str, end_str in data.get('sick_periods', []):
-            sick_periods.append((datetime.date.fromisoformat(start_str), datetime.date.fromisoformat(end_str)))
-        
-        return contract_start, initial_balance, work_periods, sick_periods
+        state, _ = read_backup(uploaded_file, current_state())
     except Exception as e:
         st.error(f"❌ خطأ في استيراد الملف: {str(e)}")
         return None, 0, [], []
+    st.session_state.export_base = state
+    return state
+
+def import_schedule_file(uploaded_file, employee):
+    """Merge a CSV/Excel rotation schedule into this session's periods and return a report"""
+    report = {'rows': 0, 'accepted': 0, 'periods': 0, 'errors': [], 'messages': []}
+    try:
+        result = import_schedule(
+            uploaded_file,
+            uploaded_file.name,
+            contract_start=st.session_state.contract_start,
+            employee=employee.strip() or None,
+            load_existing=lambda name: (
+                st.session_state.contract_start, st.session_state.work_periods, st.session_state.sick_periods),
+        )
+    except Exception as e:
+        report['messages'].append(f"خطأ في استيراد الملف: {str(e)}")
+        return report
+    
+    report.update(rows=result.rows, errors=result.errors)
+    if len(result.employees) > 1:
+        report['messages'].append("الملف يحتوي على عدة موظفين، أدخل رقم الموظف لاستيراد فتراتك فقط")
+        return report
+    
+    for work_periods, sick_periods in result.employees.values():
+        st.session_state.work_periods.extend(work_periods)
+        st.session_state.sick_periods.extend(sick_periods)
+        report['accepted'] = result.imported + result.merged
+        report['periods'] = len(work_periods) + len(sick_periods)
+    if report['periods']:
+        save_data()
+    return report
+
+def display_save_status():
+    """Show whether this session's changes are saved or still queued for the background writer"""
+    status = get_autosave().status_of(storage_key())
+    if status is None:
+        return
+    state, detail = status
+    if state == 'pending':
+        st.caption(f"⏳ جارٍ الحفظ ({detail} تغيير)")
+    elif state == 'saved':
+        st.caption(f"✅ تم الحفظ {detail:%H:%M:%S}")
+    else:
+        st.warning(f"⚠️ تعذر حفظ البيانات، ستتم إعادة المحاولة: {detail}")
+
+def display_login_form():
+    """Sign the session in from a ?token= link or the user name and password form"""
+    token = st.query_params.get('token')
+    if token:
+        user = get_user_store().user_for_token(token)
+        if user:
+            st.session_state.user = user
+            # Keep the token out of the address bar and browser history
+            del st.query_params['token']
+            return
+        st.error("❌ رابط الدخول غير صالح أو تم إلغاؤه")
+    
+    st.markdown("<h1 class='main-header'>⛽ نظام المتابعة الذكية - سوناطراك</h1>", unsafe_allow_html=True)
+    with st.form("login"):
+        name = st.text_input("👤 اسم المستخدم")
+        password = st.text_input("🔑 كلمة المرور", type="password")
+        if st.form_submit_button("دخول", use_container_width=True):
+            user = get_user_store().authenticate(name.strip(), password)
+            if user:
+                st.session_state.user = user
+                st.rerun()
+            st.error("❌ اسم المستخدم أو كلمة المرور غير صحيحة")
+
+# Start timing this rerun; the profiling panel at the end of the script closes it
+get_profiler().begin_rerun()
+
+# Multi-user mode: identify the user before any data is loaded
+if MULTI_USER and 'user' not in st.session_state:
+    display_login_form()
+    if 'user' not in st.session_state:
+        st.stop()
 
 # Initialize session state with loaded data
 if 'contract_start' not in st.session_state:
@@ -203,149 +480,501 @@ if 'contract_start' not in st.session_state:
     st.session_state.sick_periods = sick_periods
 
 def calculate_days():
-    """Calculate all days from contract start to today"""
-    if not st.session_state.contract_start:
-        return {}
-    
+    """Calculate the compact day state from contract start to today"""
+    with profile_stage('calculate_days'):
+        return build_day_state(
+            st.session_state.contract_start,
+            st.session_state.work_periods,
+            st.session_state.sick_periods,
+        )
+
+def calculate_statistics(day_state):
+    """Calculate statistics from the compact day state"""
+    with profile_stage('calculate_statistics'):
+        return day_state_statistics(day_state, st.session_state.initial_balance)
+
+def data_fingerprint(today=None):
+    """Content hash of the tracked data and the current date, used as the statistics cache key"""
+    state = (
+        st.session_state.contract_start,
+        st.session_state.initial_balance,
+        st.session_state.work_periods,
+        st.session_state.sick_periods,
+        today or datetime.date.today(),
+    )
+    return hashlib.sha256(repr(state).encode('utf-8')).hexdigest()
+
+# Day states, statistics and rollups are shared by every session of the server
+# process, keyed on user and data version, so identical work is done once;
+# Streamlit's resource cache is thread-safe and computes each key only once
+SHARED_CACHE_ENTRIES = 256
+
+@st.cache_resource(max_entries=SHARED_CACHE_ENTRIES, show_spinner=False)
+def shared_statistics(user, version, _contract_start, _initial_balance, _work_periods, _sick_periods, _today):
+    """Day state and statistics of one version of a user's data; callers must not modify them"""
+    statistics = calculate_interval_statistics(_contract_start, _initial_balance, _work_periods, _sick_periods, _today)
+    return build_day_state(_contract_start, _work_periods, _sick_periods, _today), statistics
+
+@st.cache_resource(max_entries=SHARED_CACHE_ENTRIES, show_spinner=False)
+def shared_rollup(user, version, rules_version, _day_state, _initial_balance, _rules):
+    """Prefix-sum rollup of one version of a user's day state under one version of the leave rules"""
+    return DayRollup(_day_state, _initial_balance, _rules)
+
+@st.cache_resource(max_entries=SHARED_CACHE_ENTRIES, show_spinner=False)
+def shared_version_statistics(path, seq, history_version, rules_version, today, _history, _state, _rules):
+    """(work, vacation, sick, balance) of the data as it was after change seq of the log at path"""
+    return statistics_at(_history, _state, seq, today, _rules)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def cached_leave_rules(path, version, index_path):
+    """Leave rules compiled once per version of the rules file, with the reason if it is invalid
+
+    The rules' calendar memory-maps its date index, which is written first
+    if it is missing or was built for other holidays.
+    """
+    try:
+        rules, error = load_rules(path), None
+    except RulesError as e:
+        rules, error = DEFAULT_RULES, str(e)
+    rules.calendar.open_index(index_path, CALENDAR_CONFIG.get('first_year', 2000),
+                              CALENDAR_CONFIG.get('last_year', 2040), write=True)
+    return rules, error
+
+def load_leave_rules():
+    """(rules, error) of the rules file; the default rules if it is missing or invalid"""
+    path = get_app_dir() / RULES_CONFIG.get('file', 'sonatrach_rules.toml')
+    index_path = get_app_dir() / CALENDAR_CONFIG.get('index', 'sonatrach_calendar.idx')
+    return cached_leave_rules(str(path), rules_file_version(path), str(index_path))
+
+def get_leave_rules():
+    """The compiled leave rules"""
+    return load_leave_rules()[0]
+
+def get_cached_statistics():
+    """Return (day_state, statistics) from the session cache, recomputing only when the data changed"""
     today = datetime.date.today()
-    all_days = {}
-    
-    current_date = st.session_state.contract_start
-    while current_date <= today:
-        all_days[current_date] = {'type': 'V', 'location': ''}
-        current_date += timedelta(days=1)
-    
-    # Mark work days with locations
-    for start_date, end_date, location in st.session_state.work_periods:
-        current = start_date
-        while current <= end_date:
-            if current in all_days:
-                all_days[current] = {'type': 'W', 'location': location}
-            current += timedelta(days=1)
-    
-    # Mark sick days
-    for start_date, end_date in st.session_state.sick_periods:
-        current = start_date
-        while current <= end_date:
-            if current in all_days:
-                all_days[current] = {'type': 'S', 'location': ''}
-            current += timedelta(days=1)
-    
-    return all_days
-
-def calculate_statistics(days_dict):
-    """Calculate statistics from days dictionary"""
-    total_w = sum(1 for day_info in days_dict.values() if day_info['type'] == 'W')
-    total_v = sum(1 for day_info in days_dict.values() if day_info['type'] == 'V')
-    total_s = sum(1 for day_info in days_dict.values() if day_info['type'] == 'S')
-    
-    # Calculate balance with initial balance
-    balance = st.session_state.initial_balance + (total_w - total_v)
+    key = data_fingerprint(today)
+    cache = st.session_state.get('stats_cache')
+    if cache is None or cache['key'] != key:
+        with profile_stage('calculate_statistics'):
+            day_state, statistics = shared_statistics(
+                get_employee(),
+                key,
+                st.session_state.contract_start,
+                st.session_state.initial_balance,
+                st.session_state.work_periods,
+                st.session_state.sick_periods,
+                today,
+            )
+        cache = {'key': key, 'today': today, 'day_state': day_state, 'statistics': statistics}
+        st.session_state.stats_cache = cache
+    return cache['day_state'], cache['statistics']
+
+def get_rollup():
+    """Prefix-sum rollup of the cached day state, rebuilt after any change to it"""
+    cache = st.session_state.stats_cache
+    rules = get_leave_rules()
+    if cache.get('rollup') is None or cache['rollup'].rules is not rules:
+        cache['rollup'] = shared_rollup(get_employee(), cache['key'], rules.version, cache['day_state'],
+                                        st.session_state.initial_balance, rules)
+    return cache['rollup']
+
+def get_projections():
+    """Projections of the sidebar's rotation patterns, cached until the data or the inputs change"""
+    anchor = st.session_state.projection_anchor
+    location = st.session_state.projection_location.strip()
+    rotations = tuple(parse_rotation(text, anchor, location)
+                      for text in st.session_state.projection_patterns.split(',') if text.strip())
+    horizon = st.session_state.projection_horizon
+    rules = get_leave_rules()
+    key = (st.session_state.stats_cache['key'], rotations, horizon, rules.version)
+    cache = st.session_state.get('projection_cache')
+    if cache is None or cache['key'] != key:
+        with profile_stage('project_rotations'):
+            projections = project_rotations(
+                st.session_state.contract_start,
+                st.session_state.initial_balance,
+                st.session_state.work_periods,
+                st.session_state.sick_periods,
+                rotations,
+                horizon,
+                rules=rules,
+            )
+        cache = {'key': key, 'projections': projections, 'figure': None}
+        st.session_state.projection_cache = cache
+    return cache
+
+def invalidate_statistics_cache():
+    """Drop the cached statistics so the next rerun recomputes them"""
+    st.session_state.pop('stats_cache', None)
+
+def update_statistics_cache(start_date, end_date):
+    """Apply a single period added or removed between start_date and end_date to the cached totals"""
+    cache = st.session_state.get('stats_cache')
+    today = datetime.date.today()
+    if (cache is None or cache['day_state'] is None or cache['today'] != today
+            or cache['day_state'].start != st.session_state.contract_start):
+        invalidate_statistics_cache()
+        return
+    
+    # The cached day state may be shared with other sessions, so paint a private copy
+    day_state = cache['day_state']
+    day_state = DayState(day_state.start, day_state.types.copy(), day_state.location_codes.copy(),
+                         list(day_state.locations))
+    cache['day_state'] = day_state
+    cache['rollup'] = None
+    first = day_state.start.toordinal()
+    lo = max(start_date.toordinal() - first, 0)
+    hi = min(end_date.toordinal() - first + 1, len(day_state.types))
+    total_w, total_v, total_s, _, location_stats = cache['statistics']
+    location_stats = dict(location_stats)
     
-    # Calculate by location
-    location_stats = {}
-    for day_info in days_dict.values():
-        if day_info['type'] == 'W' and day_info['location']:
-            loc = day_info['location'] or 'غير محدد'
-            location_stats[loc] = location_stats.get(loc, 0) + 1
+    if lo < hi:
+        types_before, locations_before = count_day_range(day_state, lo, hi)
+        location_index = {location: code for code, location in enumerate(day_state.locations)}
+        paint_day_range(day_state, lo, hi, st.session_state.work_periods, st.session_state.sick_periods, location_index)
+        types_after, locations_after = count_day_range(day_state, lo, hi)
+        
+        total_v, total_w, total_s = (
+            int(total) for total in np.array([total_v, total_w, total_s]) + types_after - types_before
+        )
+        locations_before = np.pad(locations_before, (0, len(locations_after) - len(locations_before)))
+        for code in np.flatnonzero(locations_after != locations_before):
+            location = day_state.locations[code]
+            days = location_stats.get(location, 0) + int(locations_after[code] - locations_before[code])
+            if days:
+                location_stats[location] = days
+            else:
+                location_stats.pop(location, None)
     
-    return total_w, total_v, total_s, balance, location_stats
+    balance = st.session_state.initial_balance + (total_w - total_v)
+    cache['statistics'] = (total_w, total_v, total_s, balance, location_stats)
+    cache['key'] = data_fingerprint(today)
+
+def days_version(day_state, first, last):
+    """Content hash of the tracked days in [first, last], used as the calendar cache key"""
+    lead, types, locations = slice_days(day_state, first, last)
+    return hashlib.sha1(repr((lead, types, locations)).encode('utf-8')).hexdigest()
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_month_html(year, month, version, projected_from, calendar_version, _day_state, _flags):
+    """Render a month's calendar HTML; memoized per (year, month, version) across reruns and sessions"""
+    first = datetime.date(year, month, 1)
+    last = datetime.date(year, month, calendar.monthrange(year, month)[1])
+    lead, types, locations = slice_days(_day_state, first, last)
+    return render_month_table(year, month, lead, types, locations, projected_index(first, lead, projected_from),
+                              _flags)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def render_year_html(year, version, projected_from, calendar_version, _day_state, _flags):
+    """Render all 12 months of a year; memoized per (year, version)"""
+    return render_year_table(year, _day_state, projected_from, _flags)
+
+def resolve_calendar_days(first, last):
+    """Day state of just [first, last] from the session's period indexes, planned periods included"""
+    return resolve_days(st.session_state.contract_start, get_period_index('work'), get_period_index('sick'),
+                        first, last)
+
+def display_calendar(year, month, projected_from=None, day_state=None):
+    """Display monthly calendar with colored days, marking days from projected_from on as projected
 
-def display_calendar(days_dict, year, month):
-    """Display monthly calendar with colored days"""
-    cal = calendar.monthcalendar(year, month)
+    Only the periods overlapping the month are read, unless a day_state
+    (a projection) is given to show instead.
+    """
     month_name = calendar.month_name[month]
-    
     st.markdown(f"<div class='sub-header'>🗓️ تقويم {month_name} {year}</div>", unsafe_allow_html=True)
     
-    # Create HTML calendar
-    html_cal = f"""
-    <div style='border: 1px solid #e0e0e0; border-radius: 15px; padding: 1rem; background: white; box-shadow: 0 2px 10px rgba(0,0,0,0.1);'>
-    <table style='width: 100%; border-collapse: collapse; text-align: center; font-family: Arial, sans-serif;'>
-        <tr style='background: linear-gradient(135deg, #2E86AB, #1a5f7a); color: white;'>
-            <th style='padding: 0.8rem; border-radius: 8px 0 0 0;'>الأحد</th>
-            <th style='padding: 0.8rem;'>الاثنين</th>
-            <th style='padding: 0.8rem;'>الثلاثاء</th>
-            <th style='padding: 0.8rem;'>الأربعاء</th>
-            <th style='padding: 0.8rem;'>الخميس</th>
-            <th style='padding: 0.8rem;'>الجمعة</th>
-            <th style='padding: 0.8rem; border-radius: 0 8px 0 0;'>السبت</th>
-        </tr>
+    with profile_stage('display_calendar'):
+        first = datetime.date(year, month, 1)
+        last = datetime.date(year, month, calendar.monthrange(year, month)[1])
+        if day_state is None:
+            day_state = resolve_calendar_days(first, last)
+        version = days_version(day_state, first, last)
+        work_calendar = get_leave_rules().calendar
+        st.markdown(render_month_html(year, month, version, projected_from, work_calendar.version, day_state,
+                                      work_calendar.range_flags(first, last)), unsafe_allow_html=True)
+
+def display_year_calendar(year, projected_from=None, day_state=None):
+    """Display all 12 months of a year"""
+    st.markdown(f"<div class='sub-header'>🗓️ تقويم سنة {year}</div>", unsafe_allow_html=True)
+    
+    with profile_stage('display_calendar'):
+        first, last = datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+        if day_state is None:
+            day_state = resolve_calendar_days(first, last)
+        version = days_version(day_state, first, last)
+        work_calendar = get_leave_rules().calendar
+        st.markdown(render_year_html(year, version, projected_from, work_calendar.version, day_state,
+                                     work_calendar.range_flags(first, last)), unsafe_allow_html=True)
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def cached_analytics_charts(total_w, total_v, total_s, location_items):
+    """Build the totals charts once per distinct totals; the figures are shared by all sessions"""
+    return create_analytics_charts(total_w, total_v, total_s, dict(location_items))
+
+def rollup_version(rollup, balances):
+    """Content hash of a monthly rollup and its month-end balances, used as the monthly charts cache key"""
+    first = rollup.months[0] if rollup.months else None
+    return hashlib.sha1(repr(first).encode('utf-8') + rollup.counts.tobytes() + balances.tobytes()).hexdigest()
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def cached_monthly_charts(version, initial_balance, _rollup, _balances):
+    """Build the monthly charts once per distinct rollup and balances"""
+    return create_monthly_charts(_rollup, initial_balance, _balances)
+
+PERIODS_PAGE_SIZE = 25
+
+def period_ids(periods):
+    """Stable IDs for periods: a hash of the period's values and its occurrence among identical ones
+
+    Unlike list positions, IDs don't shift when other periods are added or deleted.
     """
+    seen = {}
+    ids = []
+    for period in periods:
+        occurrence = seen.get(period, 0)
+        seen[period] = occurrence + 1
+        ids.append(hashlib.sha1(repr((period, occurrence)).encode('utf-8')).hexdigest()[:12])
+    return ids
+
+def find_period_index(periods, period_id):
+    """List position of the period with the given stable ID, or None"""
+    try:
+        return period_ids(periods).index(period_id)
+    except ValueError:
+        return None
+
+def build_period_frame(periods, with_location=True):
+    """Period history as a dataframe: number, dates, duration, location and stable ID"""
+    pd = lazy_import('pandas')
+    columns = ['start', 'end', 'location'] if with_location else ['start', 'end']
+    frame = pd.DataFrame(periods, columns=columns)
+    frame.insert(0, 'number', range(1, len(frame) + 1))
+    frame['days'] = (pd.to_datetime(frame['end']) - pd.to_datetime(frame['start'])).dt.days + 1
+    frame['id'] = period_ids(periods)
+    return frame
+
+def filter_period_frame(frame, date_from=None, date_to=None, location=None):
+    """Keep periods overlapping [date_from, date_to] and, if given, at one location"""
+    pd = lazy_import('pandas')
+    mask = pd.Series(True, index=frame.index)
+    if date_from:
+        mask &= frame['end'] >= date_from
+    if date_to:
+        mask &= frame['start'] <= date_to
+    if location is not None:
+        mask &= frame['location'] == location
+    return frame[mask]
+
+def display_period_table(frame, key, columns, selectable=False):
+    """Display one page of a period frame in a single dataframe element
+
+    Returns the displayed page and, if selectable, the selected row positions.
+    """
+    pages = max((len(frame) + PERIODS_PAGE_SIZE - 1) // PERIODS_PAGE_SIZE, 1)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"الصفحة (من {pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    page_frame = frame.iloc[(page - 1) * PERIODS_PAGE_SIZE:page * PERIODS_PAGE_SIZE]
     
-    for week in cal:
-        html_cal += "<tr style='height: 60px;'>"
-        for day in week:
-            if day == 0:
-                html_cal += "<td style='padding: 0.5rem; background-color: #f8f9fa;'></td>"
-            else:
-                current_date = datetime.date(year, month, day)
-                if current_date in days_dict:
-                    day_info = days_dict[current_date]
-                    day_type = day_info['type']
-                    location = day_info['location']
-                    
-                    if day_type == 'W':
-                        css_class = 'day-w'
-                        tooltip = f'يوم عمل - {location}' if location else 'يوم عمل'
-                    elif day_type == 'V':
-                        css_class = 'day-v'
-                        tooltip = 'إجازة'
-                    else:  # 'S'
-                        css_class = 'day-s'
-                        tooltip = 'عطلة مرضية'
-                    
-                    html_cal += f"<td style='padding: 0.5rem; position: relative;' class='{css_class}' title='{tooltip}'>"
-                    html_cal += f"<div style='font-weight: bold;'>{day}</div>"
-                    if location and day_type == 'W':
-                        html_cal += f"<div style='font-size: 0.6rem; margin-top: 2px;'>{location[:8]}...</div>"
-                    html_cal += "</td>"
-                else:
-                    html_cal += f"<td style='padding: 0.5rem; background-color: #f8f9fa;'>{day}</td>"
-        html_cal += "</tr>"
-    
-    html_cal += "</table></div>"
-    st.markdown(html_cal, unsafe_allow_html=True)
-
-def create_analytics_charts(total_w, total_v, total_s, location_stats):
-    """Create analytics charts"""
-    # Pie chart for day types
-    fig_pie = px.pie(
-        values=[total_w, total_v, total_s],
-        names=['أيام العمل', 'أيام الإجازة', 'أيام مرضية'],
-        title='توزيع أنواع الأيام',
-        color=['أيام العمل', 'أيام الإجازة', 'أيام مرضية'],
-        color_discrete_map={'أيام العمل': '#2E86AB', 'أيام الإجازة': '#A8D5BA', 'أيام مرضية': '#F9DC5C'}
-    )
-    fig_pie.update_layout(title_x=0.5, showlegend=True)
+    column_config = {
+        'number': st.column_config.NumberColumn('#', width='small'),
+        'start': st.column_config.DateColumn('📅 من'),
+        'end': st.column_config.DateColumn('📅 إلى'),
+        'days': st.column_config.NumberColumn('⏱️ المدة (يوم)'),
+        'location': st.column_config.TextColumn('🏗️ الورشة'),
+    }
+    if selectable:
+        event = st.dataframe(page_frame, hide_index=True, use_container_width=True, column_order=columns,
+                             column_config=column_config, on_select='rerun', selection_mode='single-row', key=key)
+        return page_frame, event.selection.rows
+    st.dataframe(page_frame, hide_index=True, use_container_width=True, column_order=columns,
+                 column_config=column_config, key=key)
+    return page_frame, []
+
+def get_crew_source():
+    """The crew's SQLite database or users folder, or None if this session has no crew dashboard"""
+    if MULTI_USER and get_employee() not in CREW_CONFIG.get('supervisors', []):
+        return None
+    if STORAGE_CONFIG.get('mode') == 'sqlite':
+        return get_app_dir() / STORAGE_CONFIG.get('database', 'sonatrach_data.db')
+    if MULTI_USER:
+        return get_app_dir() / 'users'
+    return None
+
+@st.cache_resource(max_entries=4, show_spinner="جاري تحميل بيانات الطاقم...")
+def cached_crew_frame(source, version):
+    """Crew frame of a source, rebuilt only when its files change"""
+    return build_crew_frame(load_crew(source))
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def cached_crew_balances(source, version, rules_version, today, _frame, _rules):
+    """Crew balances, weighed by the leave rules once per crew version, rules version and day"""
+    return crew_balances(_frame, today, _rules)
+
+def display_crew_dashboard(source):
+    """Supervisor view: daily headcount per location, crew balances and coverage gaps"""
+    st.markdown("<div class='sub-header'>👥 لوحة الطاقم</div>", unsafe_allow_html=True)
+    with profile_stage('crew_frame'):
+        version = crew_source_version(source)
+        frame = cached_crew_frame(str(source), version)
+    if not frame.employees:
+        st.info("لا توجد بيانات موظفين بعد")
+        return
     
-    # Bar chart for locations
-    if location_stats:
-        fig_bar = px.bar(
-            x=list(location_stats.values()),
-            y=list(location_stats.keys()),
-            orientation='h',
-            title='أيام العمل حسب الورشة',
-            labels={'x': 'عدد الأيام', 'y': 'الورشة'},
-            color=list(location_stats.values()),
-            color_continuous_scale='Viridis'
-        )
-        fig_bar.update_layout(title_x=0.5)
-        
-        return fig_pie, fig_bar
+    today = datetime.date.today()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        crew_from = st.date_input("📅 من", today - datetime.timedelta(days=90), key="crew_from")
+    with col2:
+        crew_to = st.date_input("📅 إلى", today + datetime.timedelta(days=30), key="crew_to")
+    with col3:
+        minimum = st.number_input("👷 أقل عدد مطلوب في الورشة", min_value=1, value=1, step=1, key="crew_minimum")
+    if crew_from > crew_to:
+        st.error("❌ تاريخ البداية يجب أن يكون قبل تاريخ النهاية")
+        return
+    
+    with profile_stage('crew_analytics'):
+        occupancy = crew_occupancy(frame, crew_from, crew_to)
+        rules = get_leave_rules()
+        balances = cached_crew_balances(str(source), version, rules.version, today, frame, rules)
+        # Coverage is checked for the locations worked at some point in the range
+        active = [code for code in range(1, len(frame.locations)) if occupancy[code].any()]
+        gaps = coverage_gaps(occupancy[active], crew_from, minimum)
+        working_today = int(occupancy[:, (today - crew_from).days].sum()) if crew_from <= today <= crew_to else None
+    
+    col1, col2, col3, col4 = st.columns(4)
+    for col, title, value, note in (
+        (col1, "👥 الموظفون", len(frame.employees), "في قاعدة البيانات"),
+        (col2, "🛠️ في العمل اليوم", working_today if working_today is not None else "-", "حسب الفترات المسجلة"),
+        (col3, "⚖️ متوسط الرصيد", f"{balances.balance.mean():.1f}", f"الوسيط {np.median(balances.balance):.0f}"),
+        (col4, "⚠️ فجوات التغطية", len(gaps), f"أقل من {minimum} في الورشة"),
+    ):
+        with col:
+            st.markdown(f"""
+            <div class='stat-box'>
+                <h3>{title}</h3>
+                <h2>{value}</h2>
+                <div style='font-size: 0.9rem; opacity: 0.9;'>{note}</div>
+            </div>
+            """, unsafe_allow_html=True)
+    
+    with profile_stage('crew_charts'):
+        fig_occupancy, fig_balances = create_crew_charts(
+            occupancy[active], [frame.locations[code] for code in active], crew_from, balances.balance)
+        st.plotly_chart(fig_occupancy, use_container_width=True)
+        st.plotly_chart(fig_balances, use_container_width=True)
+    
+    pd = lazy_import('pandas')
+    st.markdown("<div class='sub-header'>⚖️ الأرصدة خارج الحدود</div>", unsafe_allow_html=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        low = st.number_input("📉 رصيد منخفض أقل من", value=-15, step=1, key="crew_low_balance")
+    with col2:
+        high = st.number_input("📈 رصيد مرتفع أكثر من", value=30, step=1, key="crew_high_balance")
+    outside = np.flatnonzero((balances.balance < low) | (balances.balance > high))
+    outside = outside[np.argsort(balances.balance[outside])]
+    if len(outside):
+        st.dataframe(pd.DataFrame({
+            'الموظف': [frame.employees[row] for row in outside],
+            'الرصيد': balances.balance[outside],
+            'أيام العمل': balances.work[outside],
+            'أيام الإجازة': balances.vacation[outside],
+            'أيام مرضية': balances.sick[outside],
+        }), hide_index=True, use_container_width=True)
+    else:
+        st.success("✅ كل الأرصدة ضمن الحدود")
     
-    return fig_pie, None
+    if gaps:
+        st.markdown("<div class='sub-header'>🕳️ فجوات التغطية</div>", unsafe_allow_html=True)
+        st.dataframe(pd.DataFrame([{
+            'الورشة': frame.locations[active[code]],
+            'من': gap_first,
+            'إلى': gap_last,
+            'الأيام': (gap_last - gap_first).days + 1,
+        } for code, gap_first, gap_last in gaps]), hide_index=True, use_container_width=True)
+
+REPORT_FORMAT_NAMES = {'xlsx': 'Excel', 'pdf': 'PDF', 'html': 'HTML للطباعة'}
+
+def report_job(year, month, fmt, submit=False):
+    """Key and background job of a statement of this session's current data
+
+    A job is started when there is none for the key yet, or on submit, which
+    also retries a failed one.
+    """
+    first, last = statement_period(year, month)
+    employee, history, today = get_employee(), current_state(), datetime.date.today()
+    rules = get_leave_rules()
+    key = report_key(employee, history, first, last, fmt, rules, today)
+    worker = get_report_worker()
+    job = worker.get(key)
+    if job is None or submit:
+        job = worker.submit(key, employee, history, first, last, fmt, rules, today)
+    return key, job
+
+def display_report(year, month, fmt):
+    """Download button of the requested statement, polling its job while it runs
+
+    The job is keyed on the data, so edits made meanwhile start a new one and
+    an unchanged statement is downloaded again without being regenerated.
+    """
+    key, job = report_job(year, month, fmt)
+    if job.done() and job.exception() is not None:
+        st.error(f"❌ تعذر إنشاء الكشف: {job.exception()}")
+        return
+    
+    polling = not job.done()
+    
+    @st.fragment(run_every=1 if polling else None)
+    def report_status():
+        current_key, current_job = report_job(year, month, fmt)
+        if not current_job.done():
+            st.info("⏳ جاري إنشاء الكشف في الخلفية، يمكنك متابعة العمل...")
+        elif current_key != key or polling:
+            # Finished while polling: redraw the whole section, without polling
+            st.rerun()
+        else:
+            first, last = statement_period(year, month)
+            st.download_button(f"📥 تحميل الكشف ({REPORT_FORMAT_NAMES[fmt]})", current_job.result(),
+                               file_name=report_file_name(get_employee(), first, last, fmt),
+                               mime=REPORT_FORMATS[fmt][0], use_container_width=True)
+    
+    report_status()
+
+def finish_profiling():
+    """Close this rerun's timings and show them, when profiling is on"""
+    profiler = get_profiler()
+    if profiler.enabled:
+        profiler.end_rerun()
+        display_profiling_panel(profiler)
+
+def display_profiling_panel(profiler):
+    """Display this session's stage timings in a collapsible sidebar panel"""
+    pd = lazy_import('pandas')
+    with st.sidebar.expander("⏱️ قياس الأداء"):
+        col1, col2 = st.columns(2)
+        col1.metric("مرات إعادة التشغيل", profiler.reruns)
+        col2.metric("في الدقيقة", f"{profiler.reruns_per_minute():.1f}")
+        st.dataframe(pd.DataFrame(profiler.summary_rows()), hide_index=True, use_container_width=True)
+        if IMPORT_TIMES:
+            st.caption("⏳ زمن الاستيراد: " + " · ".join(
+                f"{module} {seconds * 1000:.0f} ms" for module, seconds in IMPORT_TIMES.items()))
+        st.download_button("📥 Prometheus", REGISTRY.prometheus(), file_name="sonatrach_metrics.prom",
+                           mime="text/plain", use_container_width=True)
+        st.download_button("📥 JSON lines", profiler.json_lines(), file_name="sonatrach_profile.jsonl",
+                           mime="application/x-ndjson", use_container_width=True)
 
 # Main app
 st.markdown("<h1 class='main-header'>⛽ نظام المتابعة الذكية - سوناطراك</h1>", unsafe_allow_html=True)
 
-# Warning for Streamlit Cloud users
-st.markdown("""
-<div class='warning-box'>
-⚠️ <strong>ملاحظة هامة:</strong> في نسخة Streamlit Cloud، البيانات يتم حفظها خلال الجلسة فقط. 
-استخدم خاصية <strong>التصدير والاستيراد</strong> لحفظ بياناتك بشكل دائم.
-</div>
-""", unsafe_allow_html=True)
+# Warning for Streamlit Cloud users; in multi-user mode data is kept per user on the server
+if not MULTI_USER:
+    st.markdown("""
+    <div class='warning-box'>
+    ⚠️ <strong>ملاحظة هامة:</strong> في نسخة Streamlit Cloud، البيانات يتم حفظها خلال الجلسة فقط. 
+    استخدم خاصية <strong>التصدير والاستيراد</strong> لحفظ بياناتك بشكل دائم.
+    </div>
+    """, unsafe_allow_html=True)
 
 # Initial setup if contract start is not set
 if not st.session_state.contract_start:
@@ -376,9 +1005,10 @@ if not st.session_state.contract_start:
         st.write(f"**الرصيد المدخل:** {initial_balance} يوم")
     
     if st.button("💾 حفظ الإعدادات والبدء", type="primary", use_container_width=True):
-        st.session_state.contract_start = contract_start
-        st.session_state.initial_balance = initial_balance
-        save_data()
+        with logged_change("تعديل الإعدادات", st.session_state.pop('settings_before', None)):
+            st.session_state.contract_start = contract_start
+            st.session_state.initial_balance = initial_balance
+            save_data(settings_record(contract_start, initial_balance))
         st.success("✅ تم حفظ الإعدادات بنجاح!")
         st.rerun()
     
@@ -391,12 +1021,50 @@ with st.sidebar:
                 "<p>نظام المتابعة الذكية لأيام العمل</p>"
                 "</div>", unsafe_allow_html=True)
     
+    if MULTI_USER:
+        st.caption(f"👤 {st.session_state.user}")
+        if st.button("🚪 تسجيل الخروج", use_container_width=True):
+            st.session_state.clear()
+            st.rerun()
+    
+    if STORAGE_CONFIG.get('autosave', True):
+        display_save_status()
+    
+    # Undo and redo any change to the data, from the change log
+    history = get_change_history()
+    undo_target, redo_target = history.next_undo(), history.next_redo()
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("↩️ تراجع", disabled=undo_target is None, use_container_width=True,
+                     help=f"تراجع عن: {undo_target.label}" if undo_target else None):
+            change = history.undo(get_employee())
+            if change is not None:
+                apply_logged_change(change)
+            st.rerun()
+    with col2:
+        if st.button("↪️ إعادة", disabled=redo_target is None, use_container_width=True,
+                     help=f"إعادة: {redo_target.label}" if redo_target else None):
+            change = history.redo(get_employee())
+            if change is not None:
+                apply_logged_change(change)
+            st.rerun()
+    
+    rules_error = load_leave_rules()[1]
+    if rules_error:
+        st.error(f"❌ ملف قواعد الرصيد غير صالح، تُستخدم القواعد الافتراضية: {rules_error}")
+    
+    crew_source = get_crew_source()
+    if crew_source is not None:
+        st.toggle("👥 لوحة الطاقم", key="crew_view", help="عرض إحصائيات كل الموظفين بدلاً من بياناتك")
+    
     # Contract info
     with st.expander("ℹ️ معلومات العقد", expanded=True):
         st.write(f"**تاريخ البداية:** {st.session_state.contract_start}")
         st.write(f"**الرصيد الابتدائي:** {st.session_state.initial_balance} يوم")
         
         if st.button("✏️ تعديل الإعدادات"):
+            # The settings form starts from no contract start; the log compares with the saved one
+            st.session_state.settings_before = current_state()
             st.session_state.contract_start = None
             st.rerun()
     
@@ -407,14 +1075,19 @@ with st.sidebar:
         work_start = st.date_input("📅 تاريخ بداية العمل", datetime.date.today(), key="work_start")
         work_end = st.date_input("📅 تاريخ نهاية العمل", datetime.date.today(), key="work_end")
         work_location = st.text_input("🏗️ مكان العمل (اختياري)", placeholder="مثال: RIG tp210 أو ورشة الصيانة")
+        merge_work = st.checkbox("🔗 دمج مع الفترات المتداخلة في نفس المكان", value=True, key="merge_work")
         
         if st.button("💾 حفظ فترة العمل", type="primary", use_container_width=True):
             if work_start <= work_end:
                 if work_start >= st.session_state.contract_start:
-                    st.session_state.work_periods.append((work_start, work_end, work_location))
-                    save_data()
-                    st.success("✅ تمت إضافة فترة العمل بنجاح")
-                    st.rerun()
+                    with logged_change(f"إضافة فترة عمل {work_start} - {work_end}"):
+                        saved, overlapping = add_period('work', (work_start, work_end, work_location), merge_work)
+                    if saved:
+                        st.success("✅ تم دمج فترة العمل مع الفترات المتداخلة" if overlapping else "✅ تمت إضافة فترة العمل بنجاح")
+                        st.rerun()
+                    else:
+                        start, end, location = overlapping[0]
+                        st.error(f"❌ الفترة تتداخل مع فترة العمل من {start} إلى {end}" + (f" - {location}" if location else ""))
                 else:
                     st.error("❌ تاريخ البداية يجب أن يكون بعد تاريخ بداية العقد")
             else:
@@ -424,45 +1097,61 @@ with st.sidebar:
     with st.expander("🏥 إضافة عطلة مرضية"):
         sick_start = st.date_input("📅 تاريخ بداية العطلة المرضية", datetime.date.today(), key="sick_start")
         sick_end = st.date_input("📅 تاريخ نهاية العطلة المرضية", datetime.date.today(), key="sick_end")
+        merge_sick = st.checkbox("🔗 دمج مع العطل المتداخلة", value=True, key="merge_sick")
         
         if st.button("💾 حفظ العطلة المرضية", use_container_width=True):
             if sick_start <= sick_end:
                 if sick_start >= st.session_state.contract_start:
-                    st.session_state.sick_periods.append((sick_start, sick_end))
-                    save_data()
-                    st.success("✅ تمت إضافة العطلة المرضية بنجاح")
-                    st.rerun()
+                    with logged_change(f"إضافة عطلة مرضية {sick_start} - {sick_end}"):
+                        saved, overlapping = add_period('sick', (sick_start, sick_end), merge_sick)
+                    if saved:
+                        st.success("✅ تم دمج العطلة المرضية مع العطل المتداخلة" if overlapping else "✅ تمت إضافة العطلة المرضية بنجاح")
+                        st.rerun()
+                    else:
+                        start, end = overlapping[0]
+                        st.error(f"❌ العطلة تتداخل مع العطلة المرضية من {start} إلى {end}")
                 else:
                     st.error("❌ تاريخ البداية يجب أن يكون بعد تاريخ بداية العقد")
             else:
                 st.error("❌ تاريخ البداية يجب أن يكون قبل تاريخ النهاية")
     
+    # Rotation projection
+    with st.expander("🔮 توقع الرصيد"):
+        st.checkbox("تفعيل التوقع", key="projection_enabled")
+        st.text_input("🔁 أنماط التناوب (عمل/راحة)", value="28/28", key="projection_patterns",
+                      help="افصل بين عدة أنماط بفاصلة لمقارنتها، مثال: 28/28, 14/14")
+        st.date_input("📅 أول يوم عمل في التناوب", datetime.date.today() + datetime.timedelta(days=1),
+                      key="projection_anchor")
+        st.text_input("🏗️ الورشة", key="projection_location")
+        st.date_input("🏁 التوقع حتى", datetime.date.today() + datetime.timedelta(days=365),
+                      key="projection_horizon")
+    
     st.markdown("---")
     
     # Data management
     with st.expander("⚙️ إدارة البيانات", expanded=True):
         st.subheader("📤 تصدير البيانات")
         
-        # Export data
+        # Export data; after a first export only the changes since then can be exported
+        incremental = False
+        if 'export_base' in st.session_state:
+            incremental = st.checkbox("📎 نسخة تزايدية (التغييرات منذ آخر تصدير فقط)", key="export_incremental")
         if st.button("💾 تصدير نسخة احتياطية", use_container_width=True):
-            data = {
-                'contract_start': st.session_state.contract_start,
-                'initial_balance': st.session_state.initial_balance,
-                'work_periods': st.session_state.work_periods,
-                'sick_periods': st.session_state.sick_periods
-            }
+            backup, header = export_data(incremental)
             st.download_button(
                 label="📥 تحميل ملف النسخ الاحتياطي",
-                data=json.dumps(data, default=str, ensure_ascii=False, indent=2),
-                file_name=f"sonatrach_backup_{datetime.date.today()}.json",
-                mime="application/json",
+                data=backup,
+                file_name=backup_file_name(header),
+                mime="application/octet-stream",
                 use_container_width=True
             )
         
         st.subheader("📥 استيراد البيانات")
         
         # Import data
-        uploaded_file = st.file_uploader("اختر ملف النسخ الاحتياطي", type=['json'], key="import_uploader")
+        uploaded_file = st.file_uploader("اختر ملف النسخ الاحتياطي", type=['json', 'jsonl', 'gz', 'zst'],
+                                         key="import_uploader",
+                                         help="النسخ التزايدية تُطبَّق على البيانات الحالية")
         
         if uploaded_file is not None:
             if st.button("🔄 استيراد البيانات", type="secondary", use_container_width=True):
@@ -470,157 +1159,301 @@ with st.sidebar:
                     contract_start, initial_balance, work_periods, sick_periods = import_data(uploaded_file)
                     
                     if contract_start is not None:
-                        st.session_state.contract_start = contract_start
-                        st.session_state.initial_balance = initial_balance
-                        st.session_state.work_periods = work_periods
-                        st.session_state.sick_periods = sick_periods
-                        save_data()
+                        with logged_change(f"استيراد نسخة احتياطية {uploaded_file.name}"):
+                            st.session_state.contract_start = contract_start
+                            st.session_state.initial_balance = initial_balance
+                            st.session_state.work_periods = work_periods
+                            st.session_state.sick_periods = sick_periods
+                            save_data()
                         st.success("✅ تم استيراد البيانات بنجاح!")
                         st.rerun()
         
+        st.subheader("📋 استيراد جدول المناوبات")
+        
+        # Import a CSV/Excel rotation schedule exported by HR
+        schedule_file = st.file_uploader("اختر ملف CSV أو Excel", type=['csv', 'xlsx'], key="schedule_uploader")
+        schedule_employee = st.text_input("رقم الموظف في الملف (اختياري)", key="schedule_employee",
+                                          help="إذا كان الملف يحتوي على عدة موظفين، أدخل رقمك لاستيراد فتراتك فقط")
+        
+        if schedule_file is not None:
+            if st.button("🔄 استيراد الجدول", type="secondary", use_container_width=True):
+                with st.spinner("جاري استيراد الجدول..."):
+                    with logged_change(f"استيراد جدول المناوبات {schedule_file.name}"):
+                        st.session_state.schedule_import_report = import_schedule_file(schedule_file, schedule_employee)
+                    st.rerun()
+        
+        report = st.session_state.pop('schedule_import_report', None)
+        if report is not None:
+            if report['periods']:
+                st.success(f"✅ تم استيراد {report['accepted']} سطر من {report['rows']} في {report['periods']} فترة")
+            for message in report['messages']:
+                st.error(f"❌ {message}")
+            if report['errors']:
+                st.warning(f"⚠️ {len(report['errors'])} سطر غير صالح")
+                st.dataframe(lazy_import('pandas').DataFrame(report['errors'], columns=['السطر', 'الخطأ']),
+                             hide_index=True, use_container_width=True)
+        
         st.subheader("🗑️ إدارة الفترات")
         
-        # Delete specific work period
-        if st.session_state.work_periods:
-            period_options = [f"من {start} إلى {end} - {location}" if location else f"من {start} إلى {end}" 
-                            for start, end, location in st.session_state.work_periods]
-            period_to_delete = st.selectbox("اختر فترة عمل للحذف:", range(len(period_options)), 
-                                          format_func=lambda x: period_options[x])
-            if st.button("🗑️ حذف الفترة المحددة", use_container_width=True):
-                del st.session_state.work_periods[period_to_delete]
+        st.caption("لحذف فترة عمل محددة، اخترها من جدول سجل فترات العمل")
+        
+        if st.button("🧹 تنظيم السجل", use_container_width=True,
+                     help="دمج الفترات المتداخلة والمتتالية في نفس المكان دون تغيير أي يوم"):
+            before = len(st.session_state.work_periods) + len(st.session_state.sick_periods)
+            with logged_change("تنظيم السجل"):
+                st.session_state.work_periods, st.session_state.sick_periods = normalize_history(
+                    st.session_state.work_periods, st.session_state.sick_periods)
                 save_data()
-                st.success("✅ تم حذف فترة العمل")
-                st.rerun()
+            after = len(st.session_state.work_periods) + len(st.session_state.sick_periods)
+            st.success(f"✅ تم تنظيم السجل: {before} فترة أصبحت {after}")
         
-        if st.button("🗑️ حذف جميع البيانات", use_container_width=True):
-            st.session_state.work_periods = []
-            st.session_state.sick_periods = []
-            save_data()
+        if st.button("🗑️ حذف جميع البيانات", use_container_width=True, help="يمكن التراجع عن الحذف من أعلى اللوحة"):
+            with logged_change("حذف جميع البيانات"):
+                st.session_state.work_periods = []
+                st.session_state.sick_periods = []
+                save_data()
             st.success("✅ تم حذف جميع البيانات")
             st.rerun()
+    
+    # Audit log of every change, with the statistics as they were after any of them
+    with st.expander("📜 سجل التغييرات"):
+        if not history.changes:
+            st.caption("لا توجد تغييرات مسجلة بعد")
+        else:
+            kind_names = {'edit': '', 'undo': 'تراجع: ', 'redo': 'إعادة: '}
+            recent = history.changes[:-201:-1]
+            st.dataframe(lazy_import('pandas').DataFrame([{
+                'رقم': change.seq,
+                'الوقت': change.time.strftime('%Y-%m-%d %H:%M'),
+                'المستخدم': change.user or '-',
+                'التغيير': kind_names[change.kind] + change.label,
+            } for change in recent]), hide_index=True, use_container_width=True)
+            version = st.selectbox("📊 الإحصائيات بعد التغيير", [None] + [change.seq for change in recent],
+                                   format_func=lambda seq: "اختر تغييراً" if seq is None else
+                                   f"{seq} - {kind_names[history.by_seq[seq].kind]}{history.by_seq[seq].label}",
+                                   key="audit_version")
+            if version is not None:
+                rules = get_leave_rules()
+                work, vacation, sick, version_balance = shared_version_statistics(
+                    str(history.path), version, history.version, rules.version, datetime.date.today(),
+                    history, current_state(), rules)
+                st.write(f"**أيام العمل:** {work} • **الإجازة:** {vacation} • **مرضية:** {sick}")
+                st.write(f"**الرصيد:** {version_balance} يوم")
+
+# The crew dashboard replaces the personal one while it is switched on
+if crew_source is not None and st.session_state.crew_view:
+    display_crew_dashboard(crew_source)
+    finish_profiling()
+    st.stop()
 
 # Main content
 # Calculate statistics
-days_dict = calculate_days()
-total_w, total_v, total_s, balance, location_stats = calculate_statistics(days_dict)
+day_state, (total_w, total_v, total_s, balance, location_stats) = get_cached_statistics()
+stats_since = f"منذ {st.session_state.contract_start}"
+leave_rules = get_leave_rules()
+if not leave_rules.is_default:
+    # The cached totals count days; custom leave rules weigh them, which the rollup's prefix sums do
+    balance = get_rollup().balance_at()
 
 # Statistics cards
-st.markdown("<div class='sub-header'>📊 الإحصائيات التفصيلية</div>", unsafe_allow_html=True)
+with profile_stage('stat_cards'):
+    st.markdown("<div class='sub-header'>📊 الإحصائيات التفصيلية</div>", unsafe_allow_html=True)
+    
+    # Optional date range, answered from the rollup's prefix sums without rescanning the days
+    range_col1, range_col2 = st.columns(2)
+    with range_col1:
+        stats_from = st.date_input("📅 الإحصائيات من", value=None, key="stats_from")
+    with range_col2:
+        stats_to = st.date_input("📅 الإحصائيات إلى", value=None, key="stats_to")
+    stats_range = (0, None)
+    if stats_from or stats_to:
+        total_w, total_v, total_s, balance, location_stats = get_rollup().statistics(stats_from, stats_to)
+        stats_range = get_rollup().offsets(stats_from, stats_to)
+        stats_since = f"من {stats_from or st.session_state.contract_start} إلى {stats_to or datetime.date.today()}"
 
-col1, col2, col3, col4 = st.columns(4)
+    col1, col2, col3, col4 = st.columns(4)
 
-with col1:
-    st.markdown(f"""
-    <div class='stat-box'>
-        <h3>🛠️ أيام العمل</h3>
-        <h2>{total_w}</h2>
-        <div style='font-size: 0.9rem; opacity: 0.9;'>منذ {st.session_state.contract_start}</div>
-    </div>
-    """, unsafe_allow_html=True)
+    with col1:
+        st.markdown(f"""
+        <div class='stat-box'>
+            <h3>🛠️ أيام العمل</h3>
+            <h2>{total_w}</h2>
+            <div style='font-size: 0.9rem; opacity: 0.9;'>{stats_since}</div>
+        </div>
+        """, unsafe_allow_html=True)
 
-with col2:
-    st.markdown(f"""
-    <div class='stat-box'>
-        <h3>🏖️ أيام الإجازة</h3>
-        <h2>{total_v}</h2>
-        <div style='font-size: 0.9rem; opacity: 0.9;'>إجمالي الإجازات</div>
-    </div>
-    """, unsafe_allow_html=True)
+    with col2:
+        st.markdown(f"""
+        <div class='stat-box'>
+            <h3>🏖️ أيام الإجازة</h3>
+            <h2>{total_v}</h2>
+            <div style='font-size: 0.9rem; opacity: 0.9;'>إجمالي الإجازات</div>
+        </div>
+        """, unsafe_allow_html=True)
 
-with col3:
-    st.markdown(f"""
-    <div class='stat-box'>
-        <h3>🏥 أيام مرضية</h3>
-        <h2>{total_s}</h2>
-        <div style='font-size: 0.9rem; opacity: 0.9;'>العطل المرضية</div>
-    </div>
-    """, unsafe_allow_html=True)
+    with col3:
+        st.markdown(f"""
+        <div class='stat-box'>
+            <h3>🏥 أيام مرضية</h3>
+            <h2>{total_s}</h2>
+            <div style='font-size: 0.9rem; opacity: 0.9;'>العطل المرضية</div>
+        </div>
+        """, unsafe_allow_html=True)
 
-with col4:
-    balance_class = "positive" if balance >= 0 else "negative"
-    balance_icon = "📈" if balance >= 0 else "📉"
-    balance_text = "مدينة لك" if balance >= 0 else "مدين للشركة"
-    balance_value = abs(balance)
-    
-    # Show initial balance separately
-    initial_text = f"(ابتدائي: {st.session_state.initial_balance})" if st.session_state.initial_balance != 0 else ""
-    
-    st.markdown(f"""
-    <div class='stat-box'>
-        <h3>⚖️ الرصيد النهائي</h3>
-        <h2 class='{balance_class}'>{balance_icon} {balance}</h2>
-        <div style='font-size: 0.9rem; opacity: 0.9;'>{balance_text} بـ {balance_value} يوم {initial_text}</div>
-    </div>
-    """, unsafe_allow_html=True)
+    with col4:
+        balance_class = "positive" if balance >= 0 else "negative"
+        balance_icon = "📈" if balance >= 0 else "📉"
+        balance_text = "مدينة لك" if balance >= 0 else "مدين للشركة"
+        balance_value = abs(balance)
+        
+        balance_title = f"الرصيد في {stats_to}" if stats_to else "الرصيد النهائي"
+        
+        # Show initial balance separately
+        initial_text = f"(ابتدائي: {st.session_state.initial_balance})" if st.session_state.initial_balance != 0 else ""
+        if not leave_rules.is_default:
+            initial_text += " حسب قواعد الرصيد"
+        
+        st.markdown(f"""
+        <div class='stat-box'>
+            <h3>⚖️ {balance_title}</h3>
+            <h2 class='{balance_class}'>{balance_icon} {balance}</h2>
+            <div style='font-size: 0.9rem; opacity: 0.9;'>{balance_text} بـ {balance_value} يوم {initial_text}</div>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    # Holidays and weekends worked, joined against the calendar's per-day flags
+    fixed_worked, movable_worked, weekends_worked = count_work_on(day_state, leave_rules.calendar, *stats_range)
+    if fixed_worked or movable_worked or weekends_worked:
+        st.markdown(f"""
+        <div class='holiday-worked'>
+            🎉 أيام عطل رسمية عملتها: <b>{fixed_worked + movable_worked}</b>
+            (وطنية {fixed_worked}، دينية {movable_worked})
+            &nbsp;•&nbsp; 📅 أيام نهاية الأسبوع عملتها: <b>{weekends_worked}</b>
+        </div>
+        """, unsafe_allow_html=True)
 
-# Analytics charts
+# Analytics charts, built only while shown so plotly is not imported otherwise
 st.markdown("<div class='sub-header'>📈 التحليلات البيانية</div>", unsafe_allow_html=True)
 
-fig_pie, fig_bar = create_analytics_charts(total_w, total_v, total_s, location_stats)
-
-if fig_bar:
+if st.toggle("عرض الرسوم البيانية", value=ANALYTICS_CONFIG.get('show', True), key="show_analytics"):
+    with profile_stage('create_analytics_charts'):
+        fig_pie, fig_bar = cached_analytics_charts(total_w, total_v, total_s, tuple(location_stats.items()))
+        rollup = get_rollup()
+        monthly, month_balances = rollup.monthly, rollup.month_end_balances()
+        fig_months, fig_balance = cached_monthly_charts(
+            rollup_version(monthly, month_balances), st.session_state.initial_balance, monthly, month_balances)
+    
+    if fig_bar:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.plotly_chart(fig_pie, use_container_width=True)
+        with col2:
+            st.plotly_chart(fig_bar, use_container_width=True)
+    else:
+        st.plotly_chart(fig_pie, use_container_width=True)
+    
+    # Monthly charts from the rollup, not from the per-day state
     col1, col2 = st.columns(2)
     with col1:
-        st.plotly_chart(fig_pie, use_container_width=True)
+        st.plotly_chart(fig_months, use_container_width=True)
     with col2:
-        st.plotly_chart(fig_bar, use_container_width=True)
-else:
-    st.plotly_chart(fig_pie, use_container_width=True)
+        st.plotly_chart(fig_balance, use_container_width=True)
 
-# Location statistics
-if location_stats:
-    st.markdown("<div class='sub-header'>🏗️ إحصائيات الورشات</div>", unsafe_allow_html=True)
-    
-    loc_cols = st.columns(3)
-    locations_list = list(location_stats.items())
+# Rotation projection alongside the recorded history
+projections = []
+if st.session_state.projection_enabled:
+    st.markdown("<div class='sub-header'>🔮 توقع الرصيد</div>", unsafe_allow_html=True)
+    try:
+        projection_cache = get_projections()
+        projections = projection_cache['projections']
+        if not projections:
+            st.info("📝 اختر نمط تناوب وتاريخ توقع بعد اليوم")
+    except ValueError as e:
+        st.error(f"❌ {str(e)}")
     
-    for i, (loc, days) in enumerate(locations_list):
-        with loc_cols[i % 3]:
-            st.markdown(f"""
-            <div style='background: linear-gradient(135deg, #667eea, #764ba2); color: white; padding: 1rem; border-radius: 10px; text-align: center;'>
-                <h4>🔧 {loc or 'غير محدد'}</h4>
-                <h3>{days} يوم</h3>
-                <div style='font-size: 0.8rem;'>{days/total_w*100:.1f}% من إجمالي العمل</div>
-            </div>
-            """, unsafe_allow_html=True)
+    if projections:
+        st.dataframe(lazy_import('pandas').DataFrame([{
+            'النمط': f"{projection.rotation.work_days}/{projection.rotation.off_days}",
+            'أيام العمل': projection.totals[0],
+            'أيام الإجازة': projection.totals[1],
+            'أيام مرضية': projection.totals[2],
+            'الرصيد في النهاية': projection.balance,
+            'أدنى رصيد': projection.lowest_balance,
+        } for projection in projections]), hide_index=True, use_container_width=True)
+        
+        if projection_cache['figure'] is None:
+            with profile_stage('create_analytics_charts'):
+                projection_cache['figure'] = create_projection_chart(
+                    day_state, st.session_state.initial_balance, projections, datetime.date.today(),
+                    rules=leave_rules)
+        st.plotly_chart(projection_cache['figure'], use_container_width=True)
+
+# Location statistics
+with profile_stage('location_cards'):
+    if location_stats:
+        st.markdown("<div class='sub-header'>🏗️ إحصائيات الورشات</div>", unsafe_allow_html=True)
+        
+        loc_cols = st.columns(3)
+        locations_list = list(location_stats.items())
+        
+        for i, (loc, days) in enumerate(locations_list):
+            with loc_cols[i % 3]:
+                st.markdown(f"""
+                <div style='background: linear-gradient(135deg, #667eea, #764ba2); color: white; padding: 1rem; border-radius: 10px; text-align: center;'>
+                    <h4>🔧 {loc or 'غير محدد'}</h4>
+                    <h3>{days} يوم</h3>
+                    <div style='font-size: 0.8rem;'>{days/total_w*100:.1f}% من إجمالي العمل</div>
+                </div>
+                """, unsafe_allow_html=True)
 
 # Periods display
-col1, col2 = st.columns(2)
+with profile_stage('period_cards'):
+    work_frame = build_period_frame(st.session_state.work_periods)
+    sick_frame = build_period_frame(st.session_state.sick_periods, with_location=False)
 
-with col1:
-    st.markdown("<div class='sub-header'>📋 سجل فترات العمل</div>", unsafe_allow_html=True)
-    
-    if st.session_state.work_periods:
-        for i, (start, end, location) in enumerate(st.session_state.work_periods, 1):
-            days = (end - start).days + 1
-            st.markdown(f"""
-            <div class='period-card'>
-                <div style='display: flex; justify-content: between; align-items: center;'>
-                    <h4>الفترة {i}</h4>
-                    {f"<span class='location-badge'>{location}</span>" if location else ""}
-                </div>
-                <p>📅 من <strong>{start}</strong> إلى <strong>{end}</strong></p>
-                <p>⏱️ المدة: <strong>{days}</strong> يوم</p>
-            </div>
-            """, unsafe_allow_html=True)
-    else:
-        st.info("📝 لا توجد فترات عمل مسجلة بعد")
+    # Filters applied before paging, so only matching rows are sent to the browser
+    filter_col1, filter_col2, filter_col3 = st.columns(3)
+    with filter_col1:
+        filter_from = st.date_input("📅 الفترات بعد", value=None, key="periods_from")
+    with filter_col2:
+        filter_to = st.date_input("📅 الفترات قبل", value=None, key="periods_to")
+    with filter_col3:
+        location_options = sorted(location for location in work_frame['location'].unique() if location)
+        filter_location = st.selectbox("🏗️ الورشة", [None] + location_options,
+                                       format_func=lambda location: "الكل" if location is None else location,
+                                       key="periods_location")
 
-with col2:
-    st.markdown("<div class='sub-header'>🏥 سجل العطل المرضية</div>", unsafe_allow_html=True)
-    
-    if st.session_state.sick_periods:
-        for i, (start, end) in enumerate(st.session_state.sick_periods, 1):
-            days = (end - start).days + 1
-            st.markdown(f"""
-            <div class='period-card'>
-                <h4>عطلة مرضية {i}</h4>
-                <p>📅 من <strong>{start}</strong> إلى <strong>{end}</strong></p>
-                <p>⏱️ المدة: <strong>{days}</strong> يوم</p>
-            </div>
-            """, unsafe_allow_html=True)
-    else:
-        st.info("🏥 لا توجد عطل مرضية مسجلة")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("<div class='sub-header'>📋 سجل فترات العمل</div>", unsafe_allow_html=True)
+        
+        if st.session_state.work_periods:
+            filtered_work = filter_period_frame(work_frame, filter_from, filter_to, filter_location)
+            page_frame, selected_rows = display_period_table(
+                filtered_work, "work_table", ['number', 'start', 'end', 'days', 'location'], selectable=True)
+            
+            if selected_rows:
+                selected = page_frame.iloc[selected_rows[0]]
+                if st.button(f"🗑️ حذف الفترة {selected['number']}", use_container_width=True):
+                    index = find_period_index(st.session_state.work_periods, selected['id'])
+                    if index is not None:
+                        with logged_change(f"حذف فترة العمل {selected['start']} - {selected['end']}"):
+                            period = st.session_state.work_periods.pop(index)
+                            save_data(period_record('delete_work', period, index=index))
+                        st.success("✅ تم حذف فترة العمل")
+                    st.rerun()
+        else:
+            st.info("📝 لا توجد فترات عمل مسجلة بعد")
+
+    with col2:
+        st.markdown("<div class='sub-header'>🏥 سجل العطل المرضية</div>", unsafe_allow_html=True)
+        
+        if st.session_state.sick_periods:
+            filtered_sick = filter_period_frame(sick_frame, filter_from, filter_to)
+            display_period_table(filtered_sick, "sick_table", ['number', 'start', 'end', 'days'])
+        else:
+            st.info("🏥 لا توجد عطل مرضية مسجلة")
 
 # Calendar section
 st.markdown("---")
@@ -631,17 +1464,59 @@ today = datetime.date.today()
 current_year = today.year
 current_month = today.month
 
+# Future days show planned periods as projected; with a projection, the
+# calendar continues into the future with the first rotation instead
+calendar_state, projected_from = None, today + datetime.timedelta(days=1)
+planned = (get_period_index('work').overlapping(projected_from, datetime.date.max)
+           + get_period_index('sick').overlapping(projected_from, datetime.date.max))
+last_year = max([current_year] + [period[1].year for period in planned])
+if projections:
+    calendar_state = projections[0].day_state
+    last_year = max(last_year, st.session_state.projection_horizon.year)
+
 col1, col2, col3 = st.columns([1, 1, 2])
 with col1:
-    selected_year = st.selectbox("السنة", range(st.session_state.contract_start.year, current_year + 1), 
+    selected_year = st.selectbox("السنة", range(st.session_state.contract_start.year, last_year + 1), 
                                index=current_year - st.session_state.contract_start.year)
 with col2:
     selected_month = st.selectbox("الشهر", range(1, 13), index=current_month - 1)
+with col3:
+    show_full_year = st.checkbox("📆 عرض السنة كاملة")
+
+if show_full_year:
+    display_year_calendar(selected_year, projected_from, calendar_state)
+else:
+    display_calendar(selected_year, selected_month, projected_from, calendar_state)
 
-display_calendar(days_dict, selected_year, selected_month)
+# Official statements for HR, generated in the background
+st.markdown("---")
+st.markdown("<div class='sub-header'>📄 الكشوف الرسمية</div>", unsafe_allow_html=True)
+
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    report_kind = st.radio("نوع الكشف", ["monthly", "annual"], horizontal=True, key="report_kind",
+                           format_func=lambda kind: "شهري" if kind == "monthly" else "سنوي")
+with col2:
+    report_year = st.selectbox("سنة الكشف", range(st.session_state.contract_start.year, current_year + 1),
+                               index=current_year - st.session_state.contract_start.year, key="report_year")
+with col3:
+    report_month = st.selectbox("شهر الكشف", range(1, 13), index=current_month - 1, key="report_month",
+                                disabled=report_kind == "annual")
+with col4:
+    report_format = st.selectbox("الصيغة", list(REPORT_FORMAT_NAMES), format_func=REPORT_FORMAT_NAMES.get,
+                                 key="report_format")
+
+if st.button("📄 إنشاء الكشف", use_container_width=True):
+    st.session_state.report_request = (report_year, report_month if report_kind == "monthly" else None, report_format)
+    report_job(*st.session_state.report_request, submit=True)
+if st.session_state.get('report_request'):
+    display_report(*st.session_state.report_request)
 
 # Footer
 st.markdown("---")
 st.markdown("<div style='text-align: center; color: #666; padding: 2rem;'>"
             "⛽ نظام المتابعة الذكية لموظفي سوناطراك - نسخة Streamlit Cloud"
             "</div>", unsafe_allow_html=True)
+
+# Profiling panel, drawn last so its timings include this whole rerun
+finish_profiling()
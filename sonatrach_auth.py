@@ -0,0 +1,150 @@
+"""Local user accounts for the multi-user mode of the Sonatrach tracker.
+
+Users sign in with a password or open a personal token link (?token=...).
+Only PBKDF2 password hashes and SHA-256 token hashes are kept, in a JSON file
+next to the app. Manage accounts with:
+
+    python sonatrach_auth.py add-user ahmed
+    python sonatrach_auth.py token ahmed
+"""
+import argparse
+import getpass
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import sys
+from pathlib import Path
+
+# User names double as data file names, so keep them to safe characters
+USER_NAME_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]{0,63}')
+PASSWORD_ITERATIONS = 200_000
+
+
+def hash_password(password, salt=None, iterations=PASSWORD_ITERATIONS):
+    """Encode a password as 'pbkdf2_sha256$iterations$salt$hash'"""
+    salt = salt or secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('ascii'), iterations)
+    return f'pbkdf2_sha256${iterations}${salt}${digest.hex()}'
+
+def verify_password(password, encoded):
+    """Check a password against hash_password() output"""
+    try:
+        algorithm, iterations, salt, _ = encoded.split('$')
+    except (AttributeError, ValueError):
+        return False
+    if algorithm != 'pbkdf2_sha256':
+        return False
+    return hmac.compare_digest(hash_password(password, salt, int(iterations)), encoded)
+
+def hash_token(token):
+    """Tokens are long random strings, so a plain SHA-256 is enough to store them"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class UserStore:
+    """User accounts in a JSON file, re-read on every call so CLI changes apply at once"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('users', {})
+        except FileNotFoundError:
+            return {}
+
+    def save(self, users):
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'users': users}, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def names(self):
+        return sorted(self.load())
+
+    def add_user(self, name, password):
+        """Create a user or change their password"""
+        if not USER_NAME_PATTERN.fullmatch(name):
+            raise ValueError(f"invalid user name '{name}': use letters, digits, '_', '.' or '-'")
+        users = self.load()
+        users.setdefault(name, {'tokens': []})['password'] = hash_password(password)
+        self.save(users)
+
+    def issue_token(self, name):
+        """Create a sign-in token for a user; only its hash is stored"""
+        users = self.load()
+        if name not in users:
+            raise ValueError(f"unknown user '{name}'")
+        token = secrets.token_urlsafe(24)
+        users[name].setdefault('tokens', []).append(hash_token(token))
+        self.save(users)
+        return token
+
+    def revoke_tokens(self, name):
+        users = self.load()
+        if name not in users:
+            raise ValueError(f"unknown user '{name}'")
+        users[name]['tokens'] = []
+        self.save(users)
+
+    def authenticate(self, name, password):
+        """Return the user name if the password is right, else None"""
+        user = self.load().get(name)
+        if user is None:
+            # Spend the same time as a real check so user names can't be probed
+            verify_password(password, hash_password('', 'unknown-user'))
+            return None
+        return name if verify_password(password, user.get('password')) else None
+
+    def user_for_token(self, token):
+        """Return the user a sign-in token belongs to, or None"""
+        token_hash = hash_token(token)
+        for name, user in self.load().items():
+            if any(hmac.compare_digest(token_hash, stored) for stored in user.get('tokens', [])):
+                return name
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage Sonatrach tracker user accounts')
+    parser.add_argument('--file', default='sonatrach_users.json', help='user accounts file (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add_user = commands.add_parser('add-user', help='create a user or change their password')
+    add_user.add_argument('name')
+    token = commands.add_parser('token', help='print a new sign-in token for a user')
+    token.add_argument('name')
+    revoke = commands.add_parser('revoke', help="revoke all of a user's tokens")
+    revoke.add_argument('name')
+    commands.add_parser('list', help='list users')
+    args = parser.parse_args(argv)
+    store = UserStore(args.file)
+
+    try:
+        if args.command == 'add-user':
+            password = getpass.getpass('Password: ')
+            if password != getpass.getpass('Repeat password: '):
+                print('passwords do not match', file=sys.stderr)
+                return 1
+            store.add_user(args.name, password)
+            print(f'saved {args.name}')
+        elif args.command == 'token':
+            print(f'sign-in link: ?token={store.issue_token(args.name)}')
+        elif args.command == 'revoke':
+            store.revoke_tokens(args.name)
+            print(f'revoked all tokens of {args.name}')
+        elif args.command == 'list':
+            for name in store.names():
+                print(name)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""Backup files for the Sonatrach work-day tracker.
+
+A backup is a stream of JSON lines, optionally gzip or zstd compressed. It
+holds a header with the format version, schema and data version, then the
+settings, then the periods in columnar chunks, and ends with a trailer
+holding the SHA-256 of every line before it. A full backup holds all the
+data. An incremental backup holds only the periods added and removed since
+a base version, and is restored on top of that version. Files are written
+and read line by line:
+
+    python sonatrach_backup.py export sonatrach_data.json full.jsonl.gz
+    python sonatrach_backup.py export sonatrach_data.json week.jsonl.gz --base full.jsonl.gz
+    python sonatrach_backup.py restore sonatrach_data.json full.jsonl.gz week.jsonl.gz
+
+The indented JSON exports of earlier versions, and data files, are still read.
+"""
+import argparse
+import collections
+import datetime
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import sys
+from pathlib import Path
+
+from sonatrach_storage import CorruptDataError, JsonStorage, parse_data, serialize_data
+
+BACKUP_FORMAT = 'sonatrach-backup'
+# Version 1 was a single indented JSON document
+BACKUP_VERSION = 2
+# Columns of each table. Dates are day ordinals; starts are delta-encoded within
+# a chunk, ends are stored as lengths and locations are dictionary-encoded
+BACKUP_SCHEMA = {
+    'settings': ['contract_start', 'initial_balance'],
+    'work': ['start', 'days', 'location'],
+    'sick': ['start', 'days'],
+}
+CHUNK_ROWS = 1024
+COMPRESSION_SUFFIXES = {'none': '.jsonl', 'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+# Files the batch tools pick up from a backups folder, except change logs
+# (sonatrach_history), which are JSON lines too
+BACKUP_PATTERNS = ('*.json', '*.jsonl', '*.jsonl.gz', '*.jsonl.zst')
+AUDIT_LOG_SUFFIX = '.audit.jsonl'
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+class BackupError(ValueError):
+    """The backup is damaged, of an unsupported format or does not apply to this data"""
+
+
+def state_version(state):
+    """Short content hash of a (contract_start, initial_balance, work_periods, sick_periods) state
+
+    Period order does not count, so data restored from an incremental backup
+    has the same version as the data the backup was made from.
+    """
+    data = serialize_data(*state)
+    data['work_periods'] = sorted(data['work_periods'])
+    data['sick_periods'] = sorted(data['sick_periods'])
+    encoded = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+def periods_difference(periods, other):
+    """Periods not in other, in order, counting duplicates"""
+    remaining = collections.Counter(other)
+    difference = []
+    for period in periods:
+        if remaining[period]:
+            remaining[period] -= 1
+        else:
+            difference.append(period)
+    return difference
+
+def encode_periods(table, op, periods):
+    """Yield 'work' or 'sick' periods as columnar chunks of up to CHUNK_ROWS rows"""
+    for offset in range(0, len(periods), CHUNK_ROWS):
+        rows = periods[offset:offset + CHUNK_ROWS]
+        starts = [period[0].toordinal() for period in rows]
+        chunk = {
+            'table': table,
+            'op': op,
+            'start': [start - previous for start, previous in zip(starts, [0] + starts)],
+            'days': [(period[1] - period[0]).days for period in rows],
+        }
+        if table == 'work':
+            locations = {}
+            chunk['location'] = [locations.setdefault(period[2], len(locations)) for period in rows]
+            chunk['locations'] = list(locations)
+        yield chunk
+
+def decode_periods(chunk):
+    """Turn a columnar chunk back into period tuples"""
+    if len(chunk['start']) != len(chunk['days']):
+        raise BackupError(f"chunk of table '{chunk['table']}' has columns of different lengths")
+    starts = [datetime.date.fromordinal(start) for start in itertools.accumulate(chunk['start'])]
+    ends = [start + datetime.timedelta(days=days) for start, days in zip(starts, chunk['days'])]
+    if chunk['table'] == 'sick':
+        return list(zip(starts, ends))
+    if chunk['table'] != 'work' or len(chunk['location']) != len(starts):
+        raise BackupError(f"unexpected chunk of table '{chunk['table']}'")
+    locations = chunk['locations']
+    return [(start, end, locations[code]) for start, end, code in zip(starts, ends, chunk['location'])]
+
+def compressed_writer(fileobj, compression):
+    """Wrap a binary file in a compressor; closing the wrapper leaves fileobj open"""
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', mtime=0)
+    if compression == 'zstd':
+        import zstandard  # Optional dependency, only needed for zstd backups
+        return zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+    if compression == 'none':
+        return None
+    raise ValueError(f"unknown compression '{compression}', use one of {', '.join(COMPRESSION_SUFFIXES)}")
+
+def compressed_reader(fileobj):
+    """Wrap a seekable binary file in the decompressor its first bytes call for"""
+    magic = fileobj.read(4)
+    fileobj.seek(0)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if magic == ZSTD_MAGIC:
+        import zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False))
+    return fileobj
+
+def write_backup(fileobj, state, base_state=None, compression='gzip'):
+    """Stream a backup of state to a binary file and return its header
+
+    With base_state the backup is incremental and holds only the periods
+    added and removed since then.
+    """
+    contract_start, initial_balance, work_periods, sick_periods = state
+    header = {
+        'format': BACKUP_FORMAT,
+        'format_version': BACKUP_VERSION,
+        'kind': 'full',
+        'version': state_version(state),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'compression': compression,
+        'schema': BACKUP_SCHEMA,
+    }
+    if base_state is None:
+        chunks = itertools.chain(encode_periods('work', 'add', work_periods), encode_periods('sick', 'add', sick_periods))
+    else:
+        header.update(kind='incremental', base=state_version(base_state))
+        chunks = itertools.chain(
+            encode_periods('work', 'remove', periods_difference(base_state[2], work_periods)),
+            encode_periods('sick', 'remove', periods_difference(base_state[3], sick_periods)),
+            encode_periods('work', 'add', periods_difference(work_periods, base_state[2])),
+            encode_periods('sick', 'add', periods_difference(sick_periods, base_state[3])),
+        )
+    settings = {'settings': [contract_start.isoformat() if contract_start else None, initial_balance]}
+
+    stream = compressed_writer(fileobj, compression)
+    digest = hashlib.sha256()
+    try:
+        for record in itertools.chain([header, settings], chunks):
+            line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+            digest.update(line)
+            (stream or fileobj).write(line)
+        trailer = {'checksum': f'sha256:{digest.hexdigest()}'}
+        (stream or fileobj).write((json.dumps(trailer) + '\n').encode('utf-8'))
+    finally:
+        if stream is not None:
+            stream.close()
+    return header
+
+def read_backup(fileobj, base_state=None):
+    """Read and validate a backup from a seekable binary file; returns (state, header)
+
+    Incremental backups are applied to base_state, which must be the version
+    they were made from. Nothing is returned unless the schema, checksum and
+    resulting data version all check out.
+    """
+    try:
+        stream = compressed_reader(fileobj)
+        first = stream.readline()
+        try:
+            header = json.loads(first)
+        except ValueError:
+            header = None
+        if not (isinstance(header, dict) and header.get('format') == BACKUP_FORMAT):
+            # Version 1 exports and data files: one JSON document
+            return parse_data(json.loads(first + stream.read())), {'format_version': 1, 'kind': 'full'}
+        return read_backup_lines(stream, first, header, base_state)
+    except BackupError:
+        raise
+    except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError, IndexError) as e:
+        raise BackupError(f'{type(e).__name__}: {e}') from e
+
+def read_backup_lines(stream, first, header, base_state):
+    """Read the lines after a version 2 header; see read_backup()"""
+    if header.get('format_version', 0) > BACKUP_VERSION:
+        raise BackupError(f"backup format version {header['format_version']} is newer than this program supports")
+    if header.get('schema') != BACKUP_SCHEMA:
+        raise BackupError('backup schema does not match this program')
+    if header.get('kind') == 'incremental':
+        if base_state is None:
+            raise BackupError('incremental backup needs the data it was made from')
+        if state_version(base_state) != header['base']:
+            raise BackupError(f"incremental backup applies to version {header['base']}, "
+                              f"not to {state_version(base_state)}")
+    elif header.get('kind') != 'full':
+        raise BackupError(f"unknown backup kind '{header.get('kind')}'")
+
+    digest = hashlib.sha256(first)
+    settings = checksum = None
+    periods = {(op, table): [] for op in ('add', 'remove') for table in ('work', 'sick')}
+    for line in stream:
+        record = json.loads(line)
+        if 'checksum' in record:
+            checksum = record['checksum']
+            break
+        digest.update(line)
+        if 'settings' in record:
+            settings = record['settings']
+        else:
+            periods[record['op'], record['table']].extend(decode_periods(record))
+    if checksum != f'sha256:{digest.hexdigest()}':
+        raise BackupError('checksum mismatch: the backup is damaged or incomplete')
+    if settings is None:
+        raise BackupError('backup has no settings')
+
+    work_periods, sick_periods = periods['add', 'work'], periods['add', 'sick']
+    if header['kind'] == 'incremental':
+        work_periods = periods_difference(base_state[2], periods['remove', 'work']) + work_periods
+        sick_periods = periods_difference(base_state[3], periods['remove', 'sick']) + sick_periods
+    contract_start = datetime.date.fromisoformat(settings[0]) if settings[0] else None
+    state = (contract_start, settings[1], work_periods, sick_periods)
+    if state_version(state) != header['version']:
+        raise BackupError('restored data does not match the backup version')
+    return state, header
+
+def load_backup(path, base_state=None):
+    """read_backup() from a file path"""
+    with open(path, 'rb') as f:
+        return read_backup(f, base_state)
+
+def load_data_file(path):
+    """State of a data file, with its journal replayed, or of a full backup; never moves the file
+
+    Raises BackupError (a ValueError) for a damaged file.
+    """
+    path = Path(path)
+    if path.suffix.lower() == '.json':
+        path.stat()  # A missing file is an error here, not new empty data
+        try:
+            return JsonStorage(path).load(move_corrupt=False)
+        except CorruptDataError as e:
+            raise BackupError(f'damaged data file: {e}') from e
+    return load_backup(path)[0]
+
+def backup_paths(folder):
+    """Data and backup files of a folder, sorted, without change logs"""
+    return sorted(path for pattern in BACKUP_PATTERNS for path in Path(folder).glob(pattern)
+                  if not path.name.endswith(AUDIT_LOG_SUFFIX))
+
+def backup_file_name(header, date=None):
+    """Download name of a backup, e.g. sonatrach_backup_2024-05-01_1a2b3c4d.jsonl.gz"""
+    kind = '_incremental' if header['kind'] == 'incremental' else ''
+    suffix = COMPRESSION_SUFFIXES[header['compression']]
+    return f"sonatrach_backup_{date or datetime.date.today()}_{header['version'][:8]}{kind}{suffix}"
+
+def backup_stem(path):
+    """File name without its backup or data file suffix, e.g. 'ahmed' for ahmed.jsonl.gz"""
+    name = Path(path).name
+    for suffix in (*COMPRESSION_SUFFIXES.values(), '.json'):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return Path(path).stem
+
+def compression_for(path):
+    """Compression implied by a backup file name"""
+    name = str(path).lower()
+    if name.endswith('.gz'):
+        return 'gzip'
+    if name.endswith('.zst'):
+        return 'zstd'
+    return 'none'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sonatrach tracker backups')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='write a full or incremental backup of a data file')
+    export.add_argument('source', help='sonatrach_data.json (its journal is replayed) or a full backup')
+    export.add_argument('output', help='backup to write: .jsonl, .jsonl.gz or .jsonl.zst')
+    export.add_argument('--base', help='full backup to make an incremental backup against')
+    export.add_argument('--compression', choices=list(COMPRESSION_SUFFIXES), help='default: from the output name')
+    restore = commands.add_parser('restore', help='restore a full backup and the incremental backups after it')
+    restore.add_argument('output', help='data file to write')
+    restore.add_argument('backups', nargs='+', help='full backup first, then incremental backups in order')
+    info = commands.add_parser('info', help='validate a backup and print its header')
+    info.add_argument('backup')
+    info.add_argument('--base', help='full backup an incremental backup applies to')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'export':
+            state = load_data_file(args.source)
+            base_state = load_backup(args.base)[0] if args.base else None
+            with open(args.output, 'wb') as f:
+                header = write_backup(f, state, base_state, args.compression or compression_for(args.output))
+            print(f"{header['kind']} backup of version {header['version']} written to {args.output}")
+        elif args.command == 'restore':
+            state = None
+            for path in args.backups:
+                state, header = load_backup(path, state)
+            JsonStorage(args.output).save(state)
+            print(f"restored version {header.get('version', 'v1')} to {args.output}")
+        elif args.command == 'info':
+            base_state = load_backup(args.base)[0] if args.base else None
+            state, header = load_backup(args.backup, base_state)
+            for key in ('format_version', 'kind', 'version', 'base', 'created', 'compression'):
+                if key in header:
+                    print(f'{key}: {header[key]}')
+            print(f'work periods: {len(state[2])}, sick periods: {len(state[3])}')
+    except (BackupError, OSError) as e:
+        print(f'invalid backup: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""Benchmarks for the day-calculation, statistics and rendering hot paths.
+
+Synthetic histories of growing size run through the headless engine and
+views; each stage reports its time and peak memory. Results can be saved as
+a baseline and compared against on later commits:
+
+    python sonatrach_bench.py --save bench_baseline.json
+    python sonatrach_bench.py --compare bench_baseline.json
+
+--imports adds the cold import time of the app's dependencies, which
+dominates start-up of the Streamlit server and the frozen EXE. Every run also checks the engines against a plain day-by-day reference.
+"""
+import argparse
+import calendar
+import datetime
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from sonatrach_calendar import WorkCalendar, count_work_on
+from sonatrach_core import (
+    DAY_TYPE_CODES, build_day_state, calculate_interval_statistics, day_state_statistics, monthly_rollup, resolve_days,
+    slice_days,
+)
+from sonatrach_periods import PeriodIndex
+from sonatrach_views import create_analytics_charts, create_monthly_charts, render_month_table, render_year_table
+
+# (contract years, periods, distinct locations) of each synthetic history
+BENCH_CASES = [
+    (1, 10, 3),
+    (5, 100, 10),
+    (10, 500, 25),
+    (20, 2000, 100),
+    (30, 5000, 500),
+]
+QUICK_CASES = BENCH_CASES[:3]
+BENCH_AS_OF = datetime.date(2025, 12, 31)
+# Modules whose cold import time is reported with --imports
+IMPORT_MODULES = [
+    'streamlit', 'numpy', 'pandas', 'plotly.express', 'sonatrach_core', 'sonatrach_storage', 'sonatrach_views',
+]
+
+
+def synthetic_history(years, periods, locations, seed=0):
+    """Build a reproducible (contract_start, initial_balance, work_periods, sick_periods) history
+
+    Starts fall anywhere from a month before the contract to two months after
+    BENCH_AS_OF, so clipping, overlaps and future periods are all exercised.
+    """
+    rng = random.Random(f'{years}-{periods}-{locations}-{seed}')
+    contract_start = BENCH_AS_OF - datetime.timedelta(days=365 * years)
+    span = (BENCH_AS_OF - contract_start).days + 90
+    names = [''] + [f'RIG {number}' for number in range(1, locations + 1)]
+    work_periods = []
+    sick_periods = []
+    for _ in range(periods):
+        start = contract_start + datetime.timedelta(days=rng.randrange(span) - 30)
+        if rng.random() < 0.1:
+            sick_periods.append((start, start + datetime.timedelta(days=rng.randrange(10))))
+        else:
+            work_periods.append((start, start + datetime.timedelta(days=rng.randrange(28)), rng.choice(names)))
+    return contract_start, rng.randrange(-10, 30), work_periods, sick_periods
+
+def reference_days(contract_start, work_periods, sick_periods, today):
+    """Day-by-day {date: (type, location)} map, the tracker's original algorithm"""
+    all_days = {}
+    current = contract_start
+    while current <= today:
+        all_days[current] = ('V', '')
+        current += datetime.timedelta(days=1)
+    for start_date, end_date, location in work_periods:
+        current = start_date
+        while current <= end_date:
+            if current in all_days:
+                all_days[current] = ('W', location)
+            current += datetime.timedelta(days=1)
+    for start_date, end_date in sick_periods:
+        current = start_date
+        while current <= end_date:
+            if current in all_days:
+                all_days[current] = ('S', '')
+            current += datetime.timedelta(days=1)
+    return all_days
+
+def reference_statistics(all_days, initial_balance):
+    """Totals, balance and per-location work days of a reference day map"""
+    types = [day_type for day_type, _ in all_days.values()]
+    total_w, total_v, total_s = types.count('W'), types.count('V'), types.count('S')
+    location_stats = {}
+    for day_type, location in all_days.values():
+        if day_type == 'W' and location:
+            location_stats[location] = location_stats.get(location, 0) + 1
+    return total_w, total_v, total_s, initial_balance + (total_w - total_v), location_stats
+
+def check_equivalence(history, today=BENCH_AS_OF):
+    """Compare both engines with the reference on one history; returns a list of mismatches"""
+    contract_start, initial_balance, work_periods, sick_periods = history
+    all_days = reference_days(contract_start, work_periods, sick_periods, today)
+    expected = reference_statistics(all_days, initial_balance)
+    mismatches = []
+
+    day_state = build_day_state(contract_start, work_periods, sick_periods, today)
+    days = [(DAY_TYPE_CODES[day_type], day_state.locations[code] if day_type == 1 else '')
+            for day_type, code in zip(day_state.types.tolist(), day_state.location_codes.tolist())]
+    if days != list(all_days.values()):
+        mismatches.append('build_day_state: day types or locations differ')
+    if contract_start <= today:
+        resolved = resolve_days(contract_start, PeriodIndex(work_periods, allow_overlap=True),
+                                PeriodIndex(sick_periods, allow_overlap=True), contract_start, today, today)
+        if slice_days(resolved, contract_start, today) != slice_days(day_state, contract_start, today):
+            mismatches.append('resolve_days: day types or locations differ')
+
+    # Location order matters too: it is the order of the cards and the bar chart
+    for name, statistics in (
+        ('day_state_statistics', day_state_statistics(day_state, initial_balance)),
+        ('calculate_interval_statistics', calculate_interval_statistics(
+            contract_start, initial_balance, work_periods, sick_periods, today)),
+    ):
+        if statistics[:4] != expected[:4] or list(statistics[4].items()) != list(expected[4].items()):
+            mismatches.append(f'{name}: {statistics[:4]} != {expected[:4]}')
+    return mismatches
+
+def measure(func, repeat):
+    """Best and mean wall time over `repeat` calls, plus peak traced memory of one call"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    # Traced separately: tracemalloc slows allocation-heavy code down
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'best': min(timings), 'mean': sum(timings) / len(timings), 'peak_kib': round(peak / 1024, 1)}
+
+def bench_case(years, periods, locations, repeat):
+    """Time every hot-path stage on one synthetic history"""
+    contract_start, initial_balance, work_periods, sick_periods = synthetic_history(years, periods, locations)
+    day_state = build_day_state(contract_start, work_periods, sick_periods, BENCH_AS_OF)
+    statistics = day_state_statistics(day_state, initial_balance)
+    rollup = monthly_rollup(day_state)
+    work_index = PeriodIndex(work_periods, allow_overlap=True)
+    sick_index = PeriodIndex(sick_periods, allow_overlap=True)
+    year, month = BENCH_AS_OF.year, BENCH_AS_OF.month
+    first = datetime.date(year, month, 1)
+    last = datetime.date(year, month, calendar.monthrange(year, month)[1])
+    # The default Friday/Saturday weekend, indexed like the app does at startup
+    work_calendar = WorkCalendar()
+    work_calendar.index = work_calendar.build_index(contract_start.year, year)
+    stages = {
+        'build_day_state': lambda: build_day_state(contract_start, work_periods, sick_periods, BENCH_AS_OF),
+        'day_state_statistics': lambda: day_state_statistics(day_state, initial_balance),
+        'calculate_interval_statistics': lambda: calculate_interval_statistics(
+            contract_start, initial_balance, work_periods, sick_periods, BENCH_AS_OF),
+        'render_month_table': lambda: render_month_table(year, month, *slice_days(day_state, first, last)),
+        'render_year_table': lambda: render_year_table(year, day_state),
+        'count_work_on': lambda: count_work_on(day_state, work_calendar),
+        'resolve_days': lambda: resolve_days(contract_start, work_index, sick_index, first, last, BENCH_AS_OF),
+        'create_analytics_charts': lambda: create_analytics_charts(*statistics[:3], statistics[4]),
+        'monthly_rollup': lambda: monthly_rollup(day_state),
+        'create_monthly_charts': lambda: create_monthly_charts(rollup, initial_balance),
+    }
+    return {stage: measure(func, repeat) for stage, func in stages.items()}
+
+def measure_import(module, repeat):
+    """Best and mean cold import time of a module, each in a fresh interpreter"""
+    code = f'import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)'
+    timings = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                   cwd=Path(__file__).parent)
+        timings.append(float(completed.stdout))
+    return {'best': min(timings), 'mean': sum(timings) / len(timings), 'peak_kib': None}
+
+def case_key(years, periods, locations):
+    return f'{years}y-{periods}p-{locations}l'
+
+def run_benchmarks(cases, repeat):
+    """Benchmark results for each case, keyed by case and stage"""
+    results = {}
+    for years, periods, locations in cases:
+        results[case_key(years, periods, locations)] = bench_case(years, periods, locations, repeat)
+    return results
+
+def compare_results(results, baseline, tolerance):
+    """(case, stage, baseline seconds, seconds) for stages slower than baseline by more than tolerance"""
+    regressions = []
+    for case, stages in results.items():
+        for stage, result in stages.items():
+            previous = baseline.get(case, {}).get(stage)
+            # Sub-0.1ms stages are dominated by timer noise
+            if previous and previous['best'] > 1e-4 and result['best'] > previous['best'] * (1 + tolerance):
+                regressions.append((case, stage, previous['best'], result['best']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Sonatrach tracker hot paths')
+    parser.add_argument('--quick', action='store_true', help='only the small cases')
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per stage (default: %(default)s)')
+    parser.add_argument('--save', metavar='JSON', help='write the results as a baseline file')
+    parser.add_argument('--compare', metavar='JSON', help='report stages slower than this baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown before a stage counts as a regression (default: %(default)s)')
+    parser.add_argument('--no-check', action='store_true', help='skip the equivalence check')
+    parser.add_argument('--imports', action='store_true', help='also time cold imports of the app dependencies')
+    args = parser.parse_args(argv)
+    cases = QUICK_CASES if args.quick else BENCH_CASES
+
+    failed = False
+    if not args.no_check:
+        for years, periods, locations in cases:
+            for seed in range(3):
+                for mismatch in check_equivalence(synthetic_history(years, periods, locations, seed)):
+                    print(f'MISMATCH {case_key(years, periods, locations)} seed {seed}: {mismatch}')
+                    failed = True
+        print('equivalence check ' + ('FAILED' if failed else 'passed'))
+
+    results = run_benchmarks(cases, args.repeat)
+    if args.imports:
+        results['imports'] = {module: measure_import(module, args.repeat) for module in IMPORT_MODULES}
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print(f"{'case':<18} {'stage':<30} {'best ms':>10} {'mean ms':>10} {'peak KiB':>10} {'baseline ms':>12}")
+    for case, stages in results.items():
+        for stage, result in stages.items():
+            previous = baseline.get(case, {}).get(stage)
+            previous_ms = f"{previous['best'] * 1000:.3f}" if previous else '-'
+            peak = result['peak_kib'] if result['peak_kib'] is not None else '-'
+            print(f"{case:<18} {stage:<30} {result['best'] * 1000:>10.3f} {result['mean'] * 1000:>10.3f} "
+                  f"{peak:>10} {previous_ms:>12}")
+
+    if args.compare:
+        regressions = compare_results(results, baseline, args.tolerance)
+        for case, stage, previous, current in regressions:
+            print(f'REGRESSION {case} {stage}: {previous * 1000:.3f} ms -> {current * 1000:.3f} ms')
+        failed = failed or bool(regressions)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'repeat': args.repeat,
+                'results': results,
+            }, f, indent=2)
+        print(f'baseline written to {args.save}')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""Calendar attributes of days for the Sonatrach work-day tracker.
+
+Every day gets a bitmask of weekend, fixed holiday (the same Gregorian date
+every year, or a one-off date) and movable holiday (Islamic holidays, given
+as Hijri dates). Hijri dates are converted with the tabular Islamic
+calendar, which can be a day away from the announced dates; `hijri_offset`
+in the rules file shifts them all. The conversion runs once per holiday and
+year, never per day, and the bitmasks for a range of years are written to an
+index file that the app memory-maps at startup:
+
+    python sonatrach_calendar.py build sonatrach_rules.toml --from 2000 --to 2040
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+from sonatrach_core import DAY_WORK
+
+# Bits of a day's calendar flags
+DAY_WEEKEND, DAY_FIXED_HOLIDAY, DAY_MOVABLE_HOLIDAY = 1, 2, 4
+DAY_HOLIDAY = DAY_FIXED_HOLIDAY | DAY_MOVABLE_HOLIDAY
+
+WEEKDAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+# The Algerian weekend
+DEFAULT_WEEKEND = ('friday', 'saturday')
+
+INDEX_MAGIC = b'SONATRACH-CALENDAR 1\n'
+# The flags start at this byte offset, after the magic line and a JSON header
+INDEX_HEADER_SIZE = 256
+
+# A holiday on `month`/`day` of the Gregorian or Hijri calendar, every year
+# (year None) or in one year only
+Holiday = namedtuple('Holiday', ['name', 'hijri', 'year', 'month', 'day', 'days'])
+
+# Calendar flags of the days from ordinal `first` on; `version` identifies
+# the calendar definition they were built from
+DateIndex = namedtuple('DateIndex', ['first', 'flags', 'version', 'first_year', 'last_year'])
+
+
+class CalendarError(ValueError):
+    """The calendar definition or index file is not valid"""
+
+
+def hijri_to_ordinal(year, month, day):
+    """Gregorian day ordinal of a date of the tabular Islamic calendar"""
+    # Days before the month, whole years before it, leap days, then the epoch
+    # (1 Muharram 1 AH = 622-07-19 proleptic Gregorian)
+    return day + (59 * (month - 1) + 1) // 2 + (year - 1) * 354 + (3 + 11 * year) // 30 + 227014
+
+def parse_holiday(entry, index):
+    field = f'holidays[{index}]'
+    if not isinstance(entry, dict) or ('date' in entry) == ('hijri' in entry):
+        raise CalendarError(f'{field}: needs either a date ("MM-DD" every year or "YYYY-MM-DD") '
+                            f'or a hijri date ("MM-DD")')
+    hijri = 'hijri' in entry
+    value = entry['hijri' if hijri else 'date']
+    text = value.isoformat() if isinstance(value, datetime.date) else str(value)
+    try:
+        if len(text) == 5:
+            year = None
+            month, day = int(text[:2]), int(text[3:])
+            if hijri:
+                if not (1 <= month <= 12 and 1 <= day <= 30):
+                    raise ValueError(text)
+            else:
+                datetime.date(2000, month, day)  # A leap year allows 02-29
+        elif hijri:
+            raise ValueError(text)
+        else:
+            date = datetime.date.fromisoformat(text)
+            year, month, day = date.year, date.month, date.day
+    except ValueError:
+        raise CalendarError(f"{field}: invalid date '{text}'") from None
+    days = entry.get('days', 1)
+    if not isinstance(days, int) or days < 1:
+        raise CalendarError(f'{field}: days must be a positive whole number')
+    return Holiday(entry.get('name', text), hijri, year, month, day, days)
+
+
+class WorkCalendar:
+    """Weekend days and holidays, with the flags of every day taken from a DateIndex"""
+
+    def __init__(self, weekend=DEFAULT_WEEKEND, holidays=(), hijri_offset=0):
+        try:
+            self.weekend = tuple(sorted(WEEKDAY_NAMES.index(str(name).lower()) for name in weekend))
+        except ValueError:
+            raise CalendarError(f"weekend: expected day names, e.g. {list(DEFAULT_WEEKEND)}") from None
+        if isinstance(hijri_offset, bool) or not isinstance(hijri_offset, int):
+            raise CalendarError('hijri_offset: expected a whole number of days')
+        self.holidays = tuple(holidays)
+        self.hijri_offset = hijri_offset
+        self.version = hashlib.sha1(repr((self.weekend, self.holidays, hijri_offset)).encode('utf-8')).hexdigest()[:16]
+        self.index = None
+
+    def holiday_days(self, first_year, last_year):
+        """(ordinal, flag bit, name) of every holiday day in the years first_year to last_year"""
+        first = datetime.date(first_year, 1, 1).toordinal()
+        last = datetime.date(last_year, 12, 31).toordinal()
+        days = []
+        for holiday in self.holidays:
+            if holiday.hijri:
+                # Hijri years are 11 days shorter, so each Gregorian year holds one or two of them
+                years = range((first_year - 622) * 33 // 32 - 1, (last_year - 622) * 33 // 32 + 3)
+                starts = [hijri_to_ordinal(year, holiday.month, holiday.day) + self.hijri_offset for year in years]
+                bit = DAY_MOVABLE_HOLIDAY
+            else:
+                starts = []
+                for year in ([holiday.year] if holiday.year else range(first_year, last_year + 1)):
+                    try:
+                        starts.append(datetime.date(year, holiday.month, holiday.day).toordinal())
+                    except ValueError:
+                        continue  # 02-29 outside leap years
+                bit = DAY_FIXED_HOLIDAY
+            days.extend((start + day, bit, holiday.name) for start in starts for day in range(holiday.days)
+                        if first <= start + day <= last)
+        return sorted(days)
+
+    def build_index(self, first_year, last_year):
+        """Compute the flags of every day of the years first_year to last_year"""
+        first = datetime.date(first_year, 1, 1).toordinal()
+        days = np.arange(first, datetime.date(last_year, 12, 31).toordinal() + 1, dtype=np.int64)
+        flags = np.zeros(len(days), dtype=np.uint8)
+        # Ordinal 1 (0001-01-01) is a Monday
+        flags[np.isin((days - 1) % 7, self.weekend)] |= DAY_WEEKEND
+        for day, bit, _ in self.holiday_days(first_year, last_year):
+            flags[day - first] |= bit
+        return DateIndex(first, flags, self.version, first_year, last_year)
+
+    def open_index(self, path, first_year, last_year, write=False):
+        """Memory-map the index file if it matches this calendar and years, else build it (and write it)"""
+        try:
+            index = read_index(path)
+            if (index.version == self.version and index.first_year <= first_year
+                    and index.last_year >= last_year):
+                self.index = index
+                return index
+        except (OSError, CalendarError):
+            pass
+        index = self.build_index(first_year, last_year)
+        if write:
+            try:
+                write_index(path, index)
+            except OSError:
+                pass  # A read-only install still works from the index in memory
+        self.index = index
+        return index
+
+    def flags(self, days):
+        """Calendar flags of an array of day ordinals"""
+        days = np.asarray(days, dtype=np.int64)
+        if not len(days):
+            return np.zeros(0, dtype=np.uint8)
+        index = self.index
+        lo, hi = int(days.min()), int(days.max())
+        if index is None or lo < index.first or hi >= index.first + len(index.flags):
+            # Days outside the index: rebuild it in memory to cover them too
+            first_year = datetime.date.fromordinal(lo).year
+            last_year = datetime.date.fromordinal(hi).year
+            if index is not None:
+                first_year, last_year = min(first_year, index.first_year), max(last_year, index.last_year)
+            index = self.index = self.build_index(first_year, last_year)
+        return index.flags[days - index.first]
+
+    def range_flags(self, first, last):
+        """Calendar flags of each day from date first to date last"""
+        return self.flags(np.arange(first.toordinal(), last.toordinal() + 1))
+
+
+def calendar_from_config(config):
+    """WorkCalendar from the weekend, hijri_offset and holidays of a rules file"""
+    holidays = [parse_holiday(entry, index) for index, entry in enumerate(config.get('holidays', []))]
+    return WorkCalendar(config.get('weekend', DEFAULT_WEEKEND), holidays, config.get('hijri_offset', 0))
+
+def load_calendar(path):
+    """WorkCalendar of a rules file; the default weekend and no holidays if it does not exist"""
+    try:
+        with open(path, 'rb') as f:
+            return calendar_from_config(tomllib.load(f))
+    except FileNotFoundError:
+        return WorkCalendar()
+    except tomllib.TOMLDecodeError as e:
+        raise CalendarError(f'{Path(path).name}: {e}') from None
+
+def write_index(path, index):
+    """Write a DateIndex as a fixed-size header followed by one flag byte per day"""
+    header = json.dumps({
+        'first': index.first, 'days': len(index.flags), 'version': index.version,
+        'first_year': index.first_year, 'last_year': index.last_year,
+    }).encode('ascii')
+    if len(INDEX_MAGIC) + len(header) + 1 > INDEX_HEADER_SIZE:
+        raise CalendarError('index header too long')
+    path = Path(path)
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'wb') as f:
+        f.write((INDEX_MAGIC + header).ljust(INDEX_HEADER_SIZE - 1) + b'\n')
+        f.write(np.ascontiguousarray(index.flags, dtype=np.uint8).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def read_index(path):
+    """Memory-map an index file written by write_index()"""
+    with open(path, 'rb') as f:
+        head = f.read(INDEX_HEADER_SIZE)
+        size = os.fstat(f.fileno()).st_size
+    if not head.startswith(INDEX_MAGIC):
+        raise CalendarError(f'{Path(path).name}: not a calendar index file')
+    try:
+        header = json.loads(head[len(INDEX_MAGIC):])
+        days = int(header['days'])
+    except (ValueError, KeyError, TypeError):
+        raise CalendarError(f'{Path(path).name}: damaged header') from None
+    if size != INDEX_HEADER_SIZE + days:
+        raise CalendarError(f'{Path(path).name}: truncated')
+    if days:
+        flags = np.memmap(path, dtype=np.uint8, mode='r', offset=INDEX_HEADER_SIZE, shape=(days,))
+    else:
+        flags = np.zeros(0, dtype=np.uint8)  # memmap cannot map zero bytes
+    return DateIndex(int(header['first']), flags, header['version'], header['first_year'], header['last_year'])
+
+def count_work_on(day_state, work_calendar, lo=0, hi=None):
+    """(fixed holidays, movable holidays, weekend days) worked in day offsets [lo, hi) of a day state"""
+    if day_state is None:
+        return 0, 0, 0
+    hi = len(day_state.types) if hi is None else hi
+    if lo >= hi:
+        return 0, 0, 0
+    first = day_state.start.toordinal()
+    flags = work_calendar.flags(np.arange(first + lo, first + hi))[day_state.types[lo:hi] == DAY_WORK]
+    return tuple(int(np.count_nonzero(flags & bit)) for bit in (DAY_FIXED_HOLIDAY, DAY_MOVABLE_HOLIDAY, DAY_WEEKEND))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or show the Sonatrach tracker calendar index')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='write the calendar index file for a range of years')
+    build.add_argument('rules', nargs='?', default='sonatrach_rules.toml', help='rules file with the holidays')
+    build.add_argument('--from', dest='first_year', type=int, default=2000, help='first year (default: %(default)s)')
+    build.add_argument('--to', dest='last_year', type=int, default=2040, help='last year (default: %(default)s)')
+    build.add_argument('--output', default='sonatrach_calendar.idx', help='index file (default: %(default)s)')
+    show = commands.add_parser('show', help="list a year's holidays")
+    show.add_argument('rules', nargs='?', default='sonatrach_rules.toml', help='rules file with the holidays')
+    show.add_argument('--year', type=int, default=datetime.date.today().year, help='year (default: this year)')
+    args = parser.parse_args(argv)
+
+    try:
+        work_calendar = load_calendar(args.rules)
+        if args.command == 'build':
+            if args.first_year > args.last_year:
+                raise CalendarError('--from must not be after --to')
+            index = work_calendar.build_index(args.first_year, args.last_year)
+            write_index(args.output, index)
+            holidays = int(np.count_nonzero(index.flags & DAY_HOLIDAY))
+            print(f'{len(index.flags)} days, {holidays} holidays, written to {args.output}')
+        elif args.command == 'show':
+            for day, bit, name in work_calendar.holiday_days(args.year, args.year):
+                kind = 'movable' if bit == DAY_MOVABLE_HOLIDAY else 'fixed'
+                print(f'{datetime.date.fromordinal(day)}  {kind:7}  {name}')
+    except (OSError, CalendarError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
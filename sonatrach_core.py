@@ -0,0 +1,568 @@
+"""Headless computation core of the Sonatrach work-day tracker.
+
+Everything here works on plain values (dates, period lists) and imports no
+Streamlit, so it can be used by the app, scripts and batch jobs alike.
+Balances for a folder of backup files are computed with:
+
+    python sonatrach_core.py balances backups/ --output balances.csv
+"""
+import argparse
+import csv
+import datetime
+import heapq
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from sonatrach_backup import backup_paths, backup_stem, load_data_file
+
+# Day-type codes stored in the compact day-state array
+DAY_VACATION, DAY_WORK, DAY_SICK = 0, 1, 2
+DAY_TYPE_CODES = 'VWS'
+# Future calendar days with no planned period; never counted in statistics
+DAY_UNTRACKED = -1
+
+# Compact per-day state: int8 day types and int16 location codes indexed by
+# day offset from `start`, with `locations` as the intern table for the codes
+DayState = namedtuple('DayState', ['start', 'types', 'location_codes', 'locations'])
+
+# Day-type counts per calendar month: `months` holds the first day of each
+# month and counts[m, code] the days of type `code` in months[m]
+MonthlyRollup = namedtuple('MonthlyRollup', ['months', 'counts'])
+
+# A recurring rotation: `work_days` on then `off_days` off, with a work block
+# starting on `anchor`; projected work days are booked at `location`
+Rotation = namedtuple('Rotation', ['work_days', 'off_days', 'anchor', 'location'])
+
+# One rotation projected to the horizon: the day state through the horizon,
+# the balance at the end of each of its days, and the projected future totals
+Projection = namedtuple('Projection', ['rotation', 'day_state', 'trajectory', 'totals', 'balance', 'lowest_balance'])
+
+def as_days(value):
+    """Balance as an int when whole, else rounded to two decimals (leave rules may weigh days fractionally)"""
+    value = round(float(value), 2)
+    return int(value) if value.is_integer() else value
+
+def intern_location(location, locations, location_index):
+    """Return the int16 code for a location, adding it to the intern table if new"""
+    code = location_index.get(location)
+    if code is None:
+        code = len(locations)
+        locations.append(location)
+        location_index[location] = code
+    return code
+
+def paint_day_range(day_state, lo, hi, work_periods, sick_periods, location_index):
+    """Paint day offsets [lo, hi) of the day state from the periods, in override order"""
+    first = day_state.start.toordinal()
+    day_state.types[lo:hi] = DAY_VACATION
+    day_state.location_codes[lo:hi] = 0
+    
+    # Mark work days with locations
+    for start_date, end_date, location in work_periods:
+        start = max(start_date.toordinal() - first, lo)
+        end = min(end_date.toordinal() - first + 1, hi)
+        if start < end:
+            day_state.types[start:end] = DAY_WORK
+            day_state.location_codes[start:end] = intern_location(location, day_state.locations, location_index)
+    
+    # Mark sick days
+    for start_date, end_date in sick_periods:
+        start = max(start_date.toordinal() - first, lo)
+        end = min(end_date.toordinal() - first + 1, hi)
+        if start < end:
+            day_state.types[start:end] = DAY_SICK
+            day_state.location_codes[start:end] = 0
+
+def build_day_state(contract_start, work_periods, sick_periods, today=None):
+    """Calculate the compact day state from contract start to today"""
+    if not contract_start:
+        return None
+    
+    today = today or datetime.date.today()
+    length = max(today.toordinal() - contract_start.toordinal() + 1, 0)
+    
+    day_state = DayState(contract_start, np.zeros(length, dtype=np.int8), np.zeros(length, dtype=np.int16), [''])
+    paint_day_range(day_state, 0, length, work_periods, sick_periods, {'': 0})
+    return day_state
+
+def day_state_statistics(day_state, initial_balance):
+    """Calculate statistics from the compact day state"""
+    if day_state is None:
+        return 0, 0, 0, initial_balance, {}
+    
+    counts = np.bincount(day_state.types, minlength=len(DAY_TYPE_CODES))
+    total_v, total_w, total_s = (int(count) for count in counts[:3])
+    
+    # Calculate balance with initial balance
+    balance = initial_balance + (total_w - total_v)
+    
+    # Calculate by location, ordered by first worked day like the calendar
+    work_codes = day_state.location_codes[day_state.types == DAY_WORK]
+    work_codes = work_codes[work_codes != 0]
+    location_days = np.bincount(work_codes, minlength=len(day_state.locations))
+    codes, first_seen = np.unique(work_codes, return_index=True)
+    location_stats = {}
+    for code in codes[np.argsort(first_seen)]:
+        location_stats[day_state.locations[code]] = int(location_days[code])
+    
+    return total_w, total_v, total_s, balance, location_stats
+
+def merge_intervals(intervals):
+    """Sort and merge (start, end) inclusive day intervals, coalescing touching ones"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+def resolve_work_segments(work_periods, first, last):
+    """Split work periods into disjoint (start, end, location) ordinal segments within [first, last].
+
+    Where work periods overlap, the one added last wins, exactly like the
+    repeated assignment in build_day_state().
+    """
+    boundaries = set()
+    events = []
+    for index, (start_date, end_date, location) in enumerate(work_periods):
+        start = max(start_date.toordinal(), first)
+        end = min(end_date.toordinal(), last)
+        if start > end:
+            continue
+        events.append((start, end + 1, index, location))
+        boundaries.add(start)
+        boundaries.add(end + 1)
+
+    events.sort()
+    points = sorted(boundaries)
+    segments = []
+    active = []  # heap of (-index, end_exclusive, location)
+    next_event = 0
+    for point, next_point in zip(points, points[1:]):
+        while next_event < len(events) and events[next_event][0] == point:
+            _, end_exclusive, index, location = events[next_event]
+            heapq.heappush(active, (-index, end_exclusive, location))
+            next_event += 1
+        while active and active[0][1] <= point:
+            heapq.heappop(active)
+        if not active:
+            continue
+        location = active[0][2]
+        if segments and segments[-1][1] == point - 1 and segments[-1][2] == location:
+            segments[-1][1] = next_point - 1
+        else:
+            segments.append([point, next_point - 1, location])
+    return [tuple(segment) for segment in segments]
+
+def subtract_intervals(segments, holes):
+    """Remove sorted, disjoint hole intervals from sorted, disjoint segments"""
+    result = []
+    hole_index = 0
+    for start, end, location in segments:
+        while hole_index < len(holes) and holes[hole_index][1] < start:
+            hole_index += 1
+        cursor = start
+        i = hole_index
+        while i < len(holes) and holes[i][0] <= end:
+            hole_start, hole_end = holes[i]
+            if hole_start > cursor:
+                result.append((cursor, hole_start - 1, location))
+            cursor = max(cursor, hole_end + 1)
+            i += 1
+        if cursor <= end:
+            result.append((cursor, end, location))
+    return result
+
+def calculate_interval_statistics(contract_start, initial_balance, work_periods, sick_periods, today=None):
+    """Calculate statistics from merged period intervals without building a per-day dict.
+
+    Gives the same (total_w, total_v, total_s, balance, location_stats) as
+    day_state_statistics(build_day_state()): sick overrides work, work overrides
+    vacation, and only days from contract start to today are counted.
+    """
+    if not contract_start:
+        return 0, 0, 0, initial_balance, {}
+
+    today = today or datetime.date.today()
+    first = contract_start.toordinal()
+    last = today.toordinal()
+    if first > last:
+        return 0, 0, 0, initial_balance, {}
+
+    sick = merge_intervals(
+        (max(start.toordinal(), first), min(end.toordinal(), last))
+        for start, end in sick_periods
+        if start <= end and start.toordinal() <= last and end.toordinal() >= first
+    )
+    work = subtract_intervals(resolve_work_segments(work_periods, first, last), sick)
+
+    total_s = sum(end - start + 1 for start, end in sick)
+    total_w = 0
+    location_stats = {}
+    for start, end, location in work:
+        days = end - start + 1
+        total_w += days
+        if location:
+            location_stats[location] = location_stats.get(location, 0) + days
+    total_v = (last - first + 1) - total_w - total_s
+
+    balance = initial_balance + (total_w - total_v)
+    return total_w, total_v, total_s, balance, location_stats
+
+def normalize_history(work_periods, sick_periods):
+    """Rewrite periods as the smallest equivalent set, keeping every day's type and location
+
+    Overlapping work periods are split the way build_day_state() resolves
+    them, adjacent work periods at the same location are coalesced and
+    overlapping or adjacent sick periods are merged.
+    """
+    work_periods = [period for period in work_periods if period[0] <= period[1]]
+    sick_periods = [period for period in sick_periods if period[0] <= period[1]]
+    
+    normalized_work = []
+    if work_periods:
+        first = min(start for start, _, _ in work_periods).toordinal()
+        last = max(end for _, end, _ in work_periods).toordinal()
+        normalized_work = [
+            (datetime.date.fromordinal(start), datetime.date.fromordinal(end), location)
+            for start, end, location in resolve_work_segments(work_periods, first, last)
+        ]
+    normalized_sick = [
+        (datetime.date.fromordinal(start), datetime.date.fromordinal(end))
+        for start, end in merge_intervals((start.toordinal(), end.toordinal()) for start, end in sick_periods)
+    ]
+    return normalized_work, normalized_sick
+
+def count_day_range(day_state, lo, hi):
+    """Count day types and worked days per location code in day offsets [lo, hi)"""
+    types = day_state.types[lo:hi]
+    codes = day_state.location_codes[lo:hi]
+    type_counts = np.bincount(types, minlength=len(DAY_TYPE_CODES))
+    work_codes = codes[(types == DAY_WORK) & (codes != 0)]
+    return type_counts, np.bincount(work_codes, minlength=len(day_state.locations))
+
+def slice_days(day_state, first, last):
+    """Read day types and location names for dates [first, last] from the day state
+
+    Returns the number of leading days before the tracked range and the
+    types and locations of the tracked days that follow.
+    """
+    if day_state is None:
+        return last.toordinal() - first.toordinal() + 1, [], []
+    offset = first.toordinal() - day_state.start.toordinal()
+    lo = max(offset, 0)
+    hi = max(min(last.toordinal() - day_state.start.toordinal() + 1, len(day_state.types)), lo)
+    types = day_state.types[lo:hi].tolist()
+    locations = [day_state.locations[code] for code in day_state.location_codes[lo:hi].tolist()]
+    return lo - offset, types, locations
+
+def resolve_days(contract_start, work_index, sick_index, first, last, today=None):
+    """Day state of just the dates [first, last], painted from the periods overlapping them
+
+    work_index and sick_index are PeriodIndex objects, so the cost depends on
+    the length of the range, not of the history; overlapping work periods are
+    painted in the order they were added, like build_day_state(). Days after today are
+    DAY_UNTRACKED unless a planned period covers them.
+    """
+    if not contract_start or last < contract_start:
+        return None
+    today = today or datetime.date.today()
+    start = max(first, contract_start)
+    length = last.toordinal() - start.toordinal() + 1
+    
+    day_state = DayState(start, np.zeros(length, dtype=np.int8), np.zeros(length, dtype=np.int16), [''])
+    paint_day_range(day_state, 0, length, work_index.overlapping_in_order(start, last),
+                    sick_index.overlapping(start, last), {'': 0})
+    future = day_state.types[max(today.toordinal() - start.toordinal() + 1, 0):]
+    future[future == DAY_VACATION] = DAY_UNTRACKED
+    return day_state
+
+def monthly_rollup(day_state):
+    """Count the day types of each calendar month covered by the day state"""
+    if day_state is None or not len(day_state.types):
+        return MonthlyRollup([], np.zeros((0, len(DAY_TYPE_CODES)), dtype=np.int32))
+    first_month = np.datetime64(day_state.start, 'M')
+    days = np.datetime64(day_state.start, 'D') + np.arange(len(day_state.types))
+    month_index = (days.astype('datetime64[M]') - first_month).astype(np.int64)
+    month_count = int(month_index[-1]) + 1
+    counts = np.bincount(month_index * len(DAY_TYPE_CODES) + day_state.types,
+                         minlength=month_count * len(DAY_TYPE_CODES))
+    months = (first_month + np.arange(month_count)).astype('datetime64[D]').tolist()
+    return MonthlyRollup(months, counts.reshape(month_count, len(DAY_TYPE_CODES)).astype(np.int32))
+
+
+class DayRollup:
+    """Prefix sums over a day state that answer date-range statistics in constant time
+
+    Day-type totals and balances come from per-day prefix sums. Location
+    breakdowns take whole months from per-month prefix sums and count the at
+    most two partial months at the ends of the range directly, so no query
+    scans the history. Balances follow the leave rules when given (see
+    sonatrach_rules), else the default of +1 per work and -1 per vacation day.
+    """
+
+    def __init__(self, day_state, initial_balance=0, rules=None):
+        self.day_state = day_state
+        self.initial_balance = initial_balance
+        self.rules = rules
+        self.monthly = monthly_rollup(day_state)
+        if day_state is None:
+            day_state = DayState(None, np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int16), [''])
+        self.start = day_state.start
+        self.length = len(day_state.types)
+        
+        # type_prefix[code, i]: days of type `code` in offsets [0, i)
+        self.type_prefix = np.zeros((len(DAY_TYPE_CODES), self.length + 1), dtype=np.int32)
+        for code in range(len(DAY_TYPE_CODES)):
+            np.cumsum(day_state.types == code, out=self.type_prefix[code, 1:])
+        # balance_prefix[i]: balance change over offsets [0, i) under the rules
+        self.balance_prefix = None
+        if rules is not None and not rules.is_default:
+            self.balance_prefix = np.concatenate(([0.0], np.cumsum(rules.day_weights(day_state))))
+        
+        # month_offsets[m]: offset of the first tracked day of month m, then the end of the state
+        month_lengths = self.monthly.counts.sum(axis=1)
+        self.month_offsets = np.concatenate(([0], np.cumsum(month_lengths)))
+        # location_prefix[m, code]: days worked at `code` in months [0, m)
+        location_count = len(day_state.locations)
+        month_index = np.repeat(np.arange(len(month_lengths)), month_lengths)
+        work_codes = np.where(day_state.types == DAY_WORK, day_state.location_codes, 0).astype(np.int64)
+        per_month = np.bincount(month_index * location_count + work_codes,
+                                minlength=len(month_lengths) * location_count).reshape(-1, location_count)
+        per_month[:, 0] = 0  # Code 0 is work without a location
+        self.location_prefix = np.zeros((len(month_lengths) + 1, location_count), dtype=np.int32)
+        np.cumsum(per_month, axis=0, out=self.location_prefix[1:])
+        
+        # Locations in order of first worked day, as in day_state_statistics()
+        worked = np.flatnonzero(work_codes)
+        codes, first_seen = np.unique(work_codes[worked], return_index=True)
+        self.location_order = codes[np.argsort(first_seen)].tolist()
+    
+    def offsets(self, first=None, last=None):
+        """Day offsets [lo, hi) of the tracked days in [first, last]; None means unbounded"""
+        if self.start is None:
+            return 0, 0
+        lo = 0 if first is None else min(max(first.toordinal() - self.start.toordinal(), 0), self.length)
+        hi = self.length if last is None else min(max(last.toordinal() - self.start.toordinal() + 1, 0), self.length)
+        return lo, max(hi, lo)
+    
+    def month_of(self, offset):
+        """Index of the month holding a day offset"""
+        date = self.start + datetime.timedelta(days=offset)
+        return (date.year - self.start.year) * 12 + date.month - self.start.month
+    
+    def totals(self, first=None, last=None):
+        """(work, vacation, sick) days in [first, last]"""
+        lo, hi = self.offsets(first, last)
+        counts = self.type_prefix[:, hi] - self.type_prefix[:, lo]
+        return int(counts[DAY_WORK]), int(counts[DAY_VACATION]), int(counts[DAY_SICK])
+    
+    def balance_at(self, date=None):
+        """Balance at the end of `date`, counting from the contract start"""
+        _, hi = self.offsets(None, date)
+        if self.balance_prefix is not None:
+            return as_days(self.initial_balance + self.balance_prefix[hi])
+        return self.initial_balance + int(self.type_prefix[DAY_WORK, hi] - self.type_prefix[DAY_VACATION, hi])
+    
+    def month_end_balances(self):
+        """Balance at the end of each month of the monthly rollup"""
+        if self.balance_prefix is not None:
+            return self.initial_balance + self.balance_prefix[self.month_offsets[1:]]
+        counts = self.monthly.counts
+        return self.initial_balance + (counts[:, DAY_WORK] - counts[:, DAY_VACATION]).cumsum()
+    
+    def location_days(self, first=None, last=None):
+        """Days worked per location in [first, last], in order of first worked day"""
+        lo, hi = self.offsets(first, last)
+        if lo == hi:
+            return {}
+        first_month, last_month = self.month_of(lo), self.month_of(hi - 1)
+        if first_month == last_month:
+            counts = count_day_range(self.day_state, lo, hi)[1]
+        else:
+            counts = (self.location_prefix[last_month] - self.location_prefix[first_month + 1]
+                      + count_day_range(self.day_state, lo, self.month_offsets[first_month + 1])[1]
+                      + count_day_range(self.day_state, self.month_offsets[last_month], hi)[1])
+        return {self.day_state.locations[code]: int(counts[code]) for code in self.location_order if counts[code]}
+    
+    def statistics(self, first=None, last=None):
+        """(total_w, total_v, total_s, balance, location_stats) for [first, last]
+
+        The balance is the running balance at the end of the range.
+        """
+        total_w, total_v, total_s = self.totals(first, last)
+        return total_w, total_v, total_s, self.balance_at(last), self.location_days(first, last)
+
+def parse_rotation(text, anchor, location=''):
+    """Parse a 'work/off' rotation such as '28/28' or '14/14'"""
+    try:
+        work_days, off_days = (int(part) for part in text.strip().split('/'))
+    except ValueError:
+        raise ValueError(f"نمط تناوب غير صالح: '{text}' (مثال: 28/28)") from None
+    if work_days <= 0 or off_days < 0:
+        raise ValueError(f"نمط تناوب غير صالح: '{text}' (مثال: 28/28)")
+    return Rotation(work_days, off_days, anchor, location)
+
+def apply_rotation(day_state, rotation, today=None):
+    """Copy of the day state with the rotation filling the unplanned days after today
+
+    Days after today already covered by a work or sick period keep it; only
+    the days left as vacation follow the rotation.
+    """
+    today = today or datetime.date.today()
+    types = day_state.types.copy()
+    location_codes = day_state.location_codes.copy()
+    locations = list(day_state.locations)
+    lo = min(max(today.toordinal() - day_state.start.toordinal() + 1, 0), len(types))
+    
+    ordinals = np.arange(day_state.start.toordinal() + lo, day_state.start.toordinal() + len(types))
+    cycle = rotation.work_days + rotation.off_days
+    on_shift = (ordinals - rotation.anchor.toordinal()) % cycle < rotation.work_days
+    fill = on_shift & (types[lo:] == DAY_VACATION)
+    if fill.any():
+        location_index = {location: code for code, location in enumerate(locations)}
+        types[lo:][fill] = DAY_WORK
+        location_codes[lo:][fill] = intern_location(rotation.location, locations, location_index)
+    return DayState(day_state.start, types, location_codes, locations)
+
+def balance_trajectory(day_state, initial_balance, rules=None):
+    """Balance at the end of each day of the day state"""
+    if rules is not None and not rules.is_default:
+        return initial_balance + np.cumsum(rules.day_weights(day_state))
+    steps = np.zeros(len(day_state.types), dtype=np.int32)
+    steps[day_state.types == DAY_WORK] = 1
+    steps[day_state.types == DAY_VACATION] = -1
+    return initial_balance + np.cumsum(steps)
+
+def project_rotations(contract_start, initial_balance, work_periods, sick_periods, rotations, horizon, today=None,
+                      rules=None):
+    """Project each rotation from tomorrow to `horizon` on top of the recorded and planned periods
+
+    The periods are painted once up to the horizon; each rotation then only
+    fills a copy of the future days, so comparing several is cheap.
+    """
+    today = today or datetime.date.today()
+    base = build_day_state(contract_start, work_periods, sick_periods, horizon)
+    if base is None or horizon <= today:
+        return []
+    lo = min(max(today.toordinal() - contract_start.toordinal() + 1, 0), len(base.types))
+    projections = []
+    for rotation in rotations:
+        day_state = apply_rotation(base, rotation, today)
+        trajectory = balance_trajectory(day_state, initial_balance, rules)
+        counts = np.bincount(day_state.types[lo:], minlength=len(DAY_TYPE_CODES))
+        totals = int(counts[DAY_WORK]), int(counts[DAY_VACATION]), int(counts[DAY_SICK])
+        lowest_balance = as_days(trajectory[lo:].min() if lo < len(trajectory) else trajectory[-1])
+        projections.append(Projection(rotation, day_state, trajectory, totals, as_days(trajectory[-1]), lowest_balance))
+    return projections
+
+
+# Columns of the batch balance summary
+SUMMARY_COLUMNS = [
+    'employee', 'file', 'contract_start', 'initial_balance', 'work_periods', 'sick_periods',
+    'total_w', 'total_v', 'total_s', 'balance', 'error',
+]
+
+def summarize_backup(path, today=None, rules=None):
+    """Load one backup or data file and compute its totals as a summary row"""
+    path = Path(path)
+    row = dict.fromkeys(SUMMARY_COLUMNS)
+    row.update(employee=backup_stem(path), file=str(path))
+    try:
+        # Data files have their journal replayed, so journal mode counts changes not yet in the snapshot
+        contract_start, initial_balance, work_periods, sick_periods = load_data_file(path)
+    except (OSError, ValueError) as e:
+        # Files are read-only here: report damaged files instead of moving them aside
+        row['error'] = f'{type(e).__name__}: {e}'
+        return row
+    
+    total_w, total_v, total_s, balance, _ = calculate_interval_statistics(
+        contract_start, initial_balance, work_periods, sick_periods, today)
+    if rules is not None and not rules.is_default and contract_start:
+        day_state = build_day_state(contract_start, work_periods, sick_periods, today)
+        balance = as_days(initial_balance + rules.day_weights(day_state).sum())
+    row.update(
+        contract_start=contract_start.isoformat() if contract_start else None,
+        initial_balance=initial_balance,
+        work_periods=len(work_periods),
+        sick_periods=len(sick_periods),
+        total_w=total_w,
+        total_v=total_v,
+        total_s=total_s,
+        balance=balance,
+    )
+    return row
+
+def summarize_backups(paths, today=None, workers=None, chunksize=64, rules=None):
+    """Compute summary rows for many backup files in a process pool, in input order"""
+    paths = list(paths)
+    if workers == 1 or len(paths) < 2 * chunksize:
+        return [summarize_backup(path, today, rules) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(summarize_backup, paths, [today] * len(paths), [rules] * len(paths), chunksize=chunksize))
+
+def write_summary(rows, output_path):
+    """Write summary rows as CSV, or as Parquet when output_path ends in .parquet"""
+    output_path = Path(output_path)
+    if output_path.suffix.lower() == '.parquet':
+        import pandas as pd  # Parquet needs pandas plus pyarrow or fastparquet
+        pd.DataFrame(rows, columns=SUMMARY_COLUMNS).to_parquet(output_path, index=False)
+        return
+    with open(output_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sonatrach tracker batch computations')
+    commands = parser.add_subparsers(dest='command', required=True)
+    balances = commands.add_parser('balances', help='compute balances for a folder of backup files')
+    balances.add_argument('folder', help='folder of full sonatrach_backup_* / sonatrach_data.json files')
+    balances.add_argument('--output', default='balances.csv', help='CSV or .parquet summary (default: %(default)s)')
+    balances.add_argument('--as-of', type=datetime.date.fromisoformat, help='count days up to this date, e.g. month end')
+    balances.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: CPU count)')
+    balances.add_argument('--rules', default='sonatrach_rules.toml', help='leave rules file (default: %(default)s)')
+    query = commands.add_parser('query', help='statistics of one data or full backup file for a date range')
+    query.add_argument('file', help='sonatrach_data.json or a backup file')
+    query.add_argument('--from', dest='first', type=datetime.date.fromisoformat, help='first day of the range')
+    query.add_argument('--to', dest='last', type=datetime.date.fromisoformat, help='last day of the range')
+    query.add_argument('--as-of', type=datetime.date.fromisoformat, help='count days up to this date')
+    query.add_argument('--rules', default='sonatrach_rules.toml', help='leave rules file (default: %(default)s)')
+    args = parser.parse_args(argv)
+    
+    from sonatrach_rules import RulesError, load_rules  # sonatrach_rules imports this module
+    try:
+        rules = load_rules(args.rules)
+    except RulesError as e:
+        print(e, file=sys.stderr)
+        return 1
+    
+    if args.command == 'balances':
+        paths = backup_paths(args.folder)
+        rows = summarize_backups(paths, args.as_of, args.workers, rules=rules)
+        write_summary(rows, args.output)
+        failed = sum(1 for row in rows if row['error'])
+        print(f'{len(rows)} files, {failed} errors, summary written to {args.output}')
+        return 1 if failed else 0
+    if args.command == 'query':
+        try:
+            contract_start, initial_balance, work_periods, sick_periods = load_data_file(args.file)
+        except (OSError, ValueError) as e:
+            print(f'{args.file}: {type(e).__name__}: {e}', file=sys.stderr)
+            return 1
+        rollup = DayRollup(build_day_state(contract_start, work_periods, sick_periods, args.as_of), initial_balance, rules)
+        total_w, total_v, total_s, balance, location_stats = rollup.statistics(args.first, args.last)
+        print(f'work {total_w}, vacation {total_v}, sick {total_s}, balance at end {balance}')
+        for location, days in location_stats.items():
+            print(f'  {location}: {days}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
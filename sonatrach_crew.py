@@ -0,0 +1,237 @@
+"""Crew-wide analytics for supervisors of the Sonatrach work-day tracker.
+
+Every employee's periods are resolved once into disjoint work and sick
+segments, held in flat NumPy columns with one row per segment and the
+employee's row number. Crew views are then whole-array operations: daily
+headcount per location is a difference-array sweep, and balances are
+bincounts. For a crew in a SQLite database or a folder of data files:
+
+    python sonatrach_crew.py sonatrach_data.db --from 2024-01-01 --to 2024-12-31 --minimum 2
+"""
+import argparse
+import datetime
+import os
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from sonatrach_backup import backup_paths, backup_stem, load_data_file
+from sonatrach_core import (
+    DAY_SICK, DAY_VACATION, DAY_WORK, as_days, intern_location, merge_intervals, resolve_work_segments, subtract_intervals,
+)
+from sonatrach_rules import RulesError, load_rules
+from sonatrach_storage import SqliteStorage, state_until
+
+# Disjoint, inclusive day-ordinal segments; `employee` is a row of the crew
+# frame and `location` a code into CrewFrame.locations
+WorkSegments = namedtuple('WorkSegments', ['employee', 'start', 'end', 'location'])
+SickSegments = namedtuple('SickSegments', ['employee', 'start', 'end'])
+
+# A whole crew: per-employee columns (names, contract start ordinals, initial
+# balances) plus the resolved work and sick segments of everyone
+CrewFrame = namedtuple('CrewFrame', ['employees', 'contract_starts', 'initial_balances', 'work', 'sick', 'locations'])
+
+# Per-employee totals up to a day, as arrays aligned with CrewFrame.employees
+CrewBalances = namedtuple('CrewBalances', ['work', 'vacation', 'sick', 'balance'])
+
+
+def build_crew_frame(histories):
+    """Resolve {employee: (contract_start, initial_balance, work_periods, sick_periods)} into a CrewFrame
+
+    Days are resolved as for one employee: sick overrides work, the work
+    period added last wins where periods overlap, and days before the
+    contract start are dropped. Employees without a contract start are left out.
+    """
+    employees, contract_starts, initial_balances = [], [], []
+    work_columns = ([], [], [], [])
+    sick_columns = ([], [], [])
+    locations, location_index = [''], {'': 0}
+    for name, (contract_start, initial_balance, work_periods, sick_periods) in histories.items():
+        if not contract_start:
+            continue
+        row = len(employees)
+        employees.append(name)
+        first = contract_start.toordinal()
+        contract_starts.append(first)
+        initial_balances.append(initial_balance)
+
+        sick = merge_intervals(
+            (max(start.toordinal(), first), end.toordinal())
+            for start, end in sick_periods
+            if start <= end and end.toordinal() >= first
+        )
+        last = max((end.toordinal() for _, end, _ in work_periods), default=first)
+        for start, end, location in subtract_intervals(resolve_work_segments(work_periods, first, last), sick):
+            code = intern_location(location, locations, location_index)
+            for column, value in zip(work_columns, (row, start, end, code)):
+                column.append(value)
+        for start, end in sick:
+            for column, value in zip(sick_columns, (row, start, end)):
+                column.append(value)
+
+    return CrewFrame(
+        employees,
+        np.array(contract_starts, dtype=np.int64),
+        np.array(initial_balances, dtype=np.int64),
+        WorkSegments(*(np.array(column, dtype=np.int64) for column in work_columns)),
+        SickSegments(*(np.array(column, dtype=np.int64) for column in sick_columns)),
+        locations,
+    )
+
+def crew_occupancy(frame, first, last):
+    """Headcount working at each location on each day of [first, last], as a (locations, days) array"""
+    lo = first.toordinal()
+    days = last.toordinal() - lo + 1
+    start = np.maximum(frame.work.start, lo) - lo
+    stop = np.minimum(frame.work.end, last.toordinal()) - lo + 1
+    keep = start < stop
+    # +1 where a segment starts and -1 after it ends, per location; a running
+    # sum along the days then gives the headcount
+    width = days + 1
+    size = len(frame.locations) * width
+    location = frame.work.location[keep] * width
+    diff = (np.bincount(location + start[keep], minlength=size)
+            - np.bincount(location + stop[keep], minlength=size))
+    return np.cumsum(diff.reshape(len(frame.locations), width)[:, :days], axis=1).astype(np.int32)
+
+def crew_day_weights(frame, today, rules):
+    """Per-employee sum of the rules' day weights up to the ordinal `today`
+
+    The segments are expanded into one flat array of tracked days for the
+    whole crew, so the rules are evaluated in one pass as for one employee.
+    """
+    count = len(frame.employees)
+    lengths = np.maximum(today - frame.contract_starts + 1, 0)
+    # offsets[e]: position of employee e's contract start in the flat arrays
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    employee = np.repeat(np.arange(count), lengths)
+    days = np.arange(offsets[-1], dtype=np.int64) - offsets[employee] + frame.contract_starts[employee]
+    types = np.full(offsets[-1], DAY_VACATION, dtype=np.int8)
+    location_codes = np.zeros(offsets[-1], dtype=np.int64)
+    travel = np.zeros(offsets[-1], dtype=bool)
+
+    def positions(segments):
+        end = np.minimum(segments.end, today)
+        keep = segments.start <= end
+        start = segments.start[keep]
+        size = end[keep] - start + 1
+        base = offsets[segments.employee[keep]] + start - frame.contract_starts[segments.employee[keep]]
+        segment = np.repeat(np.arange(len(size)), size)
+        within = np.arange(size.sum()) - np.repeat(np.cumsum(size) - size, size)
+        return keep, base, end[keep], base[segment] + within, segment
+
+    keep, _, _, sick, _ = positions(frame.sick)
+    types[sick] = DAY_SICK
+    keep, base, end, work, segment = positions(frame.work)
+    types[work] = DAY_WORK
+    location_codes[work] = frame.work.location[keep][segment]
+    # Segments are whole stints at one location: travel on their first day, and
+    # on their last unless it is today, as the stint may go on
+    travel[base] = True
+    finished = end < today
+    travel[(base + end - frame.work.start[keep])[finished]] = True
+    weights = rules.evaluate(types, location_codes, days, frame.locations, travel)
+    return np.bincount(employee, weights=weights, minlength=count)
+
+def crew_balances(frame, today=None, rules=None):
+    """Work, vacation and sick days and the balance of every employee up to today"""
+    today = (today or datetime.date.today()).toordinal()
+    count = len(frame.employees)
+
+    def days_until_today(segments):
+        days = np.maximum(np.minimum(segments.end, today) - segments.start + 1, 0)
+        return np.bincount(segments.employee, weights=days, minlength=count).astype(np.int64)
+
+    work = days_until_today(frame.work)
+    sick = days_until_today(frame.sick)
+    tracked = np.maximum(today - frame.contract_starts + 1, 0)
+    vacation = tracked - work - sick
+    if rules is not None and not rules.is_default:
+        balance = np.round(frame.initial_balances + crew_day_weights(frame, today, rules), 2)
+        return CrewBalances(work, vacation, sick, balance)
+    return CrewBalances(work, vacation, sick, frame.initial_balances + work - vacation)
+
+def coverage_gaps(occupancy, first, minimum=1):
+    """Runs of days a location has fewer than `minimum` people, as (location code, first day, last day)"""
+    below = np.zeros((occupancy.shape[0], occupancy.shape[1] + 2), dtype=np.int8)
+    below[:, 1:-1] = occupancy < minimum
+    edges = np.diff(below, axis=1)
+    # Starts and ends come out row by row in day order, so they pair up
+    starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1] - 1
+    lo = first.toordinal()
+    return [
+        (int(code), datetime.date.fromordinal(lo + int(start)), datetime.date.fromordinal(lo + int(end)))
+        for code, start, end in zip(starts[0], starts[1], ends)
+    ]
+
+def load_crew(source, until=None):
+    """Load a crew from a SQLite database, or from a folder of data files (one per employee)
+
+    With `until`, only periods starting by then are kept, which is all that
+    views and balances ending on that day need (see state_until).
+    """
+    source = Path(source)
+    if source.is_file():
+        return SqliteStorage(source, None).load_crew(until)
+    crew = {}
+    for path in backup_paths(source):
+        try:
+            # Read-only: data files have their journal replayed, damaged ones are left in place
+            state = load_data_file(path)
+            crew[backup_stem(path)] = state if until is None else state_until(state, until)
+        except (OSError, ValueError):
+            # Damaged or incremental files are left to the batch tools to report
+            continue
+    return crew
+
+def crew_source_version(source):
+    """Cheap change marker for a crew source: file sizes and modification times"""
+    source = Path(source)
+    if source.is_file():
+        paths = [source, source.with_name(source.name + '-wal')]
+    else:
+        paths = [Path(entry.path) for entry in os.scandir(source) if entry.is_file()] if source.is_dir() else []
+    version = []
+    for path in sorted(paths):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        version.append((path.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(version)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sonatrach tracker crew analytics')
+    parser.add_argument('source', help='sonatrach_data.db or a folder of data/backup files, one per employee')
+    parser.add_argument('--from', dest='first', type=datetime.date.fromisoformat, help='first day (default: 30 days ago)')
+    parser.add_argument('--to', dest='last', type=datetime.date.fromisoformat, help='last day (default: today)')
+    parser.add_argument('--minimum', type=int, default=1, help='headcount below which a location has a gap')
+    parser.add_argument('--rules', default='sonatrach_rules.toml', help='leave rules file (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    last = args.last or datetime.date.today()
+    first = args.first or last - datetime.timedelta(days=29)
+    try:
+        rules = load_rules(args.rules)
+    except RulesError as e:
+        print(e, file=sys.stderr)
+        return 1
+    frame = build_crew_frame(load_crew(args.source, last))
+    occupancy = crew_occupancy(frame, first, last)
+    balances = crew_balances(frame, last, rules)
+    print(f'{len(frame.employees)} employees, {len(frame.locations) - 1} locations, {first} to {last}')
+    for code, location in enumerate(frame.locations):
+        if code and occupancy[code].any():
+            print(f'  {location}: mean {occupancy[code].mean():.1f}, min {occupancy[code].min()}, max {occupancy[code].max()}')
+    for code, gap_first, gap_last in coverage_gaps(occupancy[1:], first, args.minimum):
+        print(f'  gap at {frame.locations[code + 1]}: {gap_first} to {gap_last}')
+    if len(frame.employees):
+        print(f'balances: min {as_days(balances.balance.min())}, median {as_days(np.median(balances.balance))}, '
+              f'max {as_days(balances.balance.max())}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""Undo/redo and the audit log of the Sonatrach work-day tracker.
+
+Every change to the contract start, initial balance, work or sick periods is
+kept as a pair of change records (see sonatrach_storage.period_record): the
+records that make it and the inverse records that take it back. Only what
+changed is stored, so thousands of steps cost memory in proportion to the
+edits, not to copies of the history. The log is appended to a JSON lines
+file next to the data file, undos and redos included, and the data as it was
+at any version is rebuilt by replaying inverse records from the current data:
+
+    python sonatrach_history.py sonatrach_data.json
+    python sonatrach_history.py sonatrach_data.json --at 12
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from sonatrach_backup import load_data_file
+from sonatrach_core import DayRollup, as_days, build_day_state
+from sonatrach_storage import SqliteStorage, apply_journal_record, period_record, settings_record
+
+# One logged change. kind is 'edit', or 'undo'/'redo' of change `target`;
+# records make the change and inverse takes it back, whatever the kind
+Change = namedtuple('Change', ['seq', 'time', 'user', 'kind', 'label', 'records', 'inverse', 'target'])
+
+PERIOD_KINDS = (('work', 2), ('sick', 3))
+
+
+def audit_path(data_path, employee=None):
+    """Audit log of a data file, or of one employee of a SQLite database"""
+    data_path = Path(data_path)
+    if employee is not None:
+        return data_path.with_name(f'{data_path.stem}.{employee}.audit.jsonl')
+    return data_path.with_name(f'{data_path.stem}.audit.jsonl')
+
+def diff_periods(kind, before, after):
+    """(records, inverse) turning the period list before into after
+
+    Only the run between their common prefix and suffix is deleted and
+    re-added, so an append, a deletion or an edit in place costs one or two
+    records however long the lists are.
+    """
+    prefix = 0
+    while prefix < min(len(before), len(after)) and before[prefix] == after[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < min(len(before), len(after)) - prefix
+           and before[len(before) - 1 - suffix] == after[len(after) - 1 - suffix]):
+        suffix += 1
+    removed = before[prefix:len(before) - suffix]
+    added = after[prefix:len(after) - suffix]
+
+    def deletions(periods):
+        # From the last, so the indexes of the others hold
+        return [period_record(f'delete_{kind}', period, index=prefix + i) for i, period in reversed(list(enumerate(periods)))]
+
+    def additions(periods, at_end):
+        # Periods added at the end are appended, which every storage backend can do as a record
+        if at_end:
+            return [period_record(f'add_{kind}', period) for period in periods]
+        return [period_record(f'add_{kind}', period, index=prefix + i) for i, period in enumerate(periods)]
+
+    records = deletions(removed) + additions(added, suffix == 0)
+    inverse = deletions(added) + additions(removed, suffix == 0)
+    return records, inverse
+
+def diff_states(before, after):
+    """(records, inverse) turning a (contract_start, initial_balance, work_periods, sick_periods) state into another"""
+    records, inverse = [], []
+    if tuple(before[:2]) != tuple(after[:2]):
+        records.append(settings_record(*after[:2]))
+        inverse.append(settings_record(*before[:2]))
+    for kind, column in PERIOD_KINDS:
+        kind_records, kind_inverse = diff_periods(kind, before[column], after[column])
+        records += kind_records
+        inverse += kind_inverse
+    return records, inverse
+
+def apply_records(state, records):
+    """A copy of state with the change records applied"""
+    state = [state[0], state[1], list(state[2]), list(state[3])]
+    for record in records:
+        apply_journal_record(state, record)
+    return tuple(state)
+
+
+class ChangeHistory:
+    """The audit log of one employee's data, with undo and redo stacks over it
+
+    Changes are appended to the log file as they are recorded, so the log and
+    the stacks survive restarts; undo and redo entries only name the change
+    they take back or make again. Shared by every session on the same data.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.changes = []
+        self.by_seq = {}
+        self.undo_stack = []
+        self.redo_stack = []
+        self.lock = threading.Lock()
+        if self.path is not None:
+            self.load()
+
+    @property
+    def version(self):
+        """Sequence number of the last change, 0 before any"""
+        return self.changes[-1].seq if self.changes else 0
+
+    def load(self):
+        """Read the log file, skipping torn or damaged lines"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                target = self.by_seq.get(entry.get('target'))
+                if entry['kind'] == 'edit':
+                    records, inverse = entry['records'], entry['inverse']
+                elif target is not None and (entry['kind'], target.seq) in (
+                        ('undo', self.undo_stack[-1] if self.undo_stack else None),
+                        ('redo', self.redo_stack[-1] if self.redo_stack else None)):
+                    records, inverse = (
+                        (target.inverse, target.records) if entry['kind'] == 'undo' else (target.records, target.inverse))
+                else:
+                    continue
+                change = Change(entry['seq'], datetime.datetime.fromisoformat(entry['time']), entry.get('user'),
+                                entry['kind'], entry.get('label', ''), records, inverse, entry.get('target'))
+            except (ValueError, KeyError, TypeError):
+                continue
+            self.append(change)
+
+    def append(self, change):
+        """Add a change to the log and move it between the undo and redo stacks"""
+        self.changes.append(change)
+        self.by_seq[change.seq] = change
+        if change.kind == 'edit':
+            self.undo_stack.append(change.seq)
+            self.redo_stack.clear()
+        elif change.kind == 'undo':
+            self.redo_stack.append(self.undo_stack.pop())
+        else:
+            self.undo_stack.append(self.redo_stack.pop())
+
+    def write(self, change):
+        if self.path is None:
+            return
+        entry = {'seq': change.seq, 'time': change.time.isoformat(timespec='seconds'), 'user': change.user,
+                 'kind': change.kind, 'label': change.label}
+        if change.kind == 'edit':
+            entry.update(records=change.records, inverse=change.inverse)
+        else:
+            entry['target'] = change.target
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def log(self, kind, label, records, inverse, user=None, target=None):
+        change = Change(self.version + 1, datetime.datetime.now(), user, kind, label, records, inverse, target)
+        self.write(change)
+        self.append(change)
+        return change
+
+    def record(self, before, after, label, user=None):
+        """Log the change from state before to after as one undoable step; None if nothing changed"""
+        records, inverse = diff_states(before, after)
+        if not records:
+            return None
+        with self.lock:
+            return self.log('edit', label, records, inverse, user)
+
+    def next_undo(self):
+        """The change undo() would take back, or None"""
+        return self.by_seq[self.undo_stack[-1]] if self.undo_stack else None
+
+    def next_redo(self):
+        """The change redo() would make again, or None"""
+        return self.by_seq[self.redo_stack[-1]] if self.redo_stack else None
+
+    def undo(self, user=None):
+        """Log taking back the last change; returns the logged change, whose records are to be applied"""
+        with self.lock:
+            target = self.next_undo()
+            if target is None:
+                return None
+            return self.log('undo', target.label, target.inverse, target.records, user, target.seq)
+
+    def redo(self, user=None):
+        """Log making the last undone change again; returns the logged change, as for undo()"""
+        with self.lock:
+            target = self.next_redo()
+            if target is None:
+                return None
+            return self.log('redo', target.label, target.records, target.inverse, user, target.seq)
+
+    def state_at(self, state, seq):
+        """The data as it was right after change seq (0: before the first), given the current state"""
+        with self.lock:
+            later = [change for change in self.changes if change.seq > seq]
+        state = [state[0], state[1], list(state[2]), list(state[3])]
+        for change in reversed(later):
+            for record in change.inverse:
+                apply_journal_record(state, record)
+        return tuple(state)
+
+
+def statistics_at(history, state, seq, today=None, rules=None):
+    """(work, vacation, sick, balance) of the data as it was right after change seq"""
+    contract_start, initial_balance, work_periods, sick_periods = history.state_at(state, seq)
+    day_state = build_day_state(contract_start, work_periods, sick_periods, today) if contract_start else None
+    rollup = DayRollup(day_state, initial_balance, rules)
+    return (*rollup.totals(), rollup.balance_at())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show the Sonatrach tracker change log')
+    parser.add_argument('data', help='sonatrach_data.json, or sonatrach_data.db with --employee')
+    parser.add_argument('--employee', help='employee of a SQLite database')
+    parser.add_argument('--at', type=int, help='show the statistics as they were after this change')
+    args = parser.parse_args(argv)
+
+    history = ChangeHistory(audit_path(args.data, args.employee))
+    for change in history.changes:
+        action = change.label if change.kind == 'edit' else f'{change.kind} #{change.target}: {change.label}'
+        print(f'{change.seq:5} {change.time:%Y-%m-%d %H:%M:%S} {change.user or "-":12} {action} '
+              f'({len(change.records)} records)')
+    if args.at is not None:
+        if not 0 <= args.at <= history.version:
+            print(f'no change {args.at} (0 to {history.version})', file=sys.stderr)
+            return 1
+        try:
+            state = SqliteStorage(args.data, args.employee).load() if args.employee else load_data_file(args.data)
+        except (OSError, ValueError) as e:
+            print(f'{args.data}: {type(e).__name__}: {e}', file=sys.stderr)
+            return 1
+        work, vacation, sick, balance = statistics_at(history, state, args.at)
+        print(f'after change {args.at}: {work} work, {vacation} vacation, {sick} sick days, balance {as_days(balance)}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
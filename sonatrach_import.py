@@ -0,0 +1,257 @@
+"""Streaming import of rotation schedules exported as CSV or Excel.
+
+Rows are read in chunks, so a whole-site export is never held in memory at
+once. Each row is validated on its own and errors are reported per row. New
+periods are checked for overlaps against stored and already imported periods,
+and adjacent imported periods are merged. Import into a crew database with:
+
+    python sonatrach_import.py schedule.csv --database sonatrach_data.db
+"""
+import argparse
+import codecs
+import csv
+import datetime
+import sys
+from pathlib import Path
+
+from sonatrach_periods import PeriodIndex, PeriodOverlapError
+from sonatrach_storage import SqliteStorage
+
+# Accepted column headers, compared lower-cased and stripped
+COLUMN_ALIASES = {
+    'employee': ('employee', 'employee_id', 'matricule', 'name', 'الموظف', 'رقم الموظف'),
+    'start': ('start', 'start_date', 'from', 'date_debut', 'من', 'تاريخ البداية'),
+    'end': ('end', 'end_date', 'to', 'date_fin', 'إلى', 'تاريخ النهاية'),
+    'type': ('type', 'day_type', 'kind', 'النوع'),
+    'location': ('location', 'rig', 'site', 'الورشة', 'مكان العمل'),
+}
+WORK_TYPES = ('', 'w', 'work', 'travail', 'عمل')
+SICK_TYPES = ('s', 'sick', 'maladie', 'مرضية', 'عطلة مرضية')
+DATE_FORMATS = ('%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d')
+
+
+class ScheduleImportResult:
+    """Outcome of a schedule import
+
+    employees maps each employee to the (work_periods, sick_periods) imported
+    for them when no sink was given; errors lists (row_number, message).
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.merged = 0
+        self.errors = []
+        self.employees = {}
+
+
+def resolve_columns(header):
+    """Map logical column names to positions in the header row"""
+    positions = {}
+    for position, name in enumerate(header):
+        name = str(name or '').strip().lower()
+        for column, aliases in COLUMN_ALIASES.items():
+            if name in aliases and column not in positions:
+                positions[column] = position
+    missing = [column for column in ('start', 'end') if column not in positions]
+    if missing:
+        raise ValueError(f"أعمدة مفقودة في الملف: {', '.join(missing)}")
+    return positions
+
+def parse_date(value):
+    """Parse a date cell from CSV text or an Excel date/datetime"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    text = str(value or '').strip()
+    try:
+        return datetime.date.fromisoformat(text)
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"تاريخ غير صالح: '{text}'")
+
+def read_rows(source, file_name):
+    """Yield rows of a CSV or Excel file one at a time, header first"""
+    if Path(file_name).suffix.lower() in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook  # Only needed for Excel files
+        workbook = load_workbook(source, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    elif isinstance(source, (str, Path)):
+        with open(source, 'r', encoding='utf-8-sig', newline='') as f:
+            yield from csv.reader(f)
+    else:
+        yield from csv.reader(codecs.iterdecode(source, 'utf-8-sig'))
+
+def read_chunks(rows, chunk_size):
+    """Group (row_number, row) pairs into lists of at most chunk_size"""
+    chunk = []
+    for row_number, row in enumerate(rows, 2):
+        chunk.append((row_number, row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def row_cell(row, columns, column):
+    """Value of a logical column in a row, None when absent"""
+    position = columns.get(column)
+    return row[position] if position is not None and position < len(row) else None
+
+def row_employee(row, columns):
+    """Employee named in a row, '' without an employee column"""
+    return str(row_cell(row, columns, 'employee') or '').strip()
+
+def parse_row(row, columns):
+    """Validate one row and return (employee, kind, period)"""
+    def cell(column):
+        return row_cell(row, columns, column)
+
+    start = parse_date(cell('start'))
+    end = parse_date(cell('end'))
+    if start > end:
+        raise ValueError("تاريخ البداية يجب أن يكون قبل تاريخ النهاية")
+
+    day_type = str(cell('type') or '').strip().lower()
+    employee = row_employee(row, columns)
+    if day_type in WORK_TYPES:
+        return employee, 'W', (start, end, str(cell('location') or '').strip())
+    if day_type in SICK_TYPES:
+        return employee, 'S', (start, end)
+    raise ValueError(f"نوع غير معروف: '{day_type}'")
+
+
+class EmployeeBatch:
+    """Stored and newly imported periods of one employee during an import"""
+
+    def __init__(self, contract_start, work_periods, sick_periods):
+        self.contract_start = contract_start
+        self.stored = {'W': PeriodIndex(), 'S': PeriodIndex()}
+        self.new = {'W': PeriodIndex(), 'S': PeriodIndex()}
+        # Stored history may already contain overlaps; keep the first of each
+        for kind, periods in (('W', work_periods), ('S', sick_periods)):
+            for period in periods:
+                try:
+                    self.stored[kind].add(period, merge_adjacent=False)
+                except PeriodOverlapError:
+                    continue
+
+    def add(self, kind, period):
+        """Add an imported period, returning 'added' or 'merged'"""
+        overlapping = self.stored[kind].overlapping(period[0], period[1])
+        if overlapping:
+            raise PeriodOverlapError(period, overlapping)
+        return self.new[kind].add(period)
+
+
+def import_schedule(source, file_name, contract_start=None, employee=None, load_existing=None,
+                    sink=None, chunk_size=5000, max_errors=1000):
+    """Import a CSV or Excel rotation schedule in chunks
+
+    Only rows for `employee` are kept when given (files without an employee
+    column belong to everyone). load_existing(name) returns the stored
+    (contract_start, work_periods, sick_periods) checked for overlaps;
+    rows before that contract start, or `contract_start`, are rejected.
+    With a sink, sink(name, work_periods, sick_periods) receives each
+    employee's new periods once their block of rows ends and the batch is
+    dropped, which keeps memory bounded for exports grouped by employee.
+    After max_errors errors the import stops, but the periods accepted so far
+    are still flushed, so the counts match what was stored.
+    """
+    result = ScheduleImportResult()
+    rows = read_rows(source, file_name)
+    header = next(rows, None)
+    if header is None:
+        return result
+    columns = resolve_columns(header)
+    batches = {}
+    current = None
+    stopped = False
+
+    def flush(name):
+        batch = batches[name] if sink is None else batches.pop(name)
+        work_periods, sick_periods = list(batch.new['W']), list(batch.new['S'])
+        if sink is not None:
+            sink(name, work_periods, sick_periods)
+        else:
+            result.employees[name] = (work_periods, sick_periods)
+
+    for chunk in read_chunks(rows, chunk_size):
+        for row_number, row in chunk:
+            if not any(cell not in (None, '') for cell in row):
+                continue
+            # Other employees' rows are skipped before validation, so their
+            # errors neither show up nor count towards max_errors
+            if employee is not None and 'employee' in columns and row_employee(row, columns) != employee:
+                continue
+            result.rows += 1
+            try:
+                name, kind, period = parse_row(row, columns)
+                name = employee if employee is not None else name
+                if sink is not None and not name:
+                    raise ValueError("رقم الموظف مفقود")
+
+                if name != current and current is not None and sink is not None:
+                    flush(current)
+                current = name
+                if name not in batches:
+                    stored_start, work_periods, sick_periods = (
+                        load_existing(name) if load_existing else (None, [], []))
+                    batches[name] = EmployeeBatch(stored_start or contract_start, work_periods, sick_periods)
+                batch = batches[name]
+                if batch.contract_start and period[0] < batch.contract_start:
+                    raise ValueError("تاريخ البداية يجب أن يكون بعد تاريخ بداية العقد")
+
+                if batch.add(kind, period) == 'merged':
+                    result.merged += 1
+                else:
+                    result.imported += 1
+            except PeriodOverlapError as e:
+                first = e.overlapping[0]
+                result.errors.append((row_number, f"تتداخل مع الفترة من {first[0]} إلى {first[1]}"))
+            except ValueError as e:
+                result.errors.append((row_number, str(e)))
+            if len(result.errors) >= max_errors:
+                result.errors.append((row_number, "تم إيقاف الاستيراد بسبب كثرة الأخطاء"))
+                stopped = True
+                break
+        if stopped:
+            break
+
+    for name in list(batches):
+        flush(name)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import a CSV/Excel rotation schedule into a crew database')
+    parser.add_argument('schedule', help='CSV or .xlsx file with start, end, type, location and employee columns')
+    parser.add_argument('--database', default='sonatrach_data.db', help='SQLite database (default: %(default)s)')
+    parser.add_argument('--employee', help='import only this employee, or name the employee of a file without an employee column')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='rows read per chunk (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    def load_existing(name):
+        contract_start, _, work_periods, sick_periods = SqliteStorage(args.database, name).load()
+        return contract_start, work_periods, sick_periods
+
+    def sink(name, work_periods, sick_periods):
+        SqliteStorage(args.database, name).add_periods(work_periods, sick_periods)
+
+    result = import_schedule(args.schedule, args.schedule, employee=args.employee, load_existing=load_existing,
+                             sink=sink, chunk_size=args.chunk_size)
+    for row_number, message in result.errors:
+        print(f'row {row_number}: {message}', file=sys.stderr)
+    print(f'{result.rows} rows, {result.imported} periods imported, {result.merged} merged, {len(result.errors)} errors')
+    return 1 if result.errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Sorted period index for overlap detection and merging of adjacent periods.
+
+Periods are (start, end, location) work periods or (start, end) sick periods
+with inclusive dates. A PeriodIndex keeps periods sorted by start date, so
+overlap checks and inserts cost O(log n) bisects plus the periods found.
+"""
+import bisect
+from datetime import timedelta
+
+
+class PeriodOverlapError(ValueError):
+    """The period overlaps periods already in the index"""
+
+    def __init__(self, period, overlapping):
+        super().__init__(f"{period[0]} - {period[1]} overlaps {len(overlapping)} existing period(s)")
+        self.period = period
+        self.overlapping = overlapping
+
+
+class PeriodIndex:
+    """Periods sorted by start date
+
+    Overlaps are rejected on add unless allow_overlap is set, which lets an
+    index be built over an existing history that already contains some.
+    """
+
+    def __init__(self, periods=(), allow_overlap=False):
+        self.starts = []
+        self.periods = []
+        # Longest period seen; bounds how far before `start` an overlapping period can begin
+        self.max_days = 0
+        # Insertion number of each period, to replay overlapping ones in the order they were added
+        self.sequence = {}
+        self.added = 0
+        for period in periods:
+            self.add(period, merge_adjacent=False, allow_overlap=allow_overlap)
+
+    def __len__(self):
+        return len(self.periods)
+
+    def __iter__(self):
+        return iter(self.periods)
+
+    def overlapping(self, start, end):
+        """Periods sharing at least one day with [start, end]"""
+        # No period is longer than max_days, so overlapping ones start in
+        # [start - max_days + 1, end]
+        position = bisect.bisect_left(self.starts, start - timedelta(days=max(self.max_days - 1, 0)))
+        stop = bisect.bisect_right(self.starts, end)
+        return [period for period in self.periods[position:stop] if period[1] >= start]
+
+    def overlapping_in_order(self, start, end):
+        """overlapping() in the order the periods were added, so the last added can win"""
+        return sorted(self.overlapping(start, end), key=self.sequence.__getitem__)
+
+    def add(self, period, merge_adjacent=True, allow_overlap=False):
+        """Insert a period, returning 'added' or 'merged'
+
+        With merge_adjacent, a period that directly follows or precedes one with
+        the same location (or any sick period) is coalesced with it. Raises
+        PeriodOverlapError if the period overlaps an existing one, unless
+        allow_overlap is set.
+        """
+        start, end = period[0], period[1]
+        if not allow_overlap:
+            overlapping = self.overlapping(start, end)
+            if overlapping:
+                raise PeriodOverlapError(period, overlapping)
+
+        position = bisect.bisect_left(self.starts, start)
+        if merge_adjacent:
+            before = self.periods[position - 1] if position else None
+            after = self.periods[position] if position < len(self.periods) else None
+            merge_before = before is not None and before[1] + timedelta(days=1) == start and before[2:] == period[2:]
+            merge_after = after is not None and end + timedelta(days=1) == after[0] and after[2:] == period[2:]
+            if merge_before or merge_after:
+                if merge_after:
+                    end = after[1]
+                    del self.starts[position], self.periods[position]
+                    self.sequence.pop(after, None)
+                if merge_before:
+                    position -= 1
+                    start = before[0]
+                    del self.starts[position], self.periods[position]
+                    self.sequence.pop(before, None)
+                self.starts.insert(position, start)
+                self.periods.insert(position, (start, end, *period[2:]))
+                self.max_days = max(self.max_days, (end - start).days + 1)
+                self.record_added(self.periods[position])
+                return 'merged'
+
+        self.starts.insert(position, start)
+        self.periods.insert(position, tuple(period))
+        self.max_days = max(self.max_days, (end - start).days + 1)
+        self.record_added(self.periods[position])
+        return 'added'
+
+    def record_added(self, period):
+        self.sequence[period] = self.added
+        self.added += 1
+
+    def remove(self, period):
+        """Remove one occurrence of a period; ValueError if it isn't in the index"""
+        position = bisect.bisect_left(self.starts, period[0])
+        while position < len(self.periods) and self.starts[position] == period[0]:
+            if self.periods[position] == tuple(period):
+                del self.starts[position], self.periods[position]
+                # Keep the insertion number while a duplicate of the period remains
+                if tuple(period) not in self.periods[position:bisect.bisect_right(self.starts, period[0])]:
+                    del self.sequence[tuple(period)]
+                return
+            position += 1
+        raise ValueError(f"{period[0]} - {period[1]} is not in the index")
@@ -0,0 +1,200 @@
+"""Per-rerun stage timing for the Sonatrach tracker dashboard.
+
+A RerunProfiler times the named stages of one session's script reruns. Every
+finished rerun is also added to a process-wide registry shared by all
+sessions, which exports Prometheus-style text, and can be appended to a
+JSON lines file for aggregation across servers. Heavy libraries are loaded
+with lazy_import() so their import time is paid, and recorded, only when a
+section needs them.
+"""
+import collections
+import contextlib
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Seconds spent on first imports in this process, by module
+IMPORT_TIMES = {}
+
+
+def record_import_time(name, seconds):
+    """Record an import time once per process; later calls are cached imports"""
+    IMPORT_TIMES.setdefault(name, seconds)
+
+def lazy_import(name):
+    """Import a module on first use, recording how long the import took"""
+    module = sys.modules.get(name)
+    if module is None:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        record_import_time(name, time.perf_counter() - started)
+    return module
+
+
+class ProfileRegistry:
+    """Stage totals across every session of this server process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reruns = 0
+        self.incomplete_reruns = 0
+        # stage -> [calls, total seconds, max seconds]
+        self.stages = {}
+
+    def record(self, record):
+        with self.lock:
+            self.reruns += 1
+            if not record['completed']:
+                self.incomplete_reruns += 1
+            for stage, seconds in record['stages'].items():
+                totals = self.stages.setdefault(stage, [0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += seconds
+                totals[2] = max(totals[2], seconds)
+
+    def prometheus(self):
+        """Totals in the Prometheus text exposition format"""
+        with self.lock:
+            lines = [
+                '# HELP sonatrach_reruns_total Script reruns profiled by this process',
+                '# TYPE sonatrach_reruns_total counter',
+                f'sonatrach_reruns_total {self.reruns}',
+                '# HELP sonatrach_incomplete_reruns_total Reruns stopped before the end of the script',
+                '# TYPE sonatrach_incomplete_reruns_total counter',
+                f'sonatrach_incomplete_reruns_total {self.incomplete_reruns}',
+                '# HELP sonatrach_stage_seconds Time spent in each script stage',
+                '# TYPE sonatrach_stage_seconds summary',
+            ]
+            for stage, (calls, total, _) in sorted(self.stages.items()):
+                lines.append(f'sonatrach_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+                lines.append(f'sonatrach_stage_seconds_count{{stage="{stage}"}} {calls}')
+            lines.append('# HELP sonatrach_stage_seconds_max Slowest run of each script stage')
+            lines.append('# TYPE sonatrach_stage_seconds_max gauge')
+            for stage, (_, _, slowest) in sorted(self.stages.items()):
+                lines.append(f'sonatrach_stage_seconds_max{{stage="{stage}"}} {slowest:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, export_path, record):
+        """Append the rerun to a .jsonl file, or rewrite a Prometheus text file"""
+        export_path = Path(export_path)
+        if export_path.suffix.lower() == '.jsonl':
+            line = json.dumps(record, ensure_ascii=False) + '\n'
+            with self.lock, open(export_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            return
+        text = self.prometheus()
+        temp_path = export_path.with_name(export_path.name + '.tmp')
+        with self.lock:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(temp_path, export_path)
+
+
+REGISTRY = ProfileRegistry()
+
+
+class RerunProfiler:
+    """Stage timings of one session, rerun by rerun"""
+
+    enabled = True
+
+    def __init__(self, session_id, registry=REGISTRY, export_path=None, history=50):
+        self.session_id = session_id
+        self.registry = registry
+        self.export_path = export_path
+        self.reruns = 0
+        self.rerun_started = collections.deque(maxlen=history)
+        self.history = collections.deque(maxlen=history)
+        # stage -> [calls, total seconds, max seconds, last seconds]
+        self.stages = {}
+        self.current = None
+        self.started = None
+
+    def begin_rerun(self):
+        """Start timing a rerun, closing one that was stopped early (st.stop / st.rerun)"""
+        if self.current is not None:
+            self.end_rerun(completed=False)
+        self.reruns += 1
+        self.rerun_started.append(time.time())
+        self.current = {}
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed block as a stage of the current rerun"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.current is not None:
+                self.current[name] = self.current.get(name, 0.0) + time.perf_counter() - started
+
+    def end_rerun(self, completed=True):
+        """Finish the current rerun, update the totals and export it; returns its record"""
+        if self.current is None:
+            return None
+        stages = dict(self.current, rerun=time.perf_counter() - self.started)
+        self.current = None
+        for stage, seconds in stages.items():
+            totals = self.stages.setdefault(stage, [0, 0.0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            totals[3] = seconds
+
+        record = {
+            'time': round(self.rerun_started[-1], 3),
+            'session': self.session_id,
+            'rerun': self.reruns,
+            'completed': completed,
+            'stages': {stage: round(seconds, 6) for stage, seconds in stages.items()},
+        }
+        self.history.append(record)
+        self.registry.record(record)
+        if self.export_path:
+            self.registry.export(self.export_path, record)
+        return record
+
+    def reruns_per_minute(self, window=60.0):
+        """Reruns of this session started in the last `window` seconds, per minute"""
+        since = time.time() - window
+        return sum(1 for started in self.rerun_started if started >= since) * 60.0 / window
+
+    def summary_rows(self):
+        """One row per stage with the last, mean and max time in milliseconds"""
+        return [
+            {
+                'stage': stage,
+                'last_ms': round(last * 1000, 2),
+                'mean_ms': round(total / calls * 1000, 2),
+                'max_ms': round(slowest * 1000, 2),
+                'calls': calls,
+            }
+            for stage, (calls, total, slowest, last) in self.stages.items()
+        ]
+
+    def json_lines(self):
+        """This session's recent reruns as JSON lines"""
+        return ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in self.history)
+
+
+class NullProfiler:
+    """Stand-in used while profiling is off; every call is a no-op"""
+
+    enabled = False
+
+    def begin_rerun(self):
+        pass
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def end_rerun(self, completed=True):
+        return None
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,466 @@
+"""Printable statements of the Sonatrach work-day tracker.
+
+A statement covers one employee for a month or a year: work, vacation and
+sick days, the opening and closing balance under the leave rules, holidays
+worked, the totals of each month, the calendar grid and the periods recorded
+in it, with a verification code and signature lines for HR. Statements are
+written as Excel (openpyxl), printable HTML, or PDF (needs the weasyprint
+package). Statements for a whole crew are built in parallel, and files whose
+data has not changed since the last run are kept:
+
+    python sonatrach_reports.py sonatrach_data.db --year 2024 --format xlsx --output reports/
+"""
+import argparse
+import atexit
+import calendar
+import datetime
+import hashlib
+import html
+import io
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from sonatrach_calendar import DAY_HOLIDAY, DAY_WEEKEND, count_work_on
+from sonatrach_core import DAY_SICK, DAY_VACATION, DAY_WORK, DayRollup, build_day_state, slice_days
+from sonatrach_crew import load_crew
+from sonatrach_rules import DEFAULT_RULES, RulesError, load_rules
+from sonatrach_storage import SqliteStorage
+from sonatrach_views import render_month_table
+
+# Totals of one calendar month of a statement; balance is None for months
+# after the statement's as-of day
+MonthRow = namedtuple('MonthRow', ['month', 'work', 'vacation', 'sick', 'balance'])
+
+# One month of the calendar grid: slice_days() output plus the calendar
+# flags of each day of the month
+CalendarMonth = namedtuple('CalendarMonth', ['month', 'lead', 'types', 'locations', 'flags'])
+
+# Everything printed on a statement for [first, last], counted up to as_of
+Statement = namedtuple('Statement', [
+    'employee', 'first', 'last', 'as_of', 'totals', 'opening_balance', 'closing_balance', 'location_days',
+    'holidays_worked', 'months', 'calendar', 'work_periods', 'sick_periods', 'custom_rules', 'code',
+])
+
+DAY_TYPE_LETTERS = {DAY_WORK: 'ع', DAY_VACATION: 'إ', DAY_SICK: 'م'}
+DAY_TYPE_FILLS = {DAY_WORK: '2E86AB', DAY_VACATION: 'A8D5BA', DAY_SICK: 'F9DC5C'}
+MONTH_NAMES = ('جانفي', 'فيفري', 'مارس', 'أفريل', 'ماي', 'جوان', 'جويلية', 'أوت', 'سبتمبر', 'أكتوبر', 'نوفمبر',
+               'ديسمبر')
+
+STATEMENT_CSS = """
+    @page { size: A4; margin: 1.5cm; }
+    body { font-family: Arial, sans-serif; color: #262730; font-size: 11pt; }
+    h1 { color: #2E86AB; text-align: center; margin-bottom: 0.2rem; }
+    h2 { color: #1a5f7a; border-bottom: 2px solid #2E86AB; padding-bottom: 0.2rem; margin-top: 1.5rem; }
+    table.report { width: 100%; border-collapse: collapse; margin-top: 0.5rem; }
+    table.report th, table.report td { border: 1px solid #ccc; padding: 0.3rem 0.5rem; text-align: center; }
+    table.report th { background: #2E86AB; color: white; }
+    .meta { text-align: center; color: #666; }
+    .months { display: grid; grid-template-columns: repeat(2, 1fr); gap: 0.8rem; font-size: 8pt; }
+    .month-name { text-align: center; font-weight: bold; color: #2E86AB; }
+    .day-w { background-color: #2E86AB; color: white; }
+    .day-v { background-color: #A8D5BA; }
+    .day-s { background-color: #F9DC5C; }
+    .day-weekend { color: #8a4b08; font-style: italic; }
+    .day-holiday { box-shadow: inset 0 0 0 2px #E74C3C; }
+    .day-holiday-worked { background-image: linear-gradient(135deg, #E74C3C 0 8px, transparent 8px); }
+    .signatures { display: flex; justify-content: space-between; margin-top: 2.5rem; }
+    .signatures div { width: 40%; border-top: 1px solid #262730; padding-top: 0.3rem; text-align: center; }
+    .code { font-family: monospace; letter-spacing: 0.1rem; }
+"""
+
+
+class ReportError(Exception):
+    """A report could not be generated, e.g. a missing optional package"""
+
+
+def statement_period(year, month=None):
+    """First and last day of a monthly (month given) or annual statement"""
+    if month:
+        return datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1])
+    return datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+
+def period_label(first, last):
+    """'March 2024'-style label of a statement period, in Arabic"""
+    if first.day == 1 and (last + datetime.timedelta(days=1)).day == 1:
+        if first.month == last.month and first.year == last.year:
+            return f'{MONTH_NAMES[first.month - 1]} {first.year}'
+        if (first.month, last.month, first.year) == (1, 12, last.year):
+            return f'سنة {first.year}'
+    return f'من {first} إلى {last}'
+
+def statement_months(first, last):
+    """(first day, last day) of each calendar month overlapping [first, last]"""
+    months = []
+    year, month = first.year, first.month
+    while datetime.date(year, month, 1) <= last:
+        months.append(statement_period(year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def build_statement(employee, history, first, last, rules=None, today=None):
+    """Compute a Statement of history = (contract_start, initial_balance, work_periods, sick_periods)"""
+    contract_start, initial_balance, work_periods, sick_periods = history
+    rules = rules or DEFAULT_RULES
+    as_of = min(last, today or datetime.date.today())
+    day_state = build_day_state(contract_start, work_periods, sick_periods, as_of) if contract_start else None
+    rollup = DayRollup(day_state, initial_balance, rules)
+
+    months, grid = [], []
+    for month_first, month_last in statement_months(first, last):
+        totals = rollup.totals(month_first, month_last)
+        balance = rollup.balance_at(month_last) if month_first <= as_of else None
+        months.append(MonthRow(month_first, *totals, balance))
+        lead, types, locations = slice_days(day_state, month_first, month_last)
+        grid.append(CalendarMonth(month_first, lead, types, locations, rules.calendar.range_flags(month_first, month_last)))
+
+    totals = rollup.totals(first, last)
+    opening_balance = rollup.balance_at(first - datetime.timedelta(days=1))
+    closing_balance = rollup.balance_at(last)
+    location_days = rollup.location_days(first, last)
+    holidays_worked = count_work_on(day_state, rules.calendar, *rollup.offsets(first, last))
+    work = sorted(period for period in work_periods if period[0] <= last and period[1] >= first)
+    sick = sorted(period for period in sick_periods if period[0] <= last and period[1] >= first)
+
+    # A digest of everything printed, so HR can tell an altered copy from the original
+    digest = hashlib.sha256(repr((
+        employee, first, last, as_of, totals, opening_balance, closing_balance, list(location_days.items()),
+        holidays_worked, months, work, sick, rules.version,
+    )).encode('utf-8')).hexdigest()[:20].upper()
+    code = '-'.join(digest[i:i + 4] for i in range(0, len(digest), 4))
+    return Statement(employee, first, last, as_of, totals, opening_balance, closing_balance, location_days,
+                     holidays_worked, months, grid, work, sick, not rules.is_default, code)
+
+def statement_rows(statement):
+    """(label, value) summary lines shared by the Excel and HTML statements"""
+    total_w, total_v, total_s = statement.totals
+    fixed, movable, weekends = statement.holidays_worked
+    rows = [
+        ('الموظف', statement.employee),
+        ('الفترة', period_label(statement.first, statement.last)),
+        ('محسوب حتى', statement.as_of.isoformat()),
+        ('أيام العمل', total_w),
+        ('أيام الإجازة', total_v),
+        ('أيام مرضية', total_s),
+        ('الرصيد في بداية الفترة', statement.opening_balance),
+        ('الرصيد في نهاية الفترة', statement.closing_balance),
+        ('أيام عطل رسمية عملتها', f'{fixed + movable} (وطنية {fixed}، دينية {movable})'),
+        ('أيام نهاية الأسبوع عملتها', weekends),
+    ]
+    if statement.custom_rules:
+        rows.append(('طريقة الحساب', 'حسب قواعد الرصيد المعتمدة'))
+    return rows
+
+def write_xlsx(statement, fileobj):
+    """Write a statement as an Excel workbook: summary, calendar grid and periods sheets"""
+    from openpyxl import Workbook  # Only needed for Excel statements
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+    bold = Font(bold=True)
+    header_font = Font(bold=True, color='FFFFFF')
+    header_fill = PatternFill('solid', fgColor='2E86AB')
+    center = Alignment(horizontal='center', vertical='center')
+    holiday_side = Side(style='medium', color='E74C3C')
+
+    def header_row(sheet, values):
+        sheet.append(values)
+        for cell in sheet[sheet.max_row]:
+            cell.font, cell.fill, cell.alignment = header_font, header_fill, center
+
+    workbook = Workbook()
+    summary = workbook.active
+    summary.title = 'الكشف'
+    summary.sheet_view.rightToLeft = True
+    summary.append(['كشف أيام العمل والإجازات - سوناطراك'])
+    summary['A1'].font = Font(bold=True, size=14, color='2E86AB')
+    summary.append([])
+    for label, value in statement_rows(statement):
+        summary.append([label, value])
+        summary.cell(summary.max_row, 1).font = bold
+    if statement.location_days:
+        summary.append([])
+        header_row(summary, ['الورشة', 'أيام العمل'])
+        for location, days in statement.location_days.items():
+            summary.append([location, days])
+    summary.append([])
+    header_row(summary, ['الشهر', 'أيام العمل', 'أيام الإجازة', 'أيام مرضية', 'الرصيد في نهاية الشهر'])
+    for row in statement.months:
+        summary.append([f'{MONTH_NAMES[row.month.month - 1]} {row.month.year}', row.work, row.vacation, row.sick,
+                        '-' if row.balance is None else row.balance])
+    summary.append([])
+    summary.append(['رمز التحقق', statement.code])
+    summary.append([])
+    summary.append(['توقيع الموظف', '', 'توقيع مصلحة الموارد البشرية'])
+    summary.cell(summary.max_row, 1).font = bold
+    summary.cell(summary.max_row, 3).font = bold
+    for column, width in zip('ABCDE', (28, 34, 28, 14, 22)):
+        summary.column_dimensions[column].width = width
+
+    # One row per month, one column per day of the month
+    grid = workbook.create_sheet('التقويم')
+    grid.sheet_view.rightToLeft = True
+    header_row(grid, ['الشهر'] + list(range(1, 32)))
+    for month in statement.calendar:
+        grid.append([f'{MONTH_NAMES[month.month.month - 1]} {month.month.year}'])
+        row = grid.max_row
+        for day in range(1, calendar.monthrange(month.month.year, month.month.month)[1] + 1):
+            cell = grid.cell(row, day + 1)
+            cell.alignment = center
+            index = day - 1 - month.lead
+            if 0 <= index < len(month.types):
+                day_type = month.types[index]
+                cell.value = DAY_TYPE_LETTERS[day_type]
+                cell.fill = PatternFill('solid', fgColor=DAY_TYPE_FILLS[day_type])
+                if day_type == DAY_WORK:
+                    cell.font = Font(color='FFFFFF', bold=bool(month.flags[day - 1] & DAY_HOLIDAY))
+            if month.flags[day - 1] & DAY_HOLIDAY:
+                cell.border = Border(left=holiday_side, right=holiday_side, top=holiday_side, bottom=holiday_side)
+            elif month.flags[day - 1] & DAY_WEEKEND and cell.font.color is None:
+                cell.font = Font(italic=True, color='8A4B08')
+    grid.column_dimensions['A'].width = 16
+    grid.append([])
+    grid.append(['ع: عمل، إ: إجازة، م: عطلة مرضية، الإطار الأحمر: عطلة رسمية'])
+
+    periods = workbook.create_sheet('الفترات')
+    periods.sheet_view.rightToLeft = True
+    header_row(periods, ['النوع', 'من', 'إلى', 'عدد الأيام', 'الورشة'])
+    for start, end, location in statement.work_periods:
+        periods.append(['عمل', start, end, (end - start).days + 1, location])
+    for start, end in statement.sick_periods:
+        periods.append(['عطلة مرضية', start, end, (end - start).days + 1, ''])
+    for row in periods.iter_rows(min_row=2, min_col=2, max_col=3):
+        for cell in row:
+            cell.number_format = 'yyyy-mm-dd'
+    for column, width in zip('ABCDE', (14, 14, 14, 12, 24)):
+        periods.column_dimensions[column].width = width
+
+    workbook.save(fileobj)
+
+def render_statement_html(statement):
+    """A self-contained, printable HTML statement, with the app's calendar tables"""
+    escape = html.escape
+    summary = ''.join(f'<tr><th>{escape(label)}</th><td>{escape(str(value))}</td></tr>'
+                      for label, value in statement_rows(statement))
+    locations = ''.join(f'<tr><td>{escape(location)}</td><td>{days}</td></tr>'
+                        for location, days in statement.location_days.items())
+    months = ''.join(
+        f"<tr><td>{MONTH_NAMES[row.month.month - 1]} {row.month.year}</td><td>{row.work}</td>"
+        f"<td>{row.vacation}</td><td>{row.sick}</td><td>{'-' if row.balance is None else row.balance}</td></tr>"
+        for row in statement.months)
+    grid = ''.join(
+        f"<div><div class='month-name'>{MONTH_NAMES[month.month.month - 1]} {month.month.year}</div>"
+        + render_month_table(month.month.year, month.month.month, month.lead, month.types,
+                             [escape(location) for location in month.locations], None, month.flags)
+        + '</div>'
+        for month in statement.calendar)
+    periods = ''.join(
+        f'<tr><td>عمل</td><td>{start}</td><td>{end}</td><td>{(end - start).days + 1}</td><td>{escape(location)}</td></tr>'
+        for start, end, location in statement.work_periods)
+    periods += ''.join(
+        f'<tr><td>عطلة مرضية</td><td>{start}</td><td>{end}</td><td>{(end - start).days + 1}</td><td></td></tr>'
+        for start, end in statement.sick_periods)
+
+    parts = [
+        f"<!DOCTYPE html><html lang='ar' dir='rtl'><head><meta charset='utf-8'>"
+        f"<title>كشف {escape(statement.employee)} - {period_label(statement.first, statement.last)}</title>"
+        f"<style>{STATEMENT_CSS}</style></head><body>",
+        "<h1>⛽ كشف أيام العمل والإجازات - سوناطراك</h1>",
+        f"<p class='meta'>{period_label(statement.first, statement.last)}</p>",
+        f"<table class='report'>{summary}</table>",
+    ]
+    if locations:
+        parts.append(f"<h2>الورشات</h2><table class='report'><tr><th>الورشة</th><th>أيام العمل</th></tr>{locations}</table>")
+    parts += [
+        "<h2>الأشهر</h2><table class='report'><tr><th>الشهر</th><th>أيام العمل</th><th>أيام الإجازة</th>"
+        f"<th>أيام مرضية</th><th>الرصيد في نهاية الشهر</th></tr>{months}</table>",
+        f"<h2>التقويم</h2><div class='months'>{grid}</div>",
+        "<h2>الفترات المسجلة</h2><table class='report'><tr><th>النوع</th><th>من</th><th>إلى</th>"
+        f"<th>عدد الأيام</th><th>الورشة</th></tr>{periods}</table>",
+        f"<p>رمز التحقق: <span class='code'>{statement.code}</span></p>",
+        "<div class='signatures'><div>توقيع الموظف</div><div>توقيع مصلحة الموارد البشرية</div></div>",
+        "</body></html>",
+    ]
+    return ''.join(parts)
+
+def write_html(statement, fileobj):
+    fileobj.write(render_statement_html(statement).encode('utf-8'))
+
+def write_pdf(statement, fileobj):
+    """Write a statement as PDF, laid out from its HTML by weasyprint"""
+    try:
+        from weasyprint import HTML  # Optional: shapes Arabic text and lays out the HTML statement
+    except ImportError:
+        raise ReportError('PDF statements need the weasyprint package (pip install weasyprint); '
+                          'the HTML statement can be printed to PDF from a browser instead') from None
+    HTML(string=render_statement_html(statement)).write_pdf(fileobj)
+
+# format -> (MIME type, writer)
+REPORT_FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', write_xlsx),
+    'pdf': ('application/pdf', write_pdf),
+    'html': ('text/html', write_html),
+}
+
+def generate_report(employee, history, first, last, fmt, rules=None, today=None):
+    """Build a statement and return it as the bytes of a file in format fmt"""
+    buffer = io.BytesIO()
+    REPORT_FORMATS[fmt][1](build_statement(employee, history, first, last, rules, today), buffer)
+    return buffer.getvalue()
+
+def report_key(employee, history, first, last, fmt, rules=None, today=None):
+    """Cache key of a report: it changes whenever anything printed on it could"""
+    as_of = min(last, today or datetime.date.today())
+    return hashlib.sha256(repr((
+        employee, history, first, last, as_of, fmt, (rules or DEFAULT_RULES).version,
+    )).encode('utf-8')).hexdigest()
+
+def report_file_name(employee, first, last, fmt):
+    """File name of a statement, e.g. sonatrach_statement_ahmed_2024-03.xlsx"""
+    if (first, last) == statement_period(first.year, first.month):
+        label = first.strftime('%Y-%m')
+    elif (first, last) == statement_period(first.year):
+        label = str(first.year)
+    else:
+        label = f'{first}_{last}'
+    name = re.sub(r'[^\w.-]', '_', employee)
+    return f'sonatrach_statement_{name}_{label}.{fmt}'
+
+
+class ReportWorker:
+    """Generates reports on background threads and keeps the latest ones
+
+    Jobs are keyed by report_key(), which changes with the data, the rules,
+    the period and the day, so an unchanged report is generated once and a
+    changed one is never served stale. Failed jobs are retried when asked again.
+    """
+
+    def __init__(self, workers=2, keep=32):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sonatrach-report')
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        atexit.register(self.executor.shutdown, wait=False, cancel_futures=True)
+
+    def submit(self, key, *args):
+        """The job generating generate_report(*args), started unless one for key exists"""
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is None or (job.done() and job.exception() is not None):
+                job = self.executor.submit(generate_report, *args)
+                self.jobs[key] = job
+            self.jobs.move_to_end(key)
+            while len(self.jobs) > self.keep:
+                self.jobs.popitem(last=False)
+            return job
+
+    def get(self, key):
+        with self.lock:
+            return self.jobs.get(key)
+
+
+def write_report_file(employee, history, first, last, fmt, rules, today, path):
+    """Generate one report into path; returns an error message or None"""
+    try:
+        data = generate_report(employee, history, first, last, fmt, rules, today)
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except (OSError, ValueError, ReportError) as e:
+        return f'{type(e).__name__}: {e}'
+    return None
+
+def generate_crew_reports(crew, first, last, fmt, output_dir, workers=None, rules=None, today=None):
+    """Write a statement per employee of {employee: history} into output_dir, in a process pool
+
+    output_dir/manifest.json records the report_key() of every file written,
+    so files whose data has not changed are kept. Returns (written, kept,
+    [(employee, error)]).
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / 'manifest.json'
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    jobs, kept = [], 0
+    for employee, history in crew.items():
+        path = output_dir / report_file_name(employee, first, last, fmt)
+        key = report_key(employee, history, first, last, fmt, rules, today)
+        if manifest.get(path.name) == key and path.exists():
+            kept += 1
+            continue
+        jobs.append((employee, history, path, key))
+
+    arguments = [[employee, history, first, last, fmt, rules, today, path] for employee, history, path, _ in jobs]
+    if workers == 1 or len(jobs) < 2:
+        results = [write_report_file(*args) for args in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(write_report_file, *zip(*arguments), chunksize=8))
+
+    errors = []
+    for (employee, _, path, key), error in zip(jobs, results):
+        if error:
+            errors.append((employee, error))
+            manifest.pop(path.name, None)
+        else:
+            manifest[path.name] = key
+    temp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, manifest_path)
+    return len(jobs) - len(errors), kept, errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate Sonatrach tracker statements for a crew')
+    parser.add_argument('source', help='sonatrach_data.db or a folder of data/backup files, one per employee')
+    parser.add_argument('--employee', help='only this employee of a SQLite database')
+    parser.add_argument('--year', type=int, default=datetime.date.today().year, help='statement year (default: this year)')
+    parser.add_argument('--month', type=int, choices=range(1, 13), help='monthly statement for this month of the year')
+    parser.add_argument('--format', dest='fmt', choices=sorted(REPORT_FORMATS), default='xlsx',
+                        help='report format (default: %(default)s)')
+    parser.add_argument('--output', default='reports', help='output folder (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: CPU count)')
+    parser.add_argument('--rules', default='sonatrach_rules.toml', help='leave rules file (default: %(default)s)')
+    parser.add_argument('--as-of', type=datetime.date.fromisoformat, help='count days up to this date (default: today)')
+    args = parser.parse_args(argv)
+
+    try:
+        rules = load_rules(args.rules)
+    except RulesError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.employee and not Path(args.source).is_file():
+        parser.error('--employee needs a SQLite database')
+    first, last = statement_period(args.year, args.month)
+    try:
+        # A statement counts nothing after its last day, so later periods are not read
+        if args.employee:
+            storage = SqliteStorage(args.source, args.employee)
+            if args.employee not in storage.employees():
+                print(f'{args.source}: no employee {args.employee}', file=sys.stderr)
+                return 1
+            crew = {args.employee: storage.load(last)}
+        else:
+            crew = load_crew(args.source, last)
+    except OSError as e:
+        print(e, file=sys.stderr)
+        return 1
+    written, kept, errors = generate_crew_reports(crew, first, last, args.fmt, args.output, args.workers, rules,
+                                                  args.as_of)
+    for employee, error in errors:
+        print(f'  {employee}: {error}', file=sys.stderr)
+    print(f'{len(crew)} employees: {written} reports written, {kept} unchanged, {len(errors)} errors, in {args.output}')
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
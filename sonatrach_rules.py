@@ -0,0 +1,246 @@
+"""Leave-accounting rules of the Sonatrach work-day tracker.
+
+By default a work day earns one day of balance, a vacation day spends one
+and a sick day is neutral. sonatrach_rules.toml, next to config.toml, can
+change that: day-type weights, the weekend and holiday calendar (see
+sonatrach_calendar), and rules that set or scale the weight of days matching
+a date range, locations, holidays, weekends or travel days (the first and
+last day of a stint at one location), e.g.
+
+    [[rules]]
+    name = "Holidays worked count double"
+    holiday = true
+    work = 2
+
+Rules are compiled once into lookup arrays; weighing a day state is then a
+few NumPy operations per rule, whatever its length. Check a rules file with:
+
+    python sonatrach_rules.py sonatrach_rules.toml
+"""
+import argparse
+import datetime
+import fnmatch
+import hashlib
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+from sonatrach_calendar import DAY_HOLIDAY, DAY_WEEKEND, WEEKDAY_NAMES, CalendarError, calendar_from_config
+from sonatrach_core import DAY_SICK, DAY_TYPE_CODES, DAY_VACATION, DAY_WORK, as_days
+
+# Rule and weight keys for each day-type code
+DAY_TYPE_KEYS = {'vacation': DAY_VACATION, 'work': DAY_WORK, 'sick': DAY_SICK}
+DEFAULT_WEIGHTS = {'work': 1, 'vacation': -1, 'sick': 0}
+RULE_KEYS = {'name', 'from', 'to', 'types', 'locations', 'holiday', 'weekend', 'travel', 'multiplier', *DAY_TYPE_KEYS}
+RULES_SECTIONS = {'weights', 'rules', 'weekend', 'hijri_offset', 'holidays'}
+
+# A compiled rule: `types` is a boolean mask over day-type codes, `weights`
+# the weight it sets for each code (NaN keeps the current one), `first` and
+# `last` inclusive day ordinals or None, and `holiday`/`weekend`/`travel` None for any day
+CompiledRule = namedtuple('CompiledRule', [
+    'name', 'types', 'weights', 'multiplier', 'first', 'last', 'patterns', 'holiday', 'weekend', 'travel',
+])
+
+
+class RulesError(ValueError):
+    """The rules file is not valid"""
+
+
+def parse_rule_date(value, field):
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        raise RulesError(f"{field}: invalid date '{value}' (expected YYYY-MM-DD)") from None
+
+def parse_weight(value, field):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RulesError(f"{field}: expected a number, got {value!r}")
+    return float(value)
+
+def compile_rule(entry, index):
+    field = f"rules[{index}]"
+    if not isinstance(entry, dict):
+        raise RulesError(f'{field}: expected a table')
+    unknown = set(entry) - RULE_KEYS
+    if unknown:
+        raise RulesError(f"{field}: unknown keys {', '.join(sorted(unknown))}")
+    name = entry.get('name', f'rule {index + 1}')
+    field = f"rules[{index}] ({name})"
+
+    weights = np.full(len(DAY_TYPE_CODES), np.nan)
+    for key, code in DAY_TYPE_KEYS.items():
+        if key in entry:
+            weights[code] = parse_weight(entry[key], f'{field}.{key}')
+    multiplier = parse_weight(entry.get('multiplier', 1), f'{field}.multiplier')
+
+    # A rule applies to the types it sets a weight for, else to `types`, else to all
+    type_names = entry.get('types')
+    if type_names is None:
+        type_names = [key for key in DAY_TYPE_KEYS if key in entry] or list(DAY_TYPE_KEYS)
+    types = np.zeros(len(DAY_TYPE_CODES), dtype=bool)
+    for type_name in type_names:
+        if type_name not in DAY_TYPE_KEYS:
+            raise RulesError(f"{field}.types: unknown day type '{type_name}' (work, vacation or sick)")
+        types[DAY_TYPE_KEYS[type_name]] = True
+
+    first = parse_rule_date(entry['from'], f'{field}.from').toordinal() if 'from' in entry else None
+    last = parse_rule_date(entry['to'], f'{field}.to').toordinal() if 'to' in entry else None
+    patterns = entry.get('locations')
+    if patterns is not None:
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        patterns = tuple(str(pattern) for pattern in patterns)
+    for flag in ('holiday', 'weekend', 'travel'):
+        if flag in entry and not isinstance(entry[flag], bool):
+            raise RulesError(f'{field}.{flag}: expected true or false')
+    return CompiledRule(name, types, weights, multiplier, first, last, patterns,
+                        entry.get('holiday'), entry.get('weekend'), entry.get('travel'))
+
+
+class LeaveRules:
+    """Compiled leave-accounting rules: the weight of every tracked day in the balance"""
+
+    def __init__(self, config=None):
+        config = config or {}
+        unknown = set(config) - RULES_SECTIONS
+        if unknown:
+            raise RulesError(f"unknown sections {', '.join(sorted(unknown))}")
+        weights = dict(DEFAULT_WEIGHTS, **config.get('weights', {}))
+        if set(weights) - set(DAY_TYPE_KEYS):
+            raise RulesError(f"weights: unknown day types {', '.join(sorted(set(weights) - set(DAY_TYPE_KEYS)))}")
+        self.base = np.zeros(len(DAY_TYPE_CODES))
+        for key, code in DAY_TYPE_KEYS.items():
+            self.base[code] = parse_weight(weights[key], f'weights.{key}')
+        try:
+            self.calendar = calendar_from_config(config)
+        except CalendarError as e:
+            raise RulesError(str(e)) from None
+        self.rules = [compile_rule(entry, index) for index, entry in enumerate(config.get('rules', []))]
+        self.uses_calendar = any(rule.holiday is not None or rule.weekend is not None for rule in self.rules)
+        self.uses_travel = any(rule.travel is not None for rule in self.rules)
+        self.is_default = not self.rules and all(
+            self.base[code] == DEFAULT_WEIGHTS[key] for key, code in DAY_TYPE_KEYS.items())
+        # Cache keys only need to change when the compiled rules do
+        self.version = hashlib.sha1(repr((self.base.tolist(), self.calendar.version, [
+            (rule[:1] + (rule.types.tolist(), rule.weights.tolist()) + rule[3:]) for rule in self.rules
+        ])).encode('utf-8')).hexdigest()[:16]
+        self._location_tables = {}
+
+    def location_table(self, rule, locations):
+        """Boolean mask over location codes matched by a rule's patterns"""
+        key = (rule.patterns, tuple(locations))
+        table = self._location_tables.get(key)
+        if table is None:
+            table = np.array([any(fnmatch.fnmatchcase(location, pattern) for pattern in rule.patterns)
+                              for location in locations], dtype=bool)
+            if len(self._location_tables) > 256:
+                self._location_tables.clear()
+            self._location_tables[key] = table
+        return table
+
+    def evaluate(self, types, location_codes, days, locations, travel=None):
+        """Weight of each day from aligned arrays of day types, location codes and day ordinals"""
+        types = np.asarray(types, dtype=np.int64)
+        weights = self.base[types]
+        if not self.rules or not len(types):
+            return weights
+        flags = self.calendar.flags(days) if self.uses_calendar else None
+        for rule in self.rules:
+            mask = rule.types[types]
+            if rule.first is not None:
+                mask &= days >= rule.first
+            if rule.last is not None:
+                mask &= days <= rule.last
+            if rule.patterns is not None:
+                mask &= self.location_table(rule, locations)[location_codes]
+            if rule.holiday is not None:
+                mask &= ((flags & DAY_HOLIDAY) != 0) == rule.holiday
+            if rule.weekend is not None:
+                mask &= ((flags & DAY_WEEKEND) != 0) == rule.weekend
+            if rule.travel is not None:
+                mask &= (travel if travel is not None else False) == rule.travel
+            if not mask.any():
+                continue
+            set_weights = rule.weights[types[mask]]
+            weights[mask] = np.where(np.isnan(set_weights), weights[mask], set_weights) * rule.multiplier
+        return weights
+
+    def travel_days(self, day_state, lo, hi):
+        """Whether each day of offsets [lo, hi) is the first or last day of a stint at one location
+
+        A stint started on the contract start still has its first day; one
+        running through the last tracked day has no last day yet.
+        """
+        length = len(day_state.types)
+        pad_lo, pad_hi = max(lo - 1, 0), min(hi + 1, length)
+        # The location code on work days, -1 on days off, for offsets lo - 1 to hi
+        stint = np.where(day_state.types[pad_lo:pad_hi] == DAY_WORK, day_state.location_codes[pad_lo:pad_hi], -1)
+        if lo == 0:
+            stint = np.concatenate(([-1], stint))
+        if hi == length:
+            stint = np.concatenate((stint, stint[-1:]))
+        days = stint[1:-1]
+        return (days >= 0) & ((stint[:-2] != days) | (stint[2:] != days))
+
+    def day_weights(self, day_state, lo=0, hi=None):
+        """Weight of each day of offsets [lo, hi) of a day state"""
+        hi = len(day_state.types) if hi is None else hi
+        types = day_state.types[lo:hi]
+        if not self.rules or not len(types):
+            return self.base[types]
+        first = day_state.start.toordinal()
+        days = np.arange(first + lo, first + hi, dtype=np.int64)
+        travel = self.travel_days(day_state, lo, hi) if self.uses_travel else None
+        return self.evaluate(types, day_state.location_codes[lo:hi], days, day_state.locations, travel)
+
+
+DEFAULT_RULES = LeaveRules()
+
+def load_rules(path):
+    """Compile the rules file at path; the default rules if it does not exist"""
+    try:
+        with open(path, 'rb') as f:
+            config = tomllib.load(f)
+    except FileNotFoundError:
+        return DEFAULT_RULES
+    except tomllib.TOMLDecodeError as e:
+        raise RulesError(f'{Path(path).name}: {e}') from None
+    return LeaveRules(config)
+
+def rules_file_version(path):
+    """Cheap change marker for a rules file, None when it does not exist"""
+    try:
+        stat = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check and show Sonatrach tracker leave rules')
+    parser.add_argument('file', nargs='?', default='sonatrach_rules.toml', help='rules file (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    try:
+        rules = load_rules(args.file)
+    except RulesError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"{'default rules' if rules.is_default else 'custom rules'} ({rules.version})")
+    print('weights: ' + ', '.join(f'{key} {as_days(rules.base[code])}' for key, code in DAY_TYPE_KEYS.items()))
+    weekend = ', '.join(sorted(WEEKDAY_NAMES[day] for day in rules.calendar.weekend))
+    print(f'weekend: {weekend}, {len(rules.calendar.holidays)} holidays (list them with sonatrach_calendar.py show)')
+    for rule in rules.rules:
+        print(f'  rule {rule.name}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
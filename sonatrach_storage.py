@@ -0,0 +1,557 @@
+"""Storage backends for the Sonatrach work-day tracker.
+
+JsonStorage keeps one employee in sonatrach_data.json, optionally with an
+append-only change journal. SqliteStorage keeps a whole crew in one SQLite
+database. BackgroundWriter saves either of them off the UI thread. Existing
+JSON files can be imported with:
+
+    python sonatrach_storage.py migrate sonatrach_data.db sonatrach_data.json ...
+"""
+import argparse
+import atexit
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+
+class CorruptDataError(Exception):
+    """The data file could not be parsed and was moved aside to backup_path (None if left in place)"""
+
+    def __init__(self, backup_path, cause):
+        super().__init__(str(cause))
+        self.backup_path = backup_path
+
+
+def serialize_data(contract_start, initial_balance, work_periods, sick_periods):
+    """Convert tracked data to the JSON data file format"""
+    return {
+        'contract_start': contract_start.isoformat() if contract_start else None,
+        'initial_balance': initial_balance,
+        'work_periods': [(start.isoformat(), end.isoformat(), location) for start, end, location in work_periods],
+        'sick_periods': [(start.isoformat(), end.isoformat()) for start, end in sick_periods]
+    }
+
+def parse_work_period(period):
+    """Parse a stored work period, with or without location"""
+    if len(period) == 3:  # With location
+        start_str, end_str, location = period
+    else:  # Old format
+        start_str, end_str = period
+        location = ""
+    return datetime.date.fromisoformat(start_str), datetime.date.fromisoformat(end_str), location
+
+def parse_sick_period(period):
+    """Parse a stored sick period"""
+    start_str, end_str = period
+    return datetime.date.fromisoformat(start_str), datetime.date.fromisoformat(end_str)
+
+def parse_data(data):
+    """Convert the JSON data file format back to tracked data"""
+    # Load contract start date
+    contract_start = None
+    if data.get('contract_start'):
+        contract_start = datetime.date.fromisoformat(data['contract_start'])
+
+    # Load initial balance
+    initial_balance = data.get('initial_balance', 0)
+
+    # Load work and sick periods
+    work_periods = [parse_work_period(period) for period in data.get('work_periods', [])]
+    sick_periods = [parse_sick_period(period) for period in data.get('sick_periods', [])]
+
+    return contract_start, initial_balance, work_periods, sick_periods
+
+def settings_record(contract_start, initial_balance):
+    """Change record for a new contract start or initial balance"""
+    return {'op': 'settings', 'contract_start': contract_start.isoformat() if contract_start else None,
+            'initial_balance': initial_balance}
+
+def period_record(op, period, **extra):
+    """Change record for an added ('add_work', 'add_sick') or deleted ('delete_work', 'delete_sick') period
+
+    Deletions carry the period's index; additions are appended unless they
+    carry one too.
+    """
+    return {'op': op, 'period': [value.isoformat() if isinstance(value, datetime.date) else value for value in period], **extra}
+
+def apply_journal_record(state, record):
+    """Replay one change record onto a [contract_start, initial_balance, work_periods, sick_periods] state"""
+    op = record['op']
+    if op == 'settings':
+        state[0] = datetime.date.fromisoformat(record['contract_start']) if record['contract_start'] else None
+        state[1] = record['initial_balance']
+    elif op in ('add_work', 'add_sick'):
+        periods = state[2] if op == 'add_work' else state[3]
+        period = parse_work_period(record['period']) if op == 'add_work' else parse_sick_period(record['period'])
+        if 'index' in record:  # Undoing a deletion puts the period back where it was
+            periods.insert(record['index'], period)
+        else:
+            periods.append(period)
+    elif op in ('delete_work', 'delete_sick'):
+        periods = state[2] if op == 'delete_work' else state[3]
+        period = parse_work_period(record['period']) if op == 'delete_work' else parse_sick_period(record['period'])
+        index = record['index']
+        if index < len(periods) and periods[index] == period:
+            del periods[index]
+        elif period in periods:
+            periods.remove(period)
+
+def state_until(state, until):
+    """A (contract_start, initial_balance, work_periods, sick_periods) state with only the periods starting by until
+
+    Days up to `until` are resolved from these periods alone, whatever comes later.
+    """
+    contract_start, initial_balance, work_periods, sick_periods = state
+    return (contract_start, initial_balance, [period for period in work_periods if period[0] <= until],
+            [period for period in sick_periods if period[0] <= until])
+
+
+class JsonStorage:
+    """One employee's data in a JSON file, optionally with an append-only journal
+
+    In journal mode every change is appended to the .journal file next to the
+    data file as one fsynced JSON line, and the data file is rewritten as a
+    snapshot only every compact_every changes. Snapshots keep the original
+    single-file format plus the journal_seq they cover.
+    """
+
+    def __init__(self, data_path, journal=False, compact_every=50):
+        self.data_path = Path(data_path)
+        self.journal_path = self.data_path.with_suffix('.journal')
+        self.journal = journal
+        self.compact_every = compact_every
+        self.snapshot_seq = 0
+        self.journal_seq = 0
+
+    def load(self, move_corrupt=True):
+        """Load the data file and replay the journal written since
+
+        A damaged data file is moved aside so the next save does not overwrite
+        it; tools that only read the file pass move_corrupt=False to leave it.
+        """
+        try:
+            with open(self.data_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            state = list(parse_data(data))
+            self.snapshot_seq = data.get('journal_seq', 0)
+        except FileNotFoundError:
+            state = [None, 0, [], []]
+            self.snapshot_seq = 0
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.snapshot_seq = self.journal_seq = 0
+            if not move_corrupt:
+                raise CorruptDataError(None, e) from e
+            # Keep the damaged file for recovery instead of overwriting it on the next save
+            backup_path = self.data_path.with_suffix('.json.corrupt')
+            os.replace(self.data_path, backup_path)
+            raise CorruptDataError(backup_path, e) from e
+
+        self.journal_seq = self.snapshot_seq
+        for record in self.read_journal():
+            if record.get('seq', 0) <= self.snapshot_seq:
+                continue
+            try:
+                apply_journal_record(state, record)
+            except (ValueError, KeyError, TypeError, IndexError):
+                continue
+            self.journal_seq = record['seq']
+
+        return tuple(state)
+
+    def save(self, state, record=None):
+        """Persist state after the change described by record
+
+        Without a record, or outside journal mode, the data file is rewritten.
+        """
+        if self.journal and record is not None:
+            self.journal_seq += 1
+            self.append_journal_record(dict(record, seq=self.journal_seq))
+            if self.journal_seq - self.snapshot_seq < self.compact_every:
+                return
+
+        data = serialize_data(*state)
+        data['journal_seq'] = self.journal_seq
+        self.write_snapshot(data)
+        self.snapshot_seq = self.journal_seq
+
+    def read_journal(self):
+        """Yield the decodable journal records, skipping torn or damaged lines"""
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by a crash mid-append was never confirmed to the user
+                        continue
+        except FileNotFoundError:
+            return
+
+    def append_journal_record(self, record):
+        """Append one record to the journal and fsync it before returning"""
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(self.journal_path, 'ab+') as f:
+            # Start on a fresh line if a previous append was torn
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    line = b'\n' + line
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def write_snapshot(self, data):
+        """Atomically replace the data file and drop the journal it now covers"""
+        temp_path = self.data_path.with_suffix('.json.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.data_path)
+
+        # Records up to journal_seq are in the snapshot and are skipped on replay,
+        # so a crash before this removal cannot apply them twice
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS employees (
+    employee TEXT PRIMARY KEY,
+    contract_start TEXT,
+    initial_balance INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS work_periods (
+    id INTEGER PRIMARY KEY,
+    employee TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    location TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS work_periods_range ON work_periods (employee, start_date, end_date);
+CREATE TABLE IF NOT EXISTS sick_periods (
+    id INTEGER PRIMARY KEY,
+    employee TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sick_periods_range ON sick_periods (employee, start_date, end_date);
+"""
+
+
+class SqliteStorage:
+    """Many employees' data in one SQLite database in WAL mode
+
+    Periods are rows keyed by employee and kept in insertion order (rowid), so
+    the last-added work period still wins where periods overlap. Dates are ISO
+    strings, which sort like the dates themselves, so loads bounded by a day
+    use the (employee, start_date, end_date) indexes.
+    """
+
+    def __init__(self, database_path, employee):
+        self.database_path = Path(database_path)
+        self.employee = employee
+        self.schema_ready = False
+
+    def connect(self):
+        """Open a connection; Streamlit reruns may run on different threads, so none is kept"""
+        conn = sqlite3.connect(self.database_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        if not self.schema_ready:
+            conn.executescript(SQLITE_SCHEMA)
+            self.schema_ready = True
+        return conn
+
+    def load(self, until=None):
+        """Load the employee's settings and periods, only those starting by `until` if given (see state_until)"""
+        bound = '' if until is None else ' AND start_date <= ?'
+        params = (self.employee,) if until is None else (self.employee, until.isoformat())
+        with closing(self.connect()) as conn:
+            row = conn.execute(
+                'SELECT contract_start, initial_balance FROM employees WHERE employee = ?', (self.employee,)
+            ).fetchone()
+            contract_start, initial_balance = row if row else (None, 0)
+            work_periods = [
+                parse_work_period(period) for period in conn.execute(
+                    f'SELECT start_date, end_date, location FROM work_periods WHERE employee = ?{bound} ORDER BY id',
+                    params)
+            ]
+            sick_periods = [
+                parse_sick_period(period) for period in conn.execute(
+                    f'SELECT start_date, end_date FROM sick_periods WHERE employee = ?{bound} ORDER BY id', params)
+            ]
+        if contract_start:
+            contract_start = datetime.date.fromisoformat(contract_start)
+        return contract_start, initial_balance, work_periods, sick_periods
+
+    def load_crew(self, until=None):
+        """Load every employee's data with one query per table, as {employee: state}
+
+        With `until`, only periods starting by then are read, as for load().
+        A whole crew is wanted, so SQLite scans each table once rather than
+        searching the index employee by employee.
+        """
+        bound = '' if until is None else ' WHERE start_date <= ?'
+        params = () if until is None else (until.isoformat(),)
+        with closing(self.connect()) as conn:
+            crew = {
+                employee: (datetime.date.fromisoformat(contract_start) if contract_start else None, initial_balance, [], [])
+                for employee, contract_start, initial_balance in conn.execute(
+                    'SELECT employee, contract_start, initial_balance FROM employees ORDER BY employee')
+            }
+            for employee, *period in conn.execute(
+                    f'SELECT employee, start_date, end_date, location FROM work_periods{bound} ORDER BY id', params):
+                if employee in crew:
+                    crew[employee][2].append(parse_work_period(period))
+            for employee, *period in conn.execute(
+                    f'SELECT employee, start_date, end_date FROM sick_periods{bound} ORDER BY id', params):
+                if employee in crew:
+                    crew[employee][3].append(parse_sick_period(period))
+        return crew
+
+    def employees(self):
+        """List the employees stored in the database"""
+        with closing(self.connect()) as conn:
+            return [employee for employee, in conn.execute('SELECT employee FROM employees ORDER BY employee')]
+
+    def save(self, state, record=None):
+        """Apply the change described by record, or replace the employee's rows with state"""
+        with closing(self.connect()) as conn, conn:
+            if record is None:
+                self.replace_rows(conn, state)
+            elif record['op'] == 'settings':
+                self.save_settings(conn, record['contract_start'], record['initial_balance'])
+            elif record['op'] == 'add_work':
+                start_str, end_str, location = record['period']
+                conn.execute(
+                    'INSERT INTO work_periods (employee, start_date, end_date, location) VALUES (?, ?, ?, ?)',
+                    (self.employee, start_str, end_str, location))
+            elif record['op'] == 'add_sick':
+                start_str, end_str = record['period']
+                conn.execute(
+                    'INSERT INTO sick_periods (employee, start_date, end_date) VALUES (?, ?, ?)',
+                    (self.employee, start_str, end_str))
+            elif record['op'] == 'delete_work':
+                self.delete_period(conn, 'work_periods', record['index'], record['period'])
+            elif record['op'] == 'delete_sick':
+                self.delete_period(conn, 'sick_periods', record['index'], record['period'])
+
+    def add_periods(self, work_periods, sick_periods):
+        """Append many periods in one transaction, e.g. from a schedule import"""
+        data = serialize_data(None, 0, work_periods, sick_periods)
+        with closing(self.connect()) as conn, conn:
+            conn.execute('INSERT OR IGNORE INTO employees (employee) VALUES (?)', (self.employee,))
+            conn.executemany(
+                'INSERT INTO work_periods (employee, start_date, end_date, location) VALUES (?, ?, ?, ?)',
+                [(self.employee, *period) for period in data['work_periods']])
+            conn.executemany(
+                'INSERT INTO sick_periods (employee, start_date, end_date) VALUES (?, ?, ?)',
+                [(self.employee, *period) for period in data['sick_periods']])
+
+    def save_settings(self, conn, contract_start, initial_balance):
+        """Insert or update the employee's settings row"""
+        conn.execute(
+            'INSERT INTO employees (employee, contract_start, initial_balance) VALUES (?, ?, ?) '
+            'ON CONFLICT (employee) DO UPDATE SET '
+            'contract_start = excluded.contract_start, initial_balance = excluded.initial_balance',
+            (self.employee, contract_start, initial_balance))
+
+    def delete_period(self, conn, table, index, period):
+        """Delete the index-th row of a period table, falling back to the first row with the same values"""
+        columns = 'start_date, end_date, location' if table == 'work_periods' else 'start_date, end_date'
+        row = conn.execute(
+            f'SELECT id, {columns} FROM {table} WHERE employee = ? ORDER BY id LIMIT 1 OFFSET ?',
+            (self.employee, index)).fetchone()
+        if row is None or list(row[1:]) != list(period):
+            conditions = ' AND '.join(f'{column} = ?' for column in columns.split(', '))
+            row = conn.execute(
+                f'SELECT id FROM {table} WHERE employee = ? AND {conditions} ORDER BY id LIMIT 1',
+                (self.employee, *period)).fetchone()
+        if row is not None:
+            conn.execute(f'DELETE FROM {table} WHERE id = ?', (row[0],))
+
+    def replace_rows(self, conn, state):
+        """Replace all of the employee's rows with state"""
+        data = serialize_data(*state)
+        self.save_settings(conn, data['contract_start'], data['initial_balance'])
+        conn.execute('DELETE FROM work_periods WHERE employee = ?', (self.employee,))
+        conn.execute('DELETE FROM sick_periods WHERE employee = ?', (self.employee,))
+        conn.executemany(
+            'INSERT INTO work_periods (employee, start_date, end_date, location) VALUES (?, ?, ?, ?)',
+            [(self.employee, *period) for period in data['work_periods']])
+        conn.executemany(
+            'INSERT INTO sick_periods (employee, start_date, end_date) VALUES (?, ?, ?)',
+            [(self.employee, *period) for period in data['sick_periods']])
+
+
+class BackgroundWriter:
+    """Saves storage backends on a background thread, each at most once per interval
+
+    Changes submitted while a save is waiting are coalesced into one write of
+    the latest state. Saves are keyed (one key per data file or employee) so
+    sessions sharing data share the pending write. A failed save is retried
+    after the interval. Pending saves are flushed by close(), which also runs
+    at interpreter exit.
+    """
+
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self.condition = threading.Condition()
+        # key -> [storage, state, change records since the last save]
+        self.pending = {}
+        self.last_write = {}
+        # key -> ('saved', datetime) or ('error', message) for the last save
+        self.status = {}
+        self.writing = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='sonatrach-autosave', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, key, storage, state, record=None):
+        """Queue state for saving; record describes the change, as for storage.save()"""
+        with self.condition:
+            if not self.closed:
+                entry = self.pending.get(key)
+                records = [record] if entry is None else entry[2] + [record]
+                self.pending[key] = [storage, state, records]
+                self.condition.notify_all()
+                return
+        storage.save(state, record)
+
+    def status_of(self, key):
+        """('error', message) until a failed save is retried, else ('pending', changes),
+        ('saved', datetime) or None if never saved"""
+        with self.condition:
+            status = self.status.get(key)
+            if status is not None and status[0] == 'error':
+                return status
+            changes = len(self.pending.get(key, [None, None, []])[2]) + (self.writing == key)
+            if changes:
+                return 'pending', changes
+            return status
+
+    def flush(self, key, timeout=None):
+        """Save the key's pending changes now and wait for them; returns whether they were saved"""
+        with self.condition:
+            self.last_write.pop(key, None)
+            self.condition.notify_all()
+            return self.condition.wait_for(lambda: key not in self.pending and self.writing != key, timeout)
+
+    def close(self, timeout=30):
+        """Save everything pending without waiting for the interval and stop the thread"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+    def next_save(self):
+        """Wait until a save is due and take it; None once closed with nothing pending"""
+        with self.condition:
+            while True:
+                if not self.pending:
+                    if self.closed:
+                        return None
+                    self.condition.wait()
+                    continue
+                key = min(self.pending, key=lambda key: self.last_write.get(key, float('-inf')))
+                delay = self.last_write.get(key, float('-inf')) + self.interval - time.monotonic()
+                if delay > 0 and not self.closed:
+                    self.condition.wait(delay)
+                    continue
+                self.writing = key
+                return key, self.pending.pop(key)
+
+    def run(self):
+        while True:
+            job = self.next_save()
+            if job is None:
+                return
+            key, (storage, state, records) = job
+            try:
+                # A single change is saved as such, coalesced ones as a full write
+                storage.save(state, records[0] if len(records) == 1 else None)
+                status = ('saved', datetime.datetime.now())
+            except Exception as e:
+                status = ('error', str(e))
+            with self.condition:
+                self.writing = None
+                self.last_write[key] = time.monotonic()
+                self.status[key] = status
+                if status[0] == 'error':
+                    if self.closed:
+                        print(f'could not save {key}: {status[1]}', file=sys.stderr)
+                    elif key not in self.pending:
+                        self.pending[key] = [storage, state, [None]]
+                    else:
+                        # Newer changes supersede the failed state; write them in full
+                        self.pending[key][2] = [None, *self.pending[key][2]]
+                self.condition.notify_all()
+
+
+def open_storage(settings, data_path, employee='default'):
+    """Create the storage backend selected by the [storage] config section
+
+    The SQLite database is created next to the JSON data_path.
+    """
+    mode = settings.get('mode', 'file')
+    if mode == 'sqlite':
+        return SqliteStorage(Path(data_path).parent / settings.get('database', 'sonatrach_data.db'), employee)
+    return JsonStorage(
+        data_path,
+        journal=(mode == 'journal'),
+        compact_every=settings.get('compact_every', 50),
+    )
+
+def migrate_json_files(database_path, json_paths, employee=None):
+    """Import data files (and their journals) or full backups into a SQLite database
+
+    Each file becomes one employee named after the file stem unless a single
+    file is given with an explicit employee. Inputs are only read, never
+    moved. Returns the imported names and (path, error) for files that
+    could not be read.
+    """
+    from sonatrach_backup import backup_stem, load_data_file  # sonatrach_backup imports this module
+    imported, errors = [], []
+    for json_path in json_paths:
+        name = employee if employee and len(json_paths) == 1 else backup_stem(json_path)
+        try:
+            state = load_data_file(json_path)
+        except (OSError, ValueError) as e:
+            errors.append((json_path, f'{type(e).__name__}: {e}'))
+            continue
+        SqliteStorage(database_path, name).save(state)
+        imported.append(name)
+    return imported, errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sonatrach tracker storage tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate = commands.add_parser('migrate', help='import data files or full backups into a SQLite database')
+    migrate.add_argument('database', help='SQLite database to create or update')
+    migrate.add_argument('json_files', nargs='+', help='sonatrach_data.json files or backups to import')
+    migrate.add_argument('--employee', help='employee name when importing a single file (default: file name)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'migrate':
+        imported, errors = migrate_json_files(args.database, args.json_files, args.employee)
+        for name in imported:
+            print(f'imported {name}')
+        for path, error in errors:
+            print(f'skipped {path}: {error}', file=sys.stderr)
+        return 1 if errors else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
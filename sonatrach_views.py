@@ -0,0 +1,213 @@
+"""Calendar HTML and analytics charts of the Sonatrach work-day tracker.
+
+Rendering works on the day state and statistics from sonatrach_core without
+Streamlit, so the app can cache the results and benchmarks can time them.
+"""
+import calendar
+import datetime
+
+import numpy as np
+
+from sonatrach_calendar import DAY_FIXED_HOLIDAY, DAY_MOVABLE_HOLIDAY, DAY_WEEKEND
+from sonatrach_core import DAY_SICK, DAY_UNTRACKED, DAY_VACATION, DAY_WORK, balance_trajectory, slice_days
+from sonatrach_profiling import lazy_import
+
+# Precompiled calendar HTML pieces, filled with str.format / joined per render
+CALENDAR_TABLE_OPEN = """
+    <div style='border: 1px solid #e0e0e0; border-radius: 15px; padding: 1rem; background: white; box-shadow: 0 2px 10px rgba(0,0,0,0.1);'>
+    <table style='width: 100%; border-collapse: collapse; text-align: center; font-family: Arial, sans-serif;'>
+        <tr style='background: linear-gradient(135deg, #2E86AB, #1a5f7a); color: white;'>
+            <th style='padding: 0.8rem; border-radius: 8px 0 0 0;'>الأحد</th>
+            <th style='padding: 0.8rem;'>الاثنين</th>
+            <th style='padding: 0.8rem;'>الثلاثاء</th>
+            <th style='padding: 0.8rem;'>الأربعاء</th>
+            <th style='padding: 0.8rem;'>الخميس</th>
+            <th style='padding: 0.8rem;'>الجمعة</th>
+            <th style='padding: 0.8rem; border-radius: 0 8px 0 0;'>السبت</th>
+        </tr>
+    """
+CALENDAR_TABLE_CLOSE = "</table></div>"
+CALENDAR_ROW_OPEN = "<tr style='height: 60px;'>"
+CALENDAR_BLANK_CELL = "<td style='padding: 0.5rem; background-color: #f8f9fa;'></td>"
+CALENDAR_UNTRACKED_CELL = "<td style='padding: 0.5rem; background-color: #f8f9fa;' class='{css_class}' title='{tooltip}'>{day}</td>"
+CALENDAR_DAY_CELL = ("<td style='padding: 0.5rem; position: relative;' class='{css_class}' title='{tooltip}'>"
+                     "<div style='font-weight: bold;'>{day}</div>{label}</td>")
+CALENDAR_LOCATION_LABEL = "<div style='font-size: 0.6rem; margin-top: 2px;'>{location}...</div>"
+CALENDAR_DAY_STYLES = {
+    DAY_WORK: ('day-w', 'يوم عمل'),
+    DAY_VACATION: ('day-v', 'إجازة'),
+    DAY_SICK: ('day-s', 'عطلة مرضية'),
+}
+# Extra class and tooltip of each calendar flag; holidays worked get day-holiday-worked too
+CALENDAR_FLAG_STYLES = (
+    (DAY_WEEKEND, 'day-weekend', 'عطلة نهاية الأسبوع'),
+    (DAY_FIXED_HOLIDAY, 'day-holiday', 'عطلة وطنية'),
+    (DAY_MOVABLE_HOLIDAY, 'day-holiday', 'عطلة دينية'),
+)
+CALENDAR_YEAR_GRID = "<div style='display: grid; grid-template-columns: repeat(3, 1fr); gap: 1rem; font-size: 0.75rem;'>{months}</div>"
+CALENDAR_YEAR_MONTH = "<div><div style='text-align: center; font-weight: bold; color: #2E86AB;'>{month_name}</div>{table}</div>"
+
+def projected_index(first, lead, projected_from):
+    """Index into a slice starting at `first` from which days are projected, or None"""
+    if projected_from is None:
+        return None
+    return projected_from.toordinal() - first.toordinal() - lead
+
+def flag_style(flags):
+    """(css classes, tooltip) of a day's calendar flags, both empty for a plain weekday"""
+    styles = [(css_class, tooltip) for bit, css_class, tooltip in CALENDAR_FLAG_STYLES if flags & bit]
+    return ' '.join(dict.fromkeys(css_class for css_class, _ in styles)), ' - '.join(tooltip for _, tooltip in styles)
+
+# flag_style() of every combination of the three flag bits, looked up per cell
+CALENDAR_FLAG_CELLS = [flag_style(flags) for flags in range(8)]
+
+def render_month_table(year, month, lead, types, locations, projected_start=None, flags=None):
+    """Render one month's calendar table from its slice of day types and locations
+
+    Days from index `projected_start` of the slice on are marked as projected.
+    `flags` holds the calendar flags of the month's days, from its first day,
+    to mark weekends, holidays and holidays worked.
+    """
+    parts = [CALENDAR_TABLE_OPEN]
+    for week in calendar.monthcalendar(year, month):
+        parts.append(CALENDAR_ROW_OPEN)
+        for day in week:
+            index = day - 1 - lead
+            flag_class, flag_tooltip = CALENDAR_FLAG_CELLS[flags[day - 1]] if flags is not None and day else ('', '')
+            if day == 0:
+                parts.append(CALENDAR_BLANK_CELL)
+            elif 0 <= index < len(types) and types[index] != DAY_UNTRACKED:
+                day_type = types[index]
+                location = locations[index]
+                css_class, tooltip = CALENDAR_DAY_STYLES[day_type]
+                if flag_class:
+                    worked = ' day-holiday-worked' if day_type == DAY_WORK and 'day-holiday' in flag_class else ''
+                    css_class = f'{css_class} {flag_class}{worked}'
+                    tooltip = f'{tooltip} - {flag_tooltip}'
+                if projected_start is not None and index >= projected_start:
+                    css_class = f'{css_class} day-projected'
+                    tooltip = f'{tooltip} (متوقع)'
+                label = ''
+                if day_type == DAY_WORK and location:
+                    tooltip = f'{tooltip} - {location}'
+                    label = CALENDAR_LOCATION_LABEL.format(location=location[:8])
+                parts.append(CALENDAR_DAY_CELL.format(css_class=css_class, tooltip=tooltip, day=day, label=label))
+            else:
+                parts.append(CALENDAR_UNTRACKED_CELL.format(css_class=flag_class, tooltip=flag_tooltip, day=day))
+        parts.append("</tr>")
+    parts.append(CALENDAR_TABLE_CLOSE)
+    return ''.join(parts)
+
+def render_year_table(year, day_state, projected_from=None, flags=None):
+    """Render all 12 months of a year from a single slice of the day state and the year's calendar flags"""
+    first = datetime.date(year, 1, 1)
+    lead, types, locations = slice_days(day_state, first, datetime.date(year, 12, 31))
+    projected_start = projected_index(first, lead, projected_from)
+    months = []
+    for month in range(1, 13):
+        # Shift the year slice so index 0 is the first of this month
+        month_offset = datetime.date(year, month, 1).toordinal() - first.toordinal()
+        month_lead = lead - month_offset
+        month_flags = flags[month_offset:] if flags is not None else None
+        table = render_month_table(year, month, month_lead, types, locations, projected_start, month_flags)
+        months.append(CALENDAR_YEAR_MONTH.format(month_name=calendar.month_name[month], table=table))
+    return CALENDAR_YEAR_GRID.format(months=''.join(months))
+
+def create_analytics_charts(total_w, total_v, total_s, location_stats):
+    """Create analytics charts"""
+    px = lazy_import('plotly.express')
+    
+    # Pie chart for day types
+    fig_pie = px.pie(
+        values=[total_w, total_v, total_s],
+        names=['أيام العمل', 'أيام الإجازة', 'أيام مرضية'],
+        title='توزيع أنواع الأيام',
+        color=['أيام العمل', 'أيام الإجازة', 'أيام مرضية'],
+        color_discrete_map={'أيام العمل': '#2E86AB', 'أيام الإجازة': '#A8D5BA', 'أيام مرضية': '#F9DC5C'}
+    )
+    fig_pie.update_layout(title_x=0.5, showlegend=True)
+    
+    # Bar chart for locations
+    if location_stats:
+        fig_bar = px.bar(
+            x=list(location_stats.values()),
+            y=list(location_stats.keys()),
+            orientation='h',
+            title='أيام العمل حسب الورشة',
+            labels={'x': 'عدد الأيام', 'y': 'الورشة'},
+            color=list(location_stats.values()),
+            color_continuous_scale='Viridis'
+        )
+        fig_bar.update_layout(title_x=0.5)
+        
+        return fig_pie, fig_bar
+    
+    return fig_pie, None
+
+def create_monthly_charts(rollup, initial_balance, balances=None):
+    """Create the monthly day-type bars and the cumulative balance line from a monthly rollup
+
+    `balances` are the month-end balances under the leave rules, when they
+    are not the default one day earned per work day and spent per vacation day.
+    """
+    go = lazy_import('plotly.graph_objects')
+    months = [month.strftime('%Y-%m') for month in rollup.months]
+    
+    # Stacked bars of work, vacation and sick days per month
+    fig_months = go.Figure()
+    for code, name, color in ((DAY_WORK, 'أيام العمل', '#2E86AB'), (DAY_VACATION, 'أيام الإجازة', '#A8D5BA'),
+                              (DAY_SICK, 'أيام مرضية', '#F9DC5C')):
+        fig_months.add_trace(go.Bar(x=months, y=rollup.counts[:, code], name=name, marker_color=color))
+    fig_months.update_layout(barmode='stack', title='الأيام حسب الشهر', title_x=0.5,
+                             xaxis_title='الشهر', yaxis_title='عدد الأيام')
+    
+    # Balance at the end of each month
+    balance = balances if balances is not None else (
+        initial_balance + (rollup.counts[:, DAY_WORK] - rollup.counts[:, DAY_VACATION]).cumsum())
+    fig_balance = go.Figure(go.Scatter(x=months, y=balance, mode='lines', line_color='#2E86AB', name='الرصيد'))
+    fig_balance.add_hline(y=0, line_dash='dot', line_color='#999')
+    fig_balance.update_layout(title='تطور الرصيد', title_x=0.5, xaxis_title='الشهر', yaxis_title='الرصيد (يوم)')
+    
+    return fig_months, fig_balance
+
+def create_projection_chart(actual_state, initial_balance, projections, today, history_days=365, rules=None):
+    """Create the balance line of the last `history_days` days with each projected rotation after it"""
+    go = lazy_import('plotly.graph_objects')
+    fig = go.Figure()
+    
+    if actual_state is not None and len(actual_state.types):
+        trajectory = balance_trajectory(actual_state, initial_balance, rules)
+        lo = max(len(trajectory) - history_days, 0)
+        dates = np.datetime64(actual_state.start, 'D') + np.arange(lo, len(trajectory))
+        fig.add_trace(go.Scatter(x=dates, y=trajectory[lo:], mode='lines', name='الرصيد الفعلي',
+                                 line_color='#2E86AB'))
+    
+    for projection in projections:
+        start = projection.day_state.start
+        lo = min(max(today.toordinal() - start.toordinal(), 0), len(projection.trajectory))
+        dates = np.datetime64(start, 'D') + np.arange(lo, len(projection.trajectory))
+        rotation = projection.rotation
+        fig.add_trace(go.Scatter(x=dates, y=projection.trajectory[lo:], mode='lines', line_dash='dash',
+                                 name=f'متوقع {rotation.work_days}/{rotation.off_days}'))
+    fig.add_hline(y=0, line_dash='dot', line_color='#999')
+    fig.update_layout(title='الرصيد الفعلي والمتوقع', title_x=0.5, xaxis_title='التاريخ', yaxis_title='الرصيد (يوم)')
+    return fig
+
+
+def create_crew_charts(occupancy, locations, first, balances):
+    """Create the daily headcount heatmap per location and the crew balance histogram"""
+    go = lazy_import('plotly.graph_objects')
+    dates = np.datetime64(first, 'D') + np.arange(occupancy.shape[1])
+    
+    fig_occupancy = go.Figure(go.Heatmap(z=occupancy, x=dates, y=[location or 'غير محدد' for location in locations],
+                                         colorscale='Blues', colorbar_title='العدد',
+                                         hovertemplate='%{y}<br>%{x}<br>%{z} موظف<extra></extra>'))
+    fig_occupancy.update_layout(title='عدد العمال في كل ورشة يومياً', title_x=0.5, xaxis_title='التاريخ',
+                                height=max(300, 40 * len(locations) + 150))
+    
+    fig_balances = go.Figure(go.Histogram(x=balances, marker_color='#2E86AB', name='الموظفون'))
+    fig_balances.add_vline(x=0, line_dash='dot', line_color='#999')
+    fig_balances.update_layout(title='توزيع أرصدة الطاقم', title_x=0.5, xaxis_title='الرصيد (يوم)',
+                               yaxis_title='عدد الموظفين', bargap=0.05)
+    
+    return fig_occupancy, fig_balances
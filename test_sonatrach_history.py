@@ -0,0 +1,144 @@
+"""Tests of the change records, the audit log and undo/redo"""
+import datetime
+import random
+
+import pytest
+
+from sonatrach_history import ChangeHistory, apply_records, diff_periods, diff_states
+
+START = datetime.date(2024, 1, 1)
+
+
+def work_period(i):
+    first = START + datetime.timedelta(days=28 * i)
+    return first, first + datetime.timedelta(days=13), f'rig {i}'
+
+def sick_period(i):
+    first = START + datetime.timedelta(days=28 * i + 3)
+    return first, first + datetime.timedelta(days=1)
+
+def state_of(work, sick=(), contract_start=START, initial_balance=0):
+    return contract_start, initial_balance, [work_period(i) for i in work], [sick_period(i) for i in sick]
+
+def random_edit(rng, state):
+    """A copy of state with one random edit applied"""
+    contract_start, initial_balance, work_periods, sick_periods = state[0], state[1], list(state[2]), list(state[3])
+    periods = rng.choice((work_periods, sick_periods))
+    make = work_period if periods is work_periods else sick_period
+    action = rng.choice(('append', 'insert', 'delete', 'replace', 'settings'))
+    if action == 'append' or not periods:
+        periods.append(make(rng.randrange(100)))
+    elif action == 'insert':
+        periods.insert(rng.randrange(len(periods) + 1), make(rng.randrange(100)))
+    elif action == 'delete':
+        del periods[rng.randrange(len(periods))]
+    elif action == 'replace':
+        periods[rng.randrange(len(periods))] = make(rng.randrange(100))
+    else:
+        initial_balance += 1
+    return contract_start, initial_balance, work_periods, sick_periods
+
+
+@pytest.mark.parametrize('before, after, count', [
+    ([0, 1, 2], [0, 1, 2, 3], 1),       # Append
+    ([0, 1, 2], [9, 0, 1, 2], 1),       # Insert at the front
+    ([0, 1, 2], [0, 9, 1, 2], 1),       # Insert in the middle
+    ([0, 1, 2], [1, 2], 1),             # Delete the first
+    ([0, 1, 2], [0, 1], 1),             # Delete the last
+    ([0, 1, 2], [0, 9, 2], 2),          # Edit in place
+    ([0, 1, 2, 3], [0, 3], 2),          # Delete a run
+    ([0, 1, 2], [5, 6], 5),             # Replace everything
+    ([0, 1, 1, 2], [0, 1, 2], 1),       # Duplicates
+    ([], [0, 1], 2),
+    ([0, 1], [], 2),
+    ([0, 1, 2], [0, 1, 2], 0),
+])
+def test_diff_periods_round_trip(before, after, count):
+    before = [work_period(i) for i in before]
+    after = [work_period(i) for i in after]
+    records, inverse = diff_periods('work', before, after)
+    assert len(records) == count
+    state = (START, 0, before, [])
+    assert apply_records(state, records) == (START, 0, after, [])
+    assert apply_records(apply_records(state, records), inverse) == state
+
+def test_diff_states_round_trip_random():
+    rng = random.Random(4)
+    state = state_of(range(5), range(3))
+    for _ in range(300):
+        after = random_edit(rng, state)
+        records, inverse = diff_states(state, after)
+        assert apply_records(state, records) == after
+        assert apply_records(after, inverse) == state
+        state = after
+
+
+def record_session(history, rng, steps):
+    """Random edits, undos and redos; returns the state after each version"""
+    state = state_of(range(3))
+    states = {0: state}
+    for _ in range(steps):
+        action = rng.choice(('edit', 'edit', 'undo', 'redo'))
+        if action == 'edit':
+            change = history.record(state, random_edit(rng, state), 'edit')
+        else:
+            change = history.undo() if action == 'undo' else history.redo()
+        if change is not None:
+            state = apply_records(state, change.records)
+            states[change.seq] = state
+    return state, states
+
+def test_reload_with_undo_redo_and_damaged_lines(tmp_path):
+    path = tmp_path / 'data.audit.jsonl'
+    history = ChangeHistory(path)
+    state, _ = record_session(history, random.Random(7), 80)
+    assert any(change.kind == 'undo' for change in history.changes)
+    assert any(change.kind == 'redo' for change in history.changes)
+
+    # A damaged line in the middle and a torn last line
+    lines = path.read_text(encoding='utf-8').splitlines(keepends=True)
+    lines.insert(len(lines) // 2, '{"seq": "garbage\n')
+    path.write_text(''.join(lines) + '{"seq": 999, "kind": "ed', encoding='utf-8')
+
+    def logged(changes):
+        # Times are logged to the second
+        return [(change.seq, change.kind, change.target, change.records, change.inverse) for change in changes]
+    reloaded = ChangeHistory(path)
+    assert logged(reloaded.changes) == logged(history.changes)
+    assert reloaded.undo_stack == history.undo_stack
+    assert reloaded.redo_stack == history.redo_stack
+
+    # The reloaded stacks undo and redo the same changes
+    undo = reloaded.undo()
+    assert undo.target == history.undo_stack[-1]
+    assert apply_records(apply_records(state, undo.records), reloaded.redo().records) == state
+
+def test_undo_of_a_damaged_edit_is_skipped(tmp_path):
+    path = tmp_path / 'data.audit.jsonl'
+    history = ChangeHistory(path)
+    state = state_of(range(2))
+    for i in range(2, 4):
+        after = state_of(range(i + 1))
+        history.record(state, after, f'add {i}')
+        state = after
+    history.undo()
+    lines = path.read_text(encoding='utf-8').splitlines(keepends=True)
+    lines[1] = lines[1][:20] + '\n'  # The undone edit is damaged
+    path.write_text(''.join(lines), encoding='utf-8')
+    reloaded = ChangeHistory(path)
+    # Its undo names a change that is not there, so it is dropped too
+    assert [change.kind for change in reloaded.changes] == ['edit']
+    assert reloaded.undo_stack == [1]
+    assert reloaded.redo_stack == []
+
+def test_state_at_after_undo():
+    history = ChangeHistory()
+    state, states = record_session(history, random.Random(11), 60)
+    for _ in range(3):
+        change = history.undo()
+        if change is not None:
+            state = apply_records(state, change.records)
+            states[change.seq] = state
+    assert history.changes[-1].kind == 'undo'
+    for seq in range(history.version + 1):
+        assert history.state_at(state, seq) == states[seq]
@@ -0,0 +1,111 @@
+"""Crash-safety tests of the JsonStorage journal mode"""
+import datetime
+import json
+import os
+
+import pytest
+
+from sonatrach_storage import JsonStorage, apply_journal_record, period_record, settings_record
+
+START = datetime.date(2024, 1, 1)
+
+
+def work_period(i):
+    first = START + datetime.timedelta(days=28 * i)
+    return first, first + datetime.timedelta(days=13), f'rig {i}'
+
+def make_changes(storage, count, state=None):
+    """Save `count` changes through storage; returns the state they lead to"""
+    state = state or [None, 0, [], []]
+    for _ in range(count):
+        record = settings_record(START, 5) if state[0] is None else period_record('add_work', work_period(len(state[2])))
+        apply_journal_record(state, record)
+        storage.save(tuple(state), record)
+    return state
+
+def journal_lines(storage):
+    with open(storage.journal_path, 'r', encoding='utf-8') as f:
+        return f.read().splitlines()
+
+def snapshot_seq(storage):
+    with open(storage.data_path, 'r', encoding='utf-8') as f:
+        return json.load(f)['journal_seq']
+
+
+def test_torn_final_line_is_skipped(tmp_path):
+    storage = JsonStorage(tmp_path / 'data.json', journal=True, compact_every=50)
+    state = make_changes(storage, 4)
+    # A crash mid-append leaves half a record and no newline
+    with open(storage.journal_path, 'ab') as f:
+        f.write(b'{"op": "add_work", "period": ["2024-')
+
+    reloaded = JsonStorage(storage.data_path, journal=True, compact_every=50)
+    assert reloaded.load() == tuple(state)
+    assert reloaded.journal_seq == 4
+
+    # The next change starts on a fresh line, so neither it nor the torn line is lost or merged
+    state = make_changes(reloaded, 1, state)
+    assert len(journal_lines(reloaded)) == 6
+    assert JsonStorage(storage.data_path, journal=True).load() == tuple(state)
+
+def test_damaged_line_in_the_middle_is_skipped(tmp_path):
+    storage = JsonStorage(tmp_path / 'data.json', journal=True)
+    make_changes(storage, 2)
+    with open(storage.journal_path, 'a', encoding='utf-8') as f:
+        f.write('not json\n')
+    state = make_changes(storage, 2, list(storage.load()))
+    assert JsonStorage(storage.data_path, journal=True).load() == tuple(state)
+
+def test_crash_between_snapshot_and_journal_removal(tmp_path, monkeypatch):
+    storage = JsonStorage(tmp_path / 'data.json', journal=True, compact_every=3)
+    state = make_changes(storage, 2)
+    # The process dies right after os.replace, so the compacted journal stays
+    monkeypatch.setattr(os, 'remove', lambda path: None)
+    state = make_changes(storage, 1, state)
+    monkeypatch.undo()
+    assert snapshot_seq(storage) == 3
+    assert len(journal_lines(storage)) == 3
+
+    # Records 1 to 3 are in the snapshot and are not applied again
+    reloaded = JsonStorage(storage.data_path, journal=True, compact_every=3)
+    assert reloaded.load() == tuple(state)
+    assert reloaded.journal_seq == 3
+
+    # Records after the snapshot are replayed, the stale ones still are not
+    state = make_changes(reloaded, 1, state)
+    assert len(journal_lines(reloaded)) == 4
+    assert JsonStorage(storage.data_path, journal=True).load() == tuple(state)
+
+def test_compaction_at_compact_every(tmp_path):
+    storage = JsonStorage(tmp_path / 'data.json', journal=True, compact_every=3)
+    state = make_changes(storage, 2)
+    assert not storage.data_path.exists()
+    assert len(journal_lines(storage)) == 2
+
+    state = make_changes(storage, 1, state)
+    assert snapshot_seq(storage) == 3
+    assert not storage.journal_path.exists()
+    assert not storage.data_path.with_suffix('.json.tmp').exists()
+    assert JsonStorage(storage.data_path).load() == tuple(state)
+
+    state = make_changes(storage, 5, state)
+    assert snapshot_seq(storage) == 6
+    assert len(journal_lines(storage)) == 2
+    assert JsonStorage(storage.data_path, journal=True).load() == tuple(state)
+
+def test_failed_compaction_keeps_snapshot_and_journal(tmp_path, monkeypatch):
+    storage = JsonStorage(tmp_path / 'data.json', journal=True, compact_every=3)
+    state = make_changes(storage, 3)
+    state = make_changes(storage, 2, state)
+
+    def crash(*args):
+        raise OSError('disk full')
+    monkeypatch.setattr(os, 'replace', crash)
+    with pytest.raises(OSError):
+        make_changes(storage, 1, state)
+    monkeypatch.undo()
+
+    # The old snapshot is intact, and the journal still holds every record
+    # since, including the one fsynced before the compaction failed
+    assert snapshot_seq(storage) == 3
+    assert JsonStorage(storage.data_path, journal=True).load() == tuple(state)